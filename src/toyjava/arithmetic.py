@@ -0,0 +1,159 @@
+"""
+Java int and long arithmetic on Python ints
+
+Every result is wrapped into the two's complement range of its type, so values never grow into big integers.
+The common case of a result already in range is tested first, which is cheaper than wrapping unconditionally.
+The hot functions spell out their limits as literals, which Python loads faster than globals.
+
+https://docs.oracle.com/javase/specs/jls/se13/html/jls-4.html#jls-4.2.2
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-6.html#jvms-6.5.idiv
+"""
+
+import operator as op
+
+INT_MIN = -0x8000_0000
+INT_MAX = 0x7FFF_FFFF
+LONG_MIN = -0x8000_0000_0000_0000
+LONG_MAX = 0x7FFF_FFFF_FFFF_FFFF
+
+
+def wrap_int(value: int) -> int:
+    return ((value + 0x8000_0000) & 0xFFFF_FFFF) - 0x8000_0000
+
+
+def wrap_long(value: int) -> int:
+    return ((value + 0x8000_0000_0000_0000) & 0xFFFF_FFFF_FFFF_FFFF) - 0x8000_0000_0000_0000
+
+
+def iadd(a: int, b: int) -> int:
+    r = a + b
+    return r if -0x8000_0000 <= r <= 0x7FFF_FFFF else ((r + 0x8000_0000) & 0xFFFF_FFFF) - 0x8000_0000
+
+
+def isub(a: int, b: int) -> int:
+    r = a - b
+    return r if -0x8000_0000 <= r <= 0x7FFF_FFFF else ((r + 0x8000_0000) & 0xFFFF_FFFF) - 0x8000_0000
+
+
+def imul(a: int, b: int) -> int:
+    r = a * b
+    return r if -0x8000_0000 <= r <= 0x7FFF_FFFF else ((r + 0x8000_0000) & 0xFFFF_FFFF) - 0x8000_0000
+
+
+def _divide(a: int, b: int) -> int:
+    """
+    Divide rounding toward zero
+    """
+
+    if a >= 0 and b > 0:
+        return a // b
+    if b == 0:
+        raise ZeroDivisionError("/ by zero")
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def _remainder(a: int, b: int) -> int:
+    """
+    The remainder of rounding toward zero, which has the sign of the dividend
+    """
+
+    if a >= 0 and b > 0:
+        return a % b
+    if b == 0:
+        raise ZeroDivisionError("/ by zero")
+    r = abs(a) % abs(b)
+    return -r if a < 0 else r
+
+
+def idiv(a: int, b: int) -> int:
+    # Only INT_MIN / -1 overflows
+    q = _divide(a, b)
+    return q if q <= INT_MAX else INT_MIN
+
+
+irem = _remainder
+
+
+def ineg(a: int) -> int:
+    return -a if a != INT_MIN else INT_MIN
+
+
+def ishl(a: int, b: int) -> int:
+    return wrap_int(a << (b & 0x1F))
+
+
+def ishr(a: int, b: int) -> int:
+    return a >> (b & 0x1F)
+
+
+def iushr(a: int, b: int) -> int:
+    return wrap_int((a & 0xFFFF_FFFF) >> (b & 0x1F))
+
+
+# The bitwise operations of two values in range stay in range
+iand = land = op.and_
+ior = lor = op.or_
+ixor = lxor = op.xor
+
+
+def ladd(a: int, b: int) -> int:
+    r = a + b
+    return r if -0x8000_0000_0000_0000 <= r <= 0x7FFF_FFFF_FFFF_FFFF else wrap_long(r)
+
+
+def lsub(a: int, b: int) -> int:
+    r = a - b
+    return r if -0x8000_0000_0000_0000 <= r <= 0x7FFF_FFFF_FFFF_FFFF else wrap_long(r)
+
+
+def lmul(a: int, b: int) -> int:
+    r = a * b
+    return r if -0x8000_0000_0000_0000 <= r <= 0x7FFF_FFFF_FFFF_FFFF else wrap_long(r)
+
+
+def ldiv(a: int, b: int) -> int:
+    q = _divide(a, b)
+    return q if q <= LONG_MAX else LONG_MIN
+
+
+lrem = _remainder
+
+
+def lneg(a: int) -> int:
+    return -a if a != LONG_MIN else LONG_MIN
+
+
+def lshl(a: int, b: int) -> int:
+    return wrap_long(a << (b & 0x3F))
+
+
+def lshr(a: int, b: int) -> int:
+    return a >> (b & 0x3F)
+
+
+def lushr(a: int, b: int) -> int:
+    return wrap_long((a & 0xFFFF_FFFF_FFFF_FFFF) >> (b & 0x3F))
+
+
+def lcmp(a: int, b: int) -> int:
+    return (a > b) - (a < b)
+
+
+def i2l(a: int) -> int:
+    return a
+
+
+l2i = wrap_int
+
+
+def i2b(a: int) -> int:
+    return ((a + 0x80) & 0xFF) - 0x80
+
+
+def i2c(a: int) -> int:
+    return a & 0xFFFF
+
+
+def i2s(a: int) -> int:
+    return ((a + 0x8000) & 0xFFFF) - 0x8000
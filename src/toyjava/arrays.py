@@ -0,0 +1,67 @@
+"""
+Java arrays
+
+An array of a primitive type is an array.array whose items take as many bytes as in Java,
+so a big int[] costs 4 bytes per element rather than a pointer to a boxed int.
+An array of references is a list.
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-6.html#jvms-6.5.newarray
+"""
+
+from array import array
+
+# atype operand of newarray -> array.array type code
+TYPECODES = {
+    4: "b",  # boolean
+    5: "H",  # char
+    6: "f",  # float
+    7: "d",  # double
+    8: "b",  # byte
+    9: "h",  # short
+    10: "i",  # int
+    11: "q",  # long
+}
+
+
+class ArrayIndexOutOfBoundsError(IndexError):
+    pass
+
+
+class NegativeArraySizeError(ValueError):
+    pass
+
+
+class ArrayStoreError(TypeError):
+    pass
+
+
+def out_of_bounds(index: int, length: int) -> ArrayIndexOutOfBoundsError:
+    return ArrayIndexOutOfBoundsError(f"Index {index} out of bounds for length {length}")
+
+
+def new_array(typecode: str, count: int) -> array:
+    if count < 0:
+        raise NegativeArraySizeError(count)
+    # Repeating a single zero allocates exactly `count` items without building a sequence of Python ints
+    return array(typecode, [0]) * count
+
+
+def new_reference_array(count: int) -> list:
+    if count < 0:
+        raise NegativeArraySizeError(count)
+    return [None] * count
+
+
+def arraycopy(src, src_pos: int, dest, dest_pos: int, length: int):
+    """
+    java.lang.System.arraycopy, which copies a slice in bulk and handles overlapping ranges of the same array
+    """
+
+    if src_pos < 0 or dest_pos < 0 or length < 0 or src_pos + length > len(src) or dest_pos + length > len(dest):
+        raise ArrayIndexOutOfBoundsError(
+            f"arraycopy: {length} elements from {src_pos} of length {len(src)} to {dest_pos} of length {len(dest)}"
+        )
+    if type(src) is not type(dest) or (isinstance(src, array) and src.typecode != dest.typecode):
+        raise ArrayStoreError("arraycopy: type mismatch")
+    # The slice is copied before it is assigned
+    dest[dest_pos:dest_pos + length] = src[src_pos:src_pos + length]
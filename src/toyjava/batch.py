@@ -0,0 +1,146 @@
+"""
+Run many programs in a pool of worker processes
+
+Starting Python and importing toyjava costs more than most small programs take to run,
+so each worker stays up and runs program after program with the modules it has already imported.
+Every program still gets a ClassLoader of its own, because the static fields of a class live on its ClassFile,
+and its own captured output, exit status and timing.
+The results are returned in the order of the programs, whichever finishes first.
+
+run_many_async runs programs concurrently in one process instead, as asyncio tasks (see toyjava.cooperative).
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+from toyjava import cooperative
+from toyjava.cache import ClassCache
+from toyjava.jvm import VirtualMachine, parse_class_lazily
+from toyjava.loader import ClassLoader
+from toyjava.output import CapturedOutput
+
+
+@dataclass
+class ProgramResult:
+    # The .class file or class name that was run
+    program: str
+    stdout: str
+    # 0 if main returned, 1 if it raised an exception
+    status: int
+    # The wall-clock time of loading and running the program
+    seconds: float
+    # The exception that main raised, as "<type>: <message>"
+    error: str | None = None
+
+
+def read_manifest(path) -> list[str]:
+    """
+    Read the programs listed in a manifest, one per line
+
+    Blank lines and lines starting with # are ignored. Relative paths are relative to the directory of the manifest.
+    """
+
+    path = Path(path)
+    programs = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.endswith(".class"):
+            line = str(path.parent / line)
+        programs.append(line)
+    return programs
+
+
+def _main_class(vm: VirtualMachine, program: str, cache: ClassCache | None):
+    if program.endswith(".class"):
+        buffer = Path(program).read_bytes()
+        return parse_class_lazily(buffer) if cache is None else cache.load(buffer)
+    return vm.loader.load(program.replace(".", "/"))
+
+
+def _failed(program: str, output: CapturedOutput, start: float, e: Exception) -> ProgramResult:
+    return ProgramResult(program, output.getvalue(), 1, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def run_program(program: str, classpath=(), engine: str = "dispatch", cache_dir=None) -> ProgramResult:
+    """
+    Run the main method of a .class file or of a class on the classpath, capturing its output
+    """
+
+    cache = ClassCache(cache_dir) if cache_dir else None
+    loader = ClassLoader(classpath) if cache is None else ClassLoader(classpath, parse=cache.load)
+    output = CapturedOutput()
+    start = time.perf_counter()
+    try:
+        vm = VirtualMachine(engine, output=output, loader=loader)
+        vm.execute_main(_main_class(vm, program, cache))
+    except Exception as e:
+        return _failed(program, output, start, e)
+    return ProgramResult(program, output.getvalue(), 0, time.perf_counter() - start)
+
+
+async def run_program_async(program: str, classpath=(), slice_size: int = cooperative.SLICE_SIZE,
+                            max_instructions: int | None = None, timeout: float | None = None,
+                            cache_dir=None) -> ProgramResult:
+    """
+    Run a program like run_program, as a coroutine with the budgets of VirtualMachine.execute_main_async
+
+    A program that exceeds a budget fails like one that raises.
+    """
+
+    cache = ClassCache(cache_dir) if cache_dir else None
+    loader = ClassLoader(classpath) if cache is None else ClassLoader(classpath, parse=cache.load)
+    output = CapturedOutput()
+    start = time.perf_counter()
+    try:
+        vm = VirtualMachine(output=output, loader=loader)
+        await vm.execute_main_async(_main_class(vm, program, cache), slice_size, max_instructions, timeout)
+    except Exception as e:
+        return _failed(program, output, start, e)
+    return ProgramResult(program, output.getvalue(), 0, time.perf_counter() - start)
+
+
+def run_many(programs, classpath=(), engine: str = "dispatch", jobs: int | None = None,
+             cache_dir=None) -> list[ProgramResult]:
+    """
+    Run programs in `jobs` worker processes (default: one per CPU) and return their results in order
+
+    With a single job, the programs run one after another in this process.
+    """
+
+    programs = [str(program) for program in programs]
+    run = partial(run_program, classpath=tuple(classpath), engine=engine, cache_dir=cache_dir)
+    jobs = min(jobs or os.cpu_count() or 1, len(programs))
+    if jobs <= 1:
+        return [run(program) for program in programs]
+    # Chunks amortize the round trips to the workers while leaving a few chunks per worker to balance the load
+    chunksize = max(1, len(programs) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(run, programs, chunksize=chunksize))
+
+
+async def run_many_async(programs, classpath=(), slice_size: int = cooperative.SLICE_SIZE,
+                         max_instructions: int | None = None, timeout: float | None = None,
+                         concurrency: int | None = None, cache_dir=None) -> list[ProgramResult]:
+    """
+    Run programs concurrently in the running event loop and return their results in order
+
+    At most `concurrency` programs run at a time (default: all of them), taking turns of `slice_size` instructions.
+    The budgets apply to each program.
+    """
+
+    semaphore = None if concurrency is None else asyncio.Semaphore(concurrency)
+
+    async def run(program):
+        if semaphore is None:
+            return await run_program_async(program, classpath, slice_size, max_instructions, timeout, cache_dir)
+        async with semaphore:
+            return await run_program_async(program, classpath, slice_size, max_instructions, timeout, cache_dir)
+
+    return list(await asyncio.gather(*(run(str(program)) for program in programs)))
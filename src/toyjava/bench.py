@@ -0,0 +1,500 @@
+"""
+Benchmarks of toyjava
+
+    python -m toyjava.bench [--engine ENGINE ...] [--output FILE] [--baseline FILE]
+    python -m toyjava.bench --synthetic-parse [--methods N] [--code-length N]
+    python -m toyjava.bench --representations [--scale S]
+
+The suite runs the programs in data/ and heavier workloads assembled here,
+and times parsing, decoding and execution of each separately.
+The results can be written as JSON and compared with those of an earlier run.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from functools import partial
+from io import StringIO
+from pathlib import Path
+
+from toyjava import __version__, compact
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.instructions import parse_instructions
+from toyjava.jvm import parse_class_file, parse_class_buffer, parse_class_lazily, VirtualMachine
+from toyjava.output import BufferedOutput
+
+MAIN = ("main", "([Ljava/lang/String;)V")
+# A phase is a regression if it is this much slower than in the baseline
+DEFAULT_THRESHOLD = 0.10
+
+
+def synthetic_class(methods: int, code_length: int) -> bytes:
+    """
+    Build a class with many methods, each of which prints its own string constants
+    """
+
+    writer = ClassWriter("Synthetic")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println = constant_pool.methodref("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+    for i in range(methods):
+        code = bytearray()
+        j = 0
+        # getstatic, ldc_w, invokevirtual
+        while len(code) + 9 + 1 <= code_length:
+            string = constant_pool.string(f"method {i} line {j % 8}")
+            code += bytes([0xB2]) + out.to_bytes(2, "big")
+            code += bytes([0x13]) + string.to_bytes(2, "big")
+            code += bytes([0xB6]) + println.to_bytes(2, "big")
+            j += 1
+        # return
+        code += b"\xb1"
+        writer.add_method(f"method{i}", "()V", bytes(code))
+    return writer.to_bytes()
+
+
+def bench_parse(methods: int, code_length: int, number: int):
+    class_file = synthetic_class(methods, code_length)
+    print(f"Synthetic class: {methods} methods, {code_length} bytes of code each, {len(class_file)} bytes")
+    for parse in [parse_class_file, parse_class_buffer, parse_class_lazily]:
+        seconds = min(timeit.repeat(partial(parse, class_file), number=number, repeat=5)) / number
+        print(f"{parse.__name__:20} {seconds * 1000:8.2f} ms")
+
+
+def _print_int(writer: ClassWriter, assembler: Assembler, load: str, descriptor: str = "(I)V"):
+    constant_pool = writer.constant_pool
+    assembler.emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+    assembler.emit(load)
+    assembler.emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", descriptor))
+
+
+def fib_class(n: int) -> bytes:
+    """
+    Print fib(n) computed by naive recursion
+    """
+
+    writer = ClassWriter("Fib")
+    fib = writer.constant_pool.methodref("Fib", "fib", "(I)I")
+    recurse = Label()
+    code = (
+        Assembler()
+        .emit("iload_0").emit("iconst_2").emit("if_icmpge", recurse)
+        .emit("iload_0").emit("ireturn")
+        .place(recurse)
+        .emit("iload_0").emit("iconst_1").emit("isub").emit("invokestatic", fib)
+        .emit("iload_0").emit("iconst_2").emit("isub").emit("invokestatic", fib)
+        .emit("iadd").emit("ireturn")
+    )
+    writer.add_method("fib", "(I)I", code.to_bytes(), max_stack=3, max_locals=1)
+
+    main = Assembler().emit("sipush", n).emit("invokestatic", fib).emit("istore_1")
+    _print_int(writer, main, "iload_1")
+    writer.add_method(*MAIN, main.emit("return").to_bytes())
+    return writer.to_bytes()
+
+
+def nested_loops_class(n: int) -> bytes:
+    """
+    Print the sum of i * j % 7 for 0 <= i, j < n
+    """
+
+    writer = ClassWriter("NestedLoops")
+    outer, inner, next_i, done = Label(), Label(), Label(), Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("istore_3")
+        .emit("iconst_0").emit("istore_1")
+        .place(outer)
+        .emit("iload_1").emit("sipush", n).emit("if_icmpge", done)
+        .emit("iconst_0").emit("istore_2")
+        .place(inner)
+        .emit("iload_2").emit("sipush", n).emit("if_icmpge", next_i)
+        .emit("iload_3").emit("iload_1").emit("iload_2").emit("imul").emit("bipush", 7).emit("irem").emit("iadd")
+        .emit("istore_3")
+        .emit("iinc", 2, 1).emit("goto", inner)
+        .place(next_i)
+        .emit("iinc", 1, 1).emit("goto", outer)
+        .place(done)
+    )
+    _print_int(writer, main, "iload_3")
+    writer.add_method(*MAIN, main.emit("return").to_bytes())
+    return writer.to_bytes()
+
+
+def primes_class(n: int) -> bytes:
+    """
+    Print the number of primes below n, found by trial division
+    """
+
+    writer = ClassWriter("Primes")
+    loop, test, prime, next_i, done = Label(), Label(), Label(), Label(), Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("istore_3")
+        .emit("iconst_2").emit("istore_1")
+        .place(loop)
+        .emit("iload_1").emit("sipush", n).emit("if_icmpge", done)
+        .emit("iconst_2").emit("istore_2")
+        .place(test)
+        .emit("iload_2").emit("iload_2").emit("imul").emit("iload_1").emit("if_icmpgt", prime)
+        .emit("iload_1").emit("iload_2").emit("irem").emit("ifeq", next_i)
+        .emit("iinc", 2, 1).emit("goto", test)
+        .place(prime)
+        .emit("iinc", 3, 1)
+        .place(next_i)
+        .emit("iinc", 1, 1).emit("goto", loop)
+        .place(done)
+    )
+    _print_int(writer, main, "iload_3")
+    writer.add_method(*MAIN, main.emit("return").to_bytes())
+    return writer.to_bytes()
+
+
+def hash_class(n: int) -> bytes:
+    """
+    Print the int hash h = 31 * h + i over 0 <= i < n, which overflows on every iteration after the first few
+    """
+
+    writer = ClassWriter("Hash")
+    loop, done = Label(), Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("istore_1")
+        .emit("iconst_0").emit("istore_2")
+        .place(loop)
+        .emit("iload_2").emit("ldc_w", writer.constant_pool.integer(n)).emit("if_icmpge", done)
+        .emit("iload_1").emit("bipush", 31).emit("imul").emit("iload_2").emit("iadd").emit("istore_1")
+        .emit("iinc", 2, 1).emit("goto", loop)
+        .place(done)
+    )
+    _print_int(writer, main, "iload_1")
+    writer.add_method(*MAIN, main.emit("return").to_bytes(), max_stack=3, max_locals=3)
+    return writer.to_bytes()
+
+
+def lcg_class(n: int) -> bytes:
+    """
+    Print the n-th long of the linear congruential generator x = 6364136223846793005 * x + 1442695040888963407
+    """
+
+    writer = ClassWriter("Lcg")
+    constant_pool = writer.constant_pool
+    loop, done = Label(), Label()
+    main = (
+        Assembler()
+        .emit("lconst_1").emit("lstore_1")
+        .emit("iconst_0").emit("istore_3")
+        .place(loop)
+        .emit("iload_3").emit("ldc_w", constant_pool.integer(n)).emit("if_icmpge", done)
+        .emit("lload_1").emit("ldc2_w", constant_pool.long(6364136223846793005)).emit("lmul")
+        .emit("ldc2_w", constant_pool.long(1442695040888963407)).emit("ladd").emit("lstore_1")
+        .emit("iinc", 3, 1).emit("goto", loop)
+        .place(done)
+    )
+    _print_int(writer, main, "lload_1", "(J)V")
+    writer.add_method(*MAIN, main.emit("return").to_bytes(), max_stack=4, max_locals=4)
+    return writer.to_bytes()
+
+
+def sieve_class(n: int) -> bytes:
+    """
+    Print the number of primes below n, found by the sieve of Eratosthenes on a boolean[n]
+    """
+
+    writer = ClassWriter("Sieve")
+    size = writer.constant_pool.integer(n)
+    loop, mark, next_i, done = Label(), Label(), Label(), Label()
+    main = (
+        Assembler()
+        .emit("ldc_w", size).emit("newarray", 4).emit("astore_1")
+        .emit("iconst_0").emit("istore_2")
+        .emit("iconst_2").emit("istore_3")
+        .place(loop)
+        .emit("iload_3").emit("ldc_w", size).emit("if_icmpge", done)
+        .emit("aload_1").emit("iload_3").emit("baload").emit("ifne", next_i)
+        .emit("iinc", 2, 1)
+        .emit("iload_3").emit("iload_3").emit("iadd").emit("istore", 4)
+        .place(mark)
+        .emit("iload", 4).emit("ldc_w", size).emit("if_icmpge", next_i)
+        .emit("aload_1").emit("iload", 4).emit("iconst_1").emit("bastore")
+        .emit("iload", 4).emit("iload_3").emit("iadd").emit("istore", 4)
+        .emit("goto", mark)
+        .place(next_i)
+        .emit("iinc", 3, 1).emit("goto", loop)
+        .place(done)
+    )
+    _print_int(writer, main, "iload_2")
+    writer.add_method(*MAIN, main.emit("return").to_bytes(), max_stack=3, max_locals=5)
+    return writer.to_bytes()
+
+
+def strings_class(n: int) -> bytes:
+    """
+    Print a string constant n times
+    """
+
+    writer = ClassWriter("Strings")
+    constant_pool = writer.constant_pool
+    loop, done = Label(), Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("istore_1")
+        .place(loop)
+        .emit("iload_1").emit("sipush", n).emit("if_icmpge", done)
+        .emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        .emit("ldc", constant_pool.string("Hello, world"))
+        .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(Ljava/lang/String;)V"))
+        .emit("iinc", 1, 1).emit("goto", loop)
+        .place(done)
+        .emit("return")
+    )
+    writer.add_method(*MAIN, main.to_bytes())
+    return writer.to_bytes()
+
+
+def concat_class(n: int) -> bytes:
+    """
+    Print "Fizz" + i + "!" for i < n, which javac compiles into an invokedynamic string concatenation
+    """
+
+    writer = ClassWriter("Concat")
+    constant_pool = writer.constant_pool
+    loop, done = Label(), Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("istore_1")
+        .place(loop)
+        .emit("iload_1").emit("sipush", n).emit("if_icmpge", done)
+        .emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        .emit("iload_1")
+        .emit("invokedynamic", writer.make_concat_with_constants("Fizz\1!", "(I)Ljava/lang/String;"), 0, 0)
+        .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(Ljava/lang/String;)V"))
+        .emit("iinc", 1, 1).emit("goto", loop)
+        .place(done)
+        .emit("return")
+    )
+    writer.add_method(*MAIN, main.to_bytes())
+    return writer.to_bytes()
+
+
+# name -> (function building the class file from a size, default size)
+WORKLOADS = {
+    "fib": (fib_class, 20),
+    "nested_loops": (nested_loops_class, 200),
+    "primes": (primes_class, 20000),
+    "sieve": (sieve_class, 50000),
+    "strings": (strings_class, 20000),
+    "concat": (concat_class, 20000),
+    "hash": (hash_class, 100000),
+    "lcg": (lcg_class, 100000),
+}
+
+
+def workloads(data: Path | None, scale: float = 1.0) -> dict[str, bytes]:
+    """
+    The class files of the suite by name: the programs in `data` and then the assembled workloads
+    """
+
+    classes = {}
+    if data is not None:
+        for path in sorted(data.glob("*.class")):
+            classes[path.stem] = path.read_bytes()
+    for name, (build, size) in WORKLOADS.items():
+        classes[name] = build(max(1, int(size * scale)))
+    return classes
+
+
+def count_instructions(class_file: bytes) -> int:
+    """
+    Run the main method with the profiler and return how many instructions it executes
+    """
+
+    return _vm().profile_main(parse_class_file(class_file)).instructions
+
+
+def _vm(engine: str = "dispatch", optimize: bool = True) -> VirtualMachine:
+    # Memoizing would skip most of the calls that fib measures
+    output = BufferedOutput(StringIO(), flush_on_exit=False)
+    return VirtualMachine(engine, output=output, optimize=optimize, memoize=False)
+
+
+def _best(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _decode_methods(cls, engine: str):
+    # The compact engine runs code encoded by toyjava.compact rather than decoded instructions
+    decode = compact.encode if engine == "compact" else parse_instructions
+    for m in cls.methods:
+        decode(m.code)
+
+
+def _execution_times(class_file: bytes, engine: str, repeat: int, optimize: bool = True) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        # A fresh class for each run, so the JIT starts cold every time
+        cls = parse_class_file(class_file)
+        for entry in cls.method_table:
+            if engine == "compact":
+                entry.compact = compact.encode(entry.method.code)
+            else:
+                entry.instructions = parse_instructions(entry.method.code)
+        vm = _vm(engine, optimize)
+        start = time.perf_counter()
+        vm.execute_main(cls)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def measure(class_file: bytes, engine: str, repeat: int, instructions: int) -> dict:
+    """
+    Time each phase of running a class file, taking the best of `repeat` runs
+    """
+
+    cls = parse_class_file(class_file)
+    parse = _best(partial(parse_class_file, class_file), repeat)
+    decode = _best(partial(_decode_methods, cls, engine), repeat)
+    times = _execution_times(class_file, engine, repeat)
+    execute = min(times)
+    return {
+        "parse": parse,
+        "decode": decode,
+        "execute": execute,
+        "execute_median": statistics.median(times),
+        "instructions": instructions,
+        "instructions_per_second": instructions / execute if execute else None,
+    }
+
+
+def run_suite(classes: dict[str, bytes], engines: list[str], repeat: int) -> dict:
+    results = {}
+    for name, class_file in classes.items():
+        instructions = count_instructions(class_file)
+        for engine in engines:
+            try:
+                result = measure(class_file, engine, repeat, instructions)
+            except NotImplementedError as e:
+                print(f"{engine:10} {name:16} skipped: {e!r}", file=sys.stderr)
+                continue
+            results.setdefault(engine, {})[name] = result
+            print(
+                f"{engine:10} {name:16} parse {result['parse'] * 1000:8.3f} ms"
+                f"  decode {result['decode'] * 1000:8.3f} ms"
+                f"  execute {result['execute'] * 1000:10.3f} ms"
+                f"  {result['instructions_per_second'] or 0:12,.0f} instructions/s"
+            )
+    return {
+        "toyjava": __version__,
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_representations(class_file: bytes, repeat: int) -> dict:
+    """
+    Compare the methods of a class decoded into tuples of instruction objects with their encoding by toyjava.compact:
+    the bytes they hold, the time to produce them and the time to run the main method on them.
+    The instruction objects are run by the dispatch engine without peephole optimization,
+    which runs the same instructions with the same handler-per-instruction design as the compact engine.
+    """
+
+    cls = parse_class_file(class_file)
+    codes = [m.code for m in cls.methods]
+    return {
+        "instructions": sum(len(parse_instructions(code)) for code in codes),
+        "objects_bytes": sum(compact.size_of_instructions(parse_instructions(code)) for code in codes),
+        "compact_bytes": sum(compact.encode(code).size() for code in codes),
+        "objects_decode": _best(partial(_decode_methods, cls, "dispatch"), repeat),
+        "compact_decode": _best(partial(_decode_methods, cls, "compact"), repeat),
+        "objects_execute": min(_execution_times(class_file, "dispatch", repeat, optimize=False)),
+        "compact_execute": min(_execution_times(class_file, "compact", repeat)),
+    }
+
+
+def bench_representations(classes: dict[str, bytes], repeat: int) -> dict:
+    results = {}
+    for name, class_file in classes.items():
+        try:
+            result = results[name] = compare_representations(class_file, repeat)
+        except NotImplementedError as e:
+            print(f"{name:16} skipped: {e!r}", file=sys.stderr)
+            continue
+        print(
+            f"{name:16} {result['instructions']:6} instructions"
+            f"  {result['objects_bytes']:9,} -> {result['compact_bytes']:7,} bytes"
+            f"  decode {result['objects_decode'] * 1000:7.3f} -> {result['compact_decode'] * 1000:7.3f} ms"
+            f"  execute {result['objects_execute'] * 1000:9.3f} -> {result['compact_execute'] * 1000:9.3f} ms"
+        )
+    objects_bytes = sum(result["objects_bytes"] for result in results.values())
+    compact_bytes = sum(result["compact_bytes"] for result in results.values())
+    print(f"{'total':16} {objects_bytes:,} -> {compact_bytes:,} bytes ({compact_bytes / objects_bytes:.0%})")
+    return results
+
+
+def compare(report: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Return the phases that got slower than in `baseline` by more than `threshold`, as printable lines
+    """
+
+    regressions = []
+    for engine, results in report["results"].items():
+        for name, result in results.items():
+            before = baseline["results"].get(engine, {}).get(name)
+            if before is None:
+                continue
+            for phase in ["parse", "decode", "execute"]:
+                if before[phase] and result[phase] > before[phase] * (1 + threshold):
+                    ratio = result[phase] / before[phase]
+                    regressions.append(f"{engine} {name} {phase}: {ratio:.2f}x the baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m toyjava.bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", action="append", choices=["dispatch", "loop", "closure", "compact", "jit"],
+                        help="may be repeated (default: dispatch)")
+    parser.add_argument("--data", type=Path, default=Path("data"), help="directory of class files to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the size of the assembled workloads")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="compare with the JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--synthetic-parse", action="store_true", help="compare the parsers on a synthetic class")
+    parser.add_argument("--methods", type=int, default=2000)
+    parser.add_argument("--code-length", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=3)
+    parser.add_argument("--representations", action="store_true",
+                        help="compare instruction objects with the compact encoding")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_parse:
+        bench_parse(args.methods, args.code_length, args.number)
+        return 0
+
+    data = args.data if args.data.is_dir() else None
+    if args.representations:
+        bench_representations(workloads(data, args.scale), args.repeat)
+        return 0
+    report = run_suite(workloads(data, args.scale), args.engine or ["dispatch"], args.repeat)
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.baseline is not None:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold)
+        for line in regressions:
+            print(f"Regression: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
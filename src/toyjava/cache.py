@@ -0,0 +1,206 @@
+"""
+An on-disk cache of parsed classes and their decoded instructions
+
+Each entry is named after the SHA-256 of the class file and holds a pickle after a plain header line.
+The header stamps it with the toyjava version, the cache format and a digest of how instructions are decoded,
+and entries with a different header are stale.
+The header is checked before anything is unpickled, and the pickle may only refer to the types and functions
+that a parsed class consists of (see `_Unpickler`), so an entry cannot run arbitrary code.
+Any entry that fails to load is a miss.
+
+Pickling the instructions themselves would store the fields of every instruction by name,
+so the distinct instructions of a class are stored once as (type, *fields) rows
+and the code of each method as an array of row numbers.
+"""
+
+import dataclasses
+import hashlib
+import logging
+import os
+import pickle
+from array import array
+from pathlib import Path
+
+from toyjava import __version__, arithmetic, constants, instructions
+from toyjava.arrays import TYPECODES
+from toyjava.constants import ConstantPool
+from toyjava.jvm import BootstrapMethod, ClassFile, Field, Method, parse_class_buffer
+
+logger = logging.getLogger(__name__)
+
+# Increment when the pickled payload changes shape
+FORMAT = 7
+
+
+def _describe(value) -> str:
+    # Functions are pickled by name, so what identifies them is their name
+    if callable(value) and hasattr(value, "__qualname__"):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+def decoding_digest() -> str:
+    """
+    A digest of the fields of each instruction class and of the instruction that each opcode decodes into,
+    with the functions it refers to, so that cached instructions are stale once decoding changes
+    """
+
+    lines = []
+    for name, value in sorted(vars(instructions).items()):
+        if isinstance(value, type) and dataclasses.is_dataclass(value):
+            lines.append(f"{name}({', '.join(field.name for field in dataclasses.fields(value))})")
+    for code, opcode in enumerate(instructions.OPCODES):
+        if opcode is None or opcode.operands is None:
+            continue
+        # Decode the opcode with each of its operands 1
+        count = len(opcode.operands.unpack(bytes(opcode.operands.size)))
+        instruction = opcode.factory(*[1] * count)
+        fields = ", ".join(_describe(field) for field in vars(instruction).values())
+        lines.append(f"{code} {opcode.mnemonic} {opcode.operands.format} {type(instruction).__name__}({fields})")
+    lines.append(repr(sorted(TYPECODES.items())))
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+DECODING = decoding_digest()
+
+SUFFIX = ".toyjava"
+MAGIC = b"toyjava-cache"
+
+
+def _dataclasses(module) -> set[str]:
+    return {name for name, value in vars(module).items() if isinstance(value, type) and dataclasses.is_dataclass(value)}
+
+
+# The globals that a pickled class may refer to: module -> names
+ALLOWED = {
+    "toyjava.instructions": _dataclasses(instructions),
+    "toyjava.constants": _dataclasses(constants),
+    "toyjava.jvm": {BootstrapMethod.__name__, Field.__name__},
+    "toyjava.arithmetic": {
+        name for name, value in vars(arithmetic).items()
+        if callable(value) and getattr(value, "__module__", None) == arithmetic.__name__
+    },
+    # The predicates of the branch instructions
+    "_operator": {"eq", "ne", "lt", "ge", "gt", "le", "is_", "is_not"},
+    "array": {"array", "_array_reconstructor"},
+}
+
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str):
+        if name not in ALLOWED.get(module, ()):
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a cache entry")
+        return super().find_class(module, name)
+
+
+class ClassCache:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / (digest + SUFFIX)
+
+    def load(self, buffer) -> ClassFile:
+        """
+        Return the class in `buffer`, from the cache if a fresh entry exists and otherwise parsed and stored
+
+        Every method of a class loaded from the cache is already decoded.
+        """
+
+        digest = hashlib.sha256(buffer).hexdigest()
+        cls = self._read(digest)
+        if cls is not None:
+            self.hits += 1
+            return cls
+        self.misses += 1
+        cls = parse_class_buffer(buffer)
+        self._write(digest, cls)
+        return cls
+
+    def _header(self, digest: str) -> bytes:
+        return b" ".join([MAGIC, __version__.encode(), str(FORMAT).encode(), DECODING.encode(), digest.encode()]) + b"\n"
+
+    def _read(self, digest: str) -> ClassFile | None:
+        path = self._path(digest)
+        header = self._header(digest)
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(header)) != header:
+                    logger.debug("Ignore the stale cache entry %s", path)
+                    return None
+                return _restore(_Unpickler(f).load())
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # E.g. a truncated entry or one that refers to a class that has moved since
+            logger.debug("Ignore the unreadable cache entry %s", path, exc_info=True)
+            return None
+
+    def _write(self, digest: str, cls: ClassFile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(digest)
+        # Write to a temporary file first so that concurrent readers never see a partial entry
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "wb") as f:
+            f.write(self._header(digest))
+            pickle.dump(_payload(cls), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    def clear(self) -> int:
+        """
+        Remove every entry and return how many were removed
+        """
+
+        count = 0
+        if self.directory.is_dir():
+            for path in self.directory.glob("*" + SUFFIX):
+                path.unlink()
+                count += 1
+        return count
+
+
+def _payload(cls: ClassFile) -> tuple:
+    constant_pool = cls.constant_pool
+    constants = [constant_pool[i] for i in range(1, len(constant_pool) + 1)]
+    rows = []
+    numbers = {}
+    methods = []
+    for entry in cls.method_table:
+        code = array("I")
+        for instruction in entry.instructions:
+            row = (type(instruction), *vars(instruction).values())
+            try:
+                # Tell apart equal fields of different types such as 1 and 1.0
+                number = numbers.setdefault((row, tuple(map(type, row))), len(rows))
+            except TypeError:
+                # A field is unhashable, e.g. the dict of a Lookupswitch
+                number = len(rows)
+            if number == len(rows):
+                rows.append(row)
+            code.append(number)
+        m = entry.method
+        methods.append((m.name_index, m.descriptor_index, bytes(m.code), m.max_stack, m.max_locals, m.access_flags, code))
+    return (
+        cls.magic, cls.constant_pool_count, constants, cls.this_class, cls.super_class, cls.fields,
+        cls.bootstrap_methods, rows, methods,
+    )
+
+
+def _restore(payload: tuple) -> ClassFile:
+    magic, constant_pool_count, constants, this_class, super_class, fields, bootstrap_methods, rows, methods = payload
+    cls = ClassFile(
+        magic,
+        constant_pool_count,
+        ConstantPool(constants),
+        tuple(Method(*method[:-1]) for method in methods),
+        this_class,
+        super_class,
+        fields,
+        bootstrap_methods,
+    )
+    instructions = [row[0](*row[1:]) for row in rows]
+    for entry, (*_, code) in zip(cls.method_table, methods):
+        entry.instructions = tuple(map(instructions.__getitem__, code))
+    return cls
@@ -0,0 +1,275 @@
+"""
+Write class files, mainly to build test programs and benchmarks without a Java compiler
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html
+"""
+
+import struct
+
+from toyjava.constants import TAG_UTF8, TAG_INTEGER, TAG_LONG, TAG_CLASS, TAG_STRING, TAG_FIELDREF, TAG_METHODREF, \
+    TAG_NAME_AND_TYPE, TAG_METHOD_HANDLE, TAG_INVOKE_DYNAMIC
+from toyjava.instructions import OPCODES, MNEMONICS
+
+MAGIC = 0xCAFEBABE
+# Java SE 8
+MAJOR_VERSION = 52
+
+ACC_PUBLIC = 0x0001
+ACC_PRIVATE = 0x0002
+ACC_STATIC = 0x0008
+ACC_ABSTRACT = 0x0400
+
+# The reference kind of a MethodHandle to a static method
+REF_INVOKE_STATIC = 6
+
+
+class ConstantPoolWriter:
+    def __init__(self):
+        self._entries = []
+        self._indices = {}
+
+    def _add(self, key, entry: bytes) -> int:
+        if key not in self._indices:
+            self._entries.append(entry)
+            self._indices[key] = len(self._entries)
+        return self._indices[key]
+
+    def utf8(self, value: str) -> int:
+        encoded = value.encode()
+        return self._add(("utf8", value), struct.pack(">BH", TAG_UTF8, len(encoded)) + encoded)
+
+    def integer(self, value: int) -> int:
+        return self._add(("integer", value), struct.pack(">Bi", TAG_INTEGER, value))
+
+    def long(self, value: int) -> int:
+        key = ("long", value)
+        if key not in self._indices:
+            self._add(key, struct.pack(">Bq", TAG_LONG, value))
+            # A long takes two entries, the second of which is unusable
+            self._entries.append(b"")
+        return self._indices[key]
+
+    def class_info(self, name: str) -> int:
+        name_index = self.utf8(name)
+        return self._add(("class", name), struct.pack(">BH", TAG_CLASS, name_index))
+
+    def string(self, value: str) -> int:
+        string_index = self.utf8(value)
+        return self._add(("string", value), struct.pack(">BH", TAG_STRING, string_index))
+
+    def name_and_type(self, name: str, descriptor: str) -> int:
+        name_index = self.utf8(name)
+        descriptor_index = self.utf8(descriptor)
+        return self._add(
+            ("name_and_type", name, descriptor),
+            struct.pack(">BHH", TAG_NAME_AND_TYPE, name_index, descriptor_index),
+        )
+
+    def _member(self, tag: int, class_name: str, name: str, descriptor: str) -> int:
+        class_index = self.class_info(class_name)
+        name_and_type_index = self.name_and_type(name, descriptor)
+        return self._add(
+            (tag, class_name, name, descriptor),
+            struct.pack(">BHH", tag, class_index, name_and_type_index),
+        )
+
+    def fieldref(self, class_name: str, name: str, descriptor: str) -> int:
+        return self._member(TAG_FIELDREF, class_name, name, descriptor)
+
+    def methodref(self, class_name: str, name: str, descriptor: str) -> int:
+        return self._member(TAG_METHODREF, class_name, name, descriptor)
+
+    def method_handle(self, reference_kind: int, reference_index: int) -> int:
+        return self._add(
+            ("method_handle", reference_kind, reference_index),
+            struct.pack(">BBH", TAG_METHOD_HANDLE, reference_kind, reference_index),
+        )
+
+    def invoke_dynamic(self, bootstrap_method_attr_index: int, name: str, descriptor: str) -> int:
+        name_and_type_index = self.name_and_type(name, descriptor)
+        return self._add(
+            ("invoke_dynamic", bootstrap_method_attr_index, name, descriptor),
+            struct.pack(">BHH", TAG_INVOKE_DYNAMIC, bootstrap_method_attr_index, name_and_type_index),
+        )
+
+    def to_bytes(self) -> bytes:
+        return struct.pack(">H", len(self._entries) + 1) + b"".join(self._entries)
+
+
+class ClassWriter:
+    def __init__(self, name: str, super_name: str = "java/lang/Object"):
+        self.constant_pool = ConstantPoolWriter()
+        self.this_class = self.constant_pool.class_info(name)
+        self.super_class = self.constant_pool.class_info(super_name)
+        self._fields = []
+        self._methods = []
+        self._bootstrap_methods = []
+
+    def add_field(self, name: str, descriptor: str, access_flags: int = ACC_PRIVATE, constant_value: int | None = None):
+        # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.5
+        field_info = struct.pack(">HHH", access_flags, self.constant_pool.utf8(name), self.constant_pool.utf8(descriptor))
+        if constant_value is None:
+            self._fields.append(field_info + struct.pack(">H", 0))
+            return
+        # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.2
+        if descriptor == "J":
+            value_index = self.constant_pool.long(constant_value)
+        else:
+            value_index = self.constant_pool.integer(constant_value)
+        self._fields.append(field_info + struct.pack(">HHIH", 1, self.constant_pool.utf8("ConstantValue"), 2, value_index))
+
+    def add_method(self, name: str, descriptor: str, code: bytes | None, max_stack: int = 16, max_locals: int = 16,
+                   access_flags: int = ACC_PUBLIC | ACC_STATIC, exceptions: tuple = ()):
+        """
+        Add a method, which has no Code attribute if `code` is None, like an abstract method
+
+        `exceptions` are the names of the classes in its Exceptions attribute, which precedes the Code attribute.
+        """
+
+        attributes = []
+        if exceptions:
+            # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.5
+            indices = [self.constant_pool.class_info(exception) for exception in exceptions]
+            info = struct.pack(f">H{len(indices)}H", len(indices), *indices)
+            attributes.append(struct.pack(">HI", self.constant_pool.utf8("Exceptions"), len(info)) + info)
+        if code is not None:
+            # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.3
+            code_attribute = b"".join([
+                struct.pack(">HHI", max_stack, max_locals, len(code)),
+                code,
+                # exception_table_length, attributes_count
+                struct.pack(">HH", 0, 0),
+            ])
+            attributes.append(struct.pack(">HI", self.constant_pool.utf8("Code"), len(code_attribute)) + code_attribute)
+        method_info = struct.pack(
+            ">HHHH",
+            access_flags,
+            self.constant_pool.utf8(name),
+            self.constant_pool.utf8(descriptor),
+            len(attributes),
+        )
+        self._methods.append(method_info + b"".join(attributes))
+
+    def add_bootstrap_method(self, class_name: str, name: str, descriptor: str, arguments: tuple = ()) -> int:
+        """
+        Add an entry of the BootstrapMethods attribute, whose static arguments are indices into the constant pool,
+        and return its index for ConstantPoolWriter.invoke_dynamic
+        """
+
+        # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.23
+        handle = self.constant_pool.method_handle(REF_INVOKE_STATIC, self.constant_pool.methodref(class_name, name, descriptor))
+        self._bootstrap_methods.append(struct.pack(f">HH{len(arguments)}H", handle, len(arguments), *arguments))
+        return len(self._bootstrap_methods) - 1
+
+    def make_concat_with_constants(self, recipe: str, descriptor: str) -> int:
+        """
+        Add the call site that javac emits for a string concatenation and return its index for invokedynamic
+
+        The recipe has a \\1 for each argument, whose types `descriptor` lists.
+        """
+
+        bootstrap_method = self.add_bootstrap_method(
+            "java/lang/invoke/StringConcatFactory",
+            "makeConcatWithConstants",
+            "(Ljava/lang/invoke/MethodHandles$Lookup;Ljava/lang/String;Ljava/lang/invoke/MethodType;"
+            "Ljava/lang/String;[Ljava/lang/Object;)Ljava/lang/invoke/CallSite;",
+            (self.constant_pool.string(recipe),),
+        )
+        return self.constant_pool.invoke_dynamic(bootstrap_method, "makeConcatWithConstants", descriptor)
+
+    def to_bytes(self) -> bytes:
+        attributes = []
+        if self._bootstrap_methods:
+            info = struct.pack(">H", len(self._bootstrap_methods)) + b"".join(self._bootstrap_methods)
+            attributes.append(struct.pack(">HI", self.constant_pool.utf8("BootstrapMethods"), len(info)) + info)
+        return b"".join([
+            struct.pack(">IHH", MAGIC, 0, MAJOR_VERSION),
+            self.constant_pool.to_bytes(),
+            # access_flags, this_class, super_class, interfaces_count
+            struct.pack(">HHHH", ACC_PUBLIC, self.this_class, self.super_class, 0),
+            struct.pack(">H", len(self._fields)),
+            *self._fields,
+            struct.pack(">H", len(self._methods)),
+            *self._methods,
+            struct.pack(">H", len(attributes)),
+            *attributes,
+        ])
+
+
+class Label:
+    """
+    A position in the code of an Assembler, which may be used as a branch target before it is placed
+    """
+
+
+class Assembler:
+    """
+    Assemble the code of a method from mnemonics
+
+    Branch offsets are given as Labels. The operands of tableswitch are (default, low, targets),
+    those of lookupswitch are (default, {match: target}) and those of wide are the widened mnemonic and its operands.
+    """
+
+    def __init__(self):
+        self._items = []
+
+    def emit(self, mnemonic: str, *operands):
+        if mnemonic not in MNEMONICS:
+            raise ValueError(f"Unknown mnemonic: {mnemonic}")
+        self._items.append((mnemonic, operands))
+        return self
+
+    def place(self, label: Label):
+        self._items.append(label)
+        return self
+
+    @staticmethod
+    def _size(mnemonic: str, operands: tuple, position: int) -> int:
+        if mnemonic == "wide":
+            return 6 if operands[0] == "iinc" else 4
+        padding = 3 - position % 4
+        if mnemonic == "tableswitch":
+            return 1 + padding + 12 + 4 * len(operands[2])
+        if mnemonic == "lookupswitch":
+            return 1 + padding + 8 + 8 * len(operands[1])
+        return 1 + OPCODES[MNEMONICS[mnemonic]].operands.size
+
+    def to_bytes(self) -> bytes:
+        positions = {}
+        position = 0
+        for item in self._items:
+            if isinstance(item, Label):
+                positions[item] = position
+            else:
+                position += self._size(*item, position)
+
+        code = bytearray()
+        for item in self._items:
+            if not isinstance(item, Label):
+                code += self._encode(*item, len(code), positions)
+        return bytes(code)
+
+    @staticmethod
+    def _encode(mnemonic: str, operands: tuple, position: int, positions: dict) -> bytes:
+        def offset(label):
+            return positions[label] - position
+
+        code = bytearray([MNEMONICS[mnemonic]])
+        if mnemonic == "wide":
+            code.append(MNEMONICS[operands[0]])
+            code += struct.pack(">Hh" if operands[0] == "iinc" else ">H", *operands[1:])
+        elif mnemonic in ("tableswitch", "lookupswitch"):
+            code += bytes(3 - position % 4)
+            if mnemonic == "tableswitch":
+                default, low, targets = operands
+                code += struct.pack(">iii", offset(default), low, low + len(targets) - 1)
+                code += b"".join(struct.pack(">i", offset(target)) for target in targets)
+            else:
+                default, targets = operands
+                code += struct.pack(">ii", offset(default), len(targets))
+                code += b"".join(struct.pack(">ii", match, offset(targets[match])) for match in sorted(targets))
+        else:
+            code += OPCODES[MNEMONICS[mnemonic]].operands.pack(
+                *(offset(operand) if isinstance(operand, Label) else operand for operand in operands)
+            )
+        return bytes(code)
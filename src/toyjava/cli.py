@@ -0,0 +1,98 @@
+"""
+The command line interface of bin/toyjava
+"""
+
+import argparse
+import dataclasses
+import json
+import mmap
+import os
+import sys
+
+from toyjava.batch import read_manifest, run_many
+from toyjava.cache import ClassCache
+from toyjava.jvm import ENGINES, VirtualMachine, parse_class_lazily
+from toyjava.loader import ClassLoader
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["run-many"]:
+        return run_many_main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="toyjava", description="Run the main method of a class")
+    parser.add_argument("main", nargs="?", help="a .class file, or the name of a class on the classpath")
+    parser.add_argument("-cp", "--classpath", default=os.environ.get("CLASSPATH", ""),
+                        help=f"directories and jar files separated by {os.pathsep!r} (default: $CLASSPATH)")
+    parser.add_argument("--cache-dir", default=os.environ.get("TOYJAVA_CACHE_DIR"),
+                        help="cache parsed classes in this directory (default: $TOYJAVA_CACHE_DIR, no cache if unset)")
+    parser.add_argument("--profile", action="store_true",
+                        help="count instructions, calls and branches and print a report to stderr")
+    parser.add_argument("--clear-cache", action="store_true", help="remove every entry of the cache first")
+    args = parser.parse_args(argv)
+
+    cache = ClassCache(args.cache_dir) if args.cache_dir else None
+    if args.clear_cache:
+        if cache is None:
+            parser.error("--clear-cache requires --cache-dir")
+        cache.clear()
+    if args.main is None:
+        if not args.clear_cache:
+            parser.error("the main class is required")
+        return
+
+    classpath = [path for path in args.classpath.split(os.pathsep) if path]
+    if cache is None:
+        loader = ClassLoader(classpath)
+    else:
+        loader = ClassLoader(classpath, parse=cache.load)
+    vm = VirtualMachine(loader=loader)
+    if args.main.endswith(".class"):
+        with open(args.main, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        cls = parse_class_lazily(buffer) if cache is None else cache.load(buffer)
+    else:
+        cls = loader.load(args.main.replace(".", "/"))
+
+    if args.profile:
+        print(vm.profile_main(cls).format(), file=sys.stderr)
+    else:
+        vm.execute_main(cls)
+
+
+def run_many_main(argv):
+    """
+    toyjava run-many: run the main methods of many programs in a pool of worker processes
+    """
+
+    parser = argparse.ArgumentParser(prog="toyjava run-many", description="Run the main methods of many classes")
+    parser.add_argument("programs", nargs="*", help=".class files, or names of classes on the classpath")
+    parser.add_argument("-m", "--manifest", action="append", default=[],
+                        help="a file listing programs one per line, relative to its directory")
+    parser.add_argument("-j", "--jobs", type=int, help="the number of worker processes (default: one per CPU)")
+    parser.add_argument("--engine", choices=[*ENGINES, "jit"], default="dispatch")
+    parser.add_argument("--json", action="store_true", help="print each result as a line of JSON")
+    parser.add_argument("-cp", "--classpath", default=os.environ.get("CLASSPATH", ""),
+                        help=f"directories and jar files separated by {os.pathsep!r} (default: $CLASSPATH)")
+    parser.add_argument("--cache-dir", default=os.environ.get("TOYJAVA_CACHE_DIR"),
+                        help="cache parsed classes in this directory (default: $TOYJAVA_CACHE_DIR, no cache if unset)")
+    args = parser.parse_args(argv)
+
+    programs = list(args.programs)
+    for manifest in args.manifest:
+        programs.extend(read_manifest(manifest))
+    if not programs:
+        parser.error("no programs to run")
+
+    classpath = [path for path in args.classpath.split(os.pathsep) if path]
+    results = run_many(programs, classpath, args.engine, args.jobs, args.cache_dir)
+    for result in results:
+        if args.json:
+            print(json.dumps(dataclasses.asdict(result)))
+        else:
+            print(f"==> {result.program} (status {result.status}, {result.seconds:.3f}s)")
+            sys.stdout.write(result.stdout)
+            if result.error is not None:
+                print(result.error)
+    if any(result.status for result in results):
+        sys.exit(1)
@@ -0,0 +1,587 @@
+"""
+An execution tier that compiles a decoded method into a tuple of closures
+
+Operands, constant pool entries and branch targets are resolved once when the method is compiled.
+Each closure takes the operand stack and the local variables and returns the index of the next closure to run.
+"""
+
+from toyjava.arithmetic import wrap_int
+from toyjava.arrays import new_array, new_reference_array, out_of_bounds
+from toyjava.instructions import Getstatic, Ldc, Invokevirtual, Return, Istore1, Iload1, Istore2, Iload2, Iinc, Goto, \
+    Push, Ifne, BranchIf2, InvokeStatic, Iload0, Ireturn, Arithmetic1, Arithmetic2, Iload, Istore, BranchIf1, \
+    Tableswitch, Lookupswitch, Newarray, Anewarray, Arrayload, Arraystore, Arraylength, Invokespecial, New, Getfield, \
+    Putfield, Pop, Dup, DupX1, Swap, Putstatic, Invokedynamic
+from toyjava.memoization import MISSING, memo_of
+from toyjava.objects import NullPointerError, null_field_access, virtual_method
+
+RETURN_VOID = -1
+RETURN_VALUE = -2
+
+
+def _unresolved_field(mnemonic, field):
+    def step(stack, local_variables):
+        raise NotImplementedError(f"'{mnemonic}' cannot resolve {field.class_name}.{field.name}")
+
+    return step
+
+
+def _getstatic(instruction, pc, cls):
+    field = cls.constant_pool.resolved[instruction.index]
+    cell = field.cell
+    next_pc = pc + 1
+
+    if cell is None:
+        return _unresolved_field("getstatic", field)
+
+    def step(stack, local_variables):
+        stack.append(cell.value)
+        return next_pc
+
+    return step
+
+
+def _putstatic(instruction, pc, cls):
+    field = cls.constant_pool.resolved[instruction.index]
+    cell = field.cell
+    next_pc = pc + 1
+
+    if cell is None:
+        return _unresolved_field("putstatic", field)
+
+    def step(stack, local_variables):
+        cell.value = stack.pop()
+        return next_pc
+
+    return step
+
+
+def _initializing(statics, call):
+    """
+    Wrap a call so that it initializes a class first, if the class is not initialized when the call is compiled
+    """
+
+    if statics.initialized:
+        return call
+
+    def initialize_and_call(args):
+        statics.initialize()
+        return call(args)
+
+    return initialize_and_call
+
+
+def _ldc(instruction, pc, cls):
+    value = cls.constant_pool.resolved[instruction.index]
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack.append(value)
+        return next_pc
+
+    return step
+
+
+def _invoke(methodref, pc, num_args, call):
+    next_pc = pc + 1
+    returns = methodref.return_kind != "V"
+
+    def step(stack, local_variables):
+        split = len(stack) - num_args
+        args = stack[split:]
+        del stack[split:]
+        return_value = call(args)
+        if returns:
+            stack.append(return_value)
+        return next_pc
+
+    return step
+
+
+def _run_instance_method(methodref, target, args):
+    if methodref.wide is not None:
+        args = args[:1] + methodref.local_variables(args[1:])
+    if target.max_locals > len(args):
+        args += [None] * (target.max_locals - len(args))
+    return run(compiled(target, target.cls), args)
+
+
+def _invokevirtual(instruction, pc, cls):
+    methodref = cls.constant_pool.resolved[instruction.index]
+    target = methodref.target
+    # The arguments include the object reference
+    if methodref.native:
+        return _invoke(methodref, pc, methodref.arg_count + 1, lambda args: target(*args))
+
+    name = methodref.name
+    descriptor = methodref.descriptor
+
+    def call(args):
+        receiver = args[0]
+        if receiver is None:
+            raise NullPointerError(f"Cannot invoke {methodref.class_name}.{name} on null")
+        return _run_instance_method(methodref, virtual_method(type(receiver), name, descriptor), args)
+
+    return _invoke(methodref, pc, methodref.arg_count + 1, call)
+
+
+def _invokespecial(instruction, pc, cls):
+    methodref = cls.constant_pool.resolved[instruction.index]
+    target = methodref.target
+
+    if target is None:
+        def step(stack, local_variables):
+            raise NotImplementedError(f"'invokespecial' cannot resolve {methodref.class_name}.{methodref.name}")
+
+        return step
+
+    if methodref.native:
+        return _invoke(methodref, pc, methodref.arg_count + 1, lambda args: target(*args))
+    return _invoke(methodref, pc, methodref.arg_count + 1, lambda args: _run_instance_method(methodref, target, args))
+
+
+def _invokestatic(instruction, pc, cls):
+    methodref = cls.constant_pool.resolved[instruction.index]
+    target = methodref.target
+
+    if target is None:
+        def step(stack, local_variables):
+            raise NotImplementedError(f"'invokestatic' cannot resolve {methodref.class_name}.{methodref.name}")
+
+        return step
+
+    if methodref.native:
+        return _invoke(methodref, pc, methodref.arg_count, lambda args: target(*args))
+    # The callee is compiled on its first call, which also covers recursive methods
+    padding = [None] * (target.max_locals - methodref.arg_slots)
+    if methodref.wide is not None:
+        def call(args):
+            return run(compiled(target, target.cls), methodref.local_variables(args) + padding)
+    else:
+        def call(args):
+            return run(compiled(target, target.cls), args + padding)
+    return _invoke(methodref, pc, methodref.arg_count, _initializing(target.cls.statics, _memoized(target, call)))
+
+
+def _memoized(target, call):
+    """
+    Wrap a call to a static method with the Memo, if any, of the VirtualMachine that makes the call,
+    since compiled closures are shared by VMs that may memoize differently
+    """
+
+    def memoized_call(args):
+        memo = memo_of(target)
+        if memo is None:
+            return call(args)
+        key = tuple(args)
+        value = memo.lookup(key)
+        if value is MISSING:
+            value = memo.store(key, call(args))
+        return value
+
+    return memoized_call
+
+
+def _invokedynamic(instruction, pc, cls):
+    callsite = cls.constant_pool.resolved[instruction.index]
+    target = callsite.target
+
+    if target is None:
+        def step(stack, local_variables):
+            raise NotImplementedError(f"'invokedynamic' cannot link {callsite.name} to {callsite.class_name}")
+
+        return step
+
+    return _invoke(callsite, pc, callsite.arg_count, lambda args: target(*args))
+
+
+def _new(instruction, pc, cls):
+    constant_pool = cls.constant_pool
+    layout = constant_pool.resolved[instruction.index]
+    next_pc = pc + 1
+
+    if layout is None:
+        def step(stack, local_variables):
+            raise NotImplementedError(
+                f"'new' cannot resolve {constant_pool[constant_pool[instruction.index].name_index]}"
+            )
+
+        return step
+
+    statics = layout.statics
+    if not statics.initialized:
+        def step(stack, local_variables):
+            statics.initialize()
+            stack.append(layout())
+            return next_pc
+
+        return step
+
+    def step(stack, local_variables):
+        stack.append(layout())
+        return next_pc
+
+    return step
+
+
+def _getfield(instruction, pc, cls):
+    fieldref = cls.constant_pool.resolved[instruction.index]
+    slot = fieldref.slot
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        objectref = stack[-1]
+        if objectref is None:
+            raise null_field_access(fieldref)
+        stack[-1] = getattr(objectref, slot)
+        return next_pc
+
+    return step
+
+
+def _putfield(instruction, pc, cls):
+    fieldref = cls.constant_pool.resolved[instruction.index]
+    slot = fieldref.slot
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        value = stack.pop()
+        objectref = stack.pop()
+        if objectref is None:
+            raise null_field_access(fieldref)
+        setattr(objectref, slot, value)
+        return next_pc
+
+    return step
+
+
+def _pop(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack.pop()
+        return next_pc
+
+    return step
+
+
+def _dup(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack.append(stack[-1])
+        return next_pc
+
+    return step
+
+
+def _dup_x1(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack.insert(-2, stack[-1])
+        return next_pc
+
+    return step
+
+
+def _swap(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack[-1], stack[-2] = stack[-2], stack[-1]
+        return next_pc
+
+    return step
+
+
+def _return(instruction, pc, cls):
+    def step(stack, local_variables):
+        return RETURN_VOID
+
+    return step
+
+
+def _ireturn(instruction, pc, cls):
+    def step(stack, local_variables):
+        return RETURN_VALUE
+
+    return step
+
+
+def _push(instruction, pc, cls):
+    value = instruction.value
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack.append(value)
+        return next_pc
+
+    return step
+
+
+def _arithmetic2(instruction, pc, cls):
+    function = instruction.function
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        value2 = stack.pop()
+        stack[-1] = function(stack[-1], value2)
+        return next_pc
+
+    return step
+
+
+def _arithmetic1(instruction, pc, cls):
+    function = instruction.function
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack[-1] = function(stack[-1])
+        return next_pc
+
+    return step
+
+
+def _store(index=None):
+    def compile_store(instruction, pc, cls):
+        i = instruction.index if index is None else index
+        next_pc = pc + 1
+
+        def step(stack, local_variables):
+            local_variables[i] = stack.pop()
+            return next_pc
+
+        return step
+
+    return compile_store
+
+
+def _load(index=None):
+    def compile_load(instruction, pc, cls):
+        i = instruction.index if index is None else index
+        next_pc = pc + 1
+
+        def step(stack, local_variables):
+            stack.append(local_variables[i])
+            return next_pc
+
+        return step
+
+    return compile_load
+
+
+def _newarray(instruction, pc, cls):
+    typecode = instruction.typecode
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack[-1] = new_array(typecode, stack[-1])
+        return next_pc
+
+    return step
+
+
+def _anewarray(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack[-1] = new_reference_array(stack[-1])
+        return next_pc
+
+    return step
+
+
+def _arrayload(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        index = stack.pop()
+        array = stack[-1]
+        # A negative index would count from the end of a Python sequence
+        if index < 0 or index >= len(array):
+            raise out_of_bounds(index, len(array))
+        stack[-1] = array[index]
+        return next_pc
+
+    return step
+
+
+def _arraystore(instruction, pc, cls):
+    convert = instruction.convert
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        value = stack.pop()
+        index = stack.pop()
+        array = stack.pop()
+        if index < 0 or index >= len(array):
+            raise out_of_bounds(index, len(array))
+        array[index] = value if convert is None else convert(value)
+        return next_pc
+
+    return step
+
+
+def _arraylength(instruction, pc, cls):
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        stack[-1] = len(stack[-1])
+        return next_pc
+
+    return step
+
+
+def _ifne(instruction, pc, cls):
+    target = instruction.index
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        return target if stack.pop() != 0 else next_pc
+
+    return step
+
+
+def _branch_if2(instruction, pc, cls):
+    target = instruction.index
+    predicate = instruction.predicate
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        v2 = stack.pop()
+        v1 = stack.pop()
+        return target if predicate(v1, v2) else next_pc
+
+    return step
+
+
+def _branch_if1(instruction, pc, cls):
+    target = instruction.index
+    predicate = instruction.predicate
+    operand = instruction.operand
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        return target if predicate(stack.pop(), operand) else next_pc
+
+    return step
+
+
+def _tableswitch(instruction, pc, cls):
+    default = instruction.default
+    low = instruction.low
+    indices = instruction.indices
+    high = low + len(indices) - 1
+
+    def step(stack, local_variables):
+        value = stack.pop()
+        return indices[value - low] if low <= value <= high else default
+
+    return step
+
+
+def _lookupswitch(instruction, pc, cls):
+    default = instruction.default
+    indices = instruction.indices
+
+    def step(stack, local_variables):
+        return indices.get(stack.pop(), default)
+
+    return step
+
+
+def _iinc(instruction, pc, cls):
+    index = instruction.index
+    const = instruction.const
+    next_pc = pc + 1
+
+    def step(stack, local_variables):
+        value = local_variables[index] + const
+        local_variables[index] = value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value)
+        return next_pc
+
+    return step
+
+
+def _goto(instruction, pc, cls):
+    target = instruction.index
+
+    def step(stack, local_variables):
+        return target
+
+    return step
+
+
+COMPILERS = {
+    Getstatic: _getstatic,
+    Putstatic: _putstatic,
+    Ldc: _ldc,
+    Invokevirtual: _invokevirtual,
+    InvokeStatic: _invokestatic,
+    Invokespecial: _invokespecial,
+    Invokedynamic: _invokedynamic,
+    New: _new,
+    Getfield: _getfield,
+    Putfield: _putfield,
+    Pop: _pop,
+    Dup: _dup,
+    DupX1: _dup_x1,
+    Swap: _swap,
+    Return: _return,
+    Ireturn: _ireturn,
+    Push: _push,
+    Arithmetic1: _arithmetic1,
+    Arithmetic2: _arithmetic2,
+    Istore: _store(),
+    Istore1: _store(1),
+    Istore2: _store(2),
+    Iload: _load(),
+    Iload0: _load(0),
+    Iload1: _load(1),
+    Iload2: _load(2),
+    Newarray: _newarray,
+    Anewarray: _anewarray,
+    Arrayload: _arrayload,
+    Arraystore: _arraystore,
+    Arraylength: _arraylength,
+    Ifne: _ifne,
+    BranchIf1: _branch_if1,
+    BranchIf2: _branch_if2,
+    Tableswitch: _tableswitch,
+    Lookupswitch: _lookupswitch,
+    Iinc: _iinc,
+    Goto: _goto,
+}
+
+
+def _unsupported(instruction, pc, cls):
+    def step(stack, local_variables):
+        raise NotImplementedError(instruction)
+
+    return step
+
+
+def compile_instructions(instructions, cls) -> tuple:
+    return tuple(
+        COMPILERS.get(type(instruction), _unsupported)(instruction, pc, cls)
+        for pc, instruction in enumerate(instructions)
+    )
+
+
+def compiled(entry, cls) -> tuple:
+    if entry.closures is None:
+        entry.closures = compile_instructions(entry.instructions, cls)
+    return entry.closures
+
+
+def run(steps, local_variables):
+    stack = []
+    pc = 0
+    while pc >= 0:
+        pc = steps[pc](stack, local_variables)
+    if pc == RETURN_VALUE:
+        return stack.pop()
+
+
+def execute(instructions, cls, local_variables):
+    return run(compile_instructions(instructions, cls), local_variables)
@@ -0,0 +1,757 @@
+"""
+A compact encoding of the code of a method as parallel typed arrays, and an interpreter that runs over it
+
+`encode` turns the bytecode into a CompactCode in one pass: each instruction is an entry of three array.arrays,
+its opcode and its two int operands, e.g. the index of a local variable, a value or a branch target
+as the index of an instruction.
+The few operands that are not ints, such as the function of an arithmetic instruction or the table of a switch,
+are stored once in `objects` and referred to by their index there.
+A method thus takes a few bytes per instruction rather than an instruction object with its __dict__ each
+(see `size_of_instructions` and `CompactCode.size`).
+
+The interpreter is laid out like toyjava.dispatch: a handler per opcode called with the frame and the first operand,
+and calls between Java methods chained through CompactFrames rather than nested Python calls.
+"""
+
+import operator as op
+import sys
+from array import array
+from itertools import repeat
+
+from toyjava import arithmetic
+from toyjava.arithmetic import wrap_int
+from toyjava.arrays import new_array, new_reference_array, out_of_bounds
+from toyjava.instructions import Getstatic, Ldc, Invokevirtual, Return, Istore1, Iload1, Istore2, Iload2, Iinc, \
+    Push, InvokeStatic, Iload0, Ireturn, Arithmetic1, Arithmetic2, Iload, Istore, Newarray, Anewarray, Arrayload, \
+    Arraystore, Arraylength, Invokespecial, New, Getfield, Putfield, Pop, Dup, DupX1, Swap, Putstatic, Invokedynamic, \
+    RawGoto, RawIfne, RawLookupswitch, RawTableswitch, UnresolvedBranchIf1, UnresolvedBranchIf2, decode_at
+from toyjava.memoization import MISSING, memo_of
+from toyjava.objects import NullPointerError, null_field_access, virtual_method
+
+# The opcodes of the compact encoding, with their operands
+PUSH = 0  # value
+PUSH_NULL = 1
+LDC = 2  # constant pool index, and likewise for the field, method and class instructions
+LOAD = 3  # local variable
+STORE = 4  # local variable
+IINC = 5  # local variable, const
+IADD = 6
+ISUB = 7
+IMUL = 8
+ARITHMETIC2 = 9  # function in `objects`
+ARITHMETIC1 = 10  # function in `objects`
+# The conditional branches, whose operand is the target
+IFEQ = 11
+IFNE = 12
+IFLT = 13
+IFGE = 14
+IFGT = 15
+IFLE = 16
+IF_ICMPEQ = 17
+IF_ICMPNE = 18
+IF_ICMPLT = 19
+IF_ICMPGE = 20
+IF_ICMPGT = 21
+IF_ICMPLE = 22
+IF_ACMPEQ = 23
+IF_ACMPNE = 24
+IFNULL = 25
+IFNONNULL = 26
+GOTO = 27  # target
+TABLESWITCH = 28  # Tableswitch in `objects`
+LOOKUPSWITCH = 29  # Lookupswitch in `objects`
+GETSTATIC = 30
+PUTSTATIC = 31
+GETFIELD = 32
+PUTFIELD = 33
+INVOKEVIRTUAL = 34
+INVOKESPECIAL = 35
+INVOKESTATIC = 36
+INVOKEDYNAMIC = 37
+NEW = 38
+NEWARRAY = 39  # typecode in `objects`
+ANEWARRAY = 40
+ARRAYLOAD = 41
+ARRAYSTORE = 42  # narrowing conversion in `objects`, or -1
+ARRAYLENGTH = 43
+POP = 44
+DUP = 45
+DUP_X1 = 46
+SWAP = 47
+RETURN = 48
+VALUE_RETURN = 49
+UNSUPPORTED = 50  # Generic instruction in `objects`
+
+# The opcodes of the conditional branches by their predicate
+_BRANCHES_IF1 = {
+    (op.eq, 0): IFEQ, (op.lt, 0): IFLT, (op.ge, 0): IFGE, (op.gt, 0): IFGT, (op.le, 0): IFLE,
+    (op.is_, None): IFNULL, (op.is_not, None): IFNONNULL,
+}
+_BRANCHES_IF2 = {
+    op.eq: IF_ICMPEQ, op.ne: IF_ICMPNE, op.lt: IF_ICMPLT, op.ge: IF_ICMPGE, op.gt: IF_ICMPGT, op.le: IF_ICMPLE,
+    op.is_: IF_ACMPEQ, op.is_not: IF_ACMPNE,
+}
+
+# The int operations that the interpreter inlines
+_INLINED = {arithmetic.iadd: IADD, arithmetic.isub: ISUB, arithmetic.imul: IMUL}
+
+
+class CompactCode:
+    """
+    The instructions of a method as parallel arrays of opcodes and operands
+    """
+
+    __slots__ = ("opcodes", "operands1", "operands2", "objects")
+
+    def __init__(self, opcodes: array, operands1: array, operands2: array, objects: tuple):
+        self.opcodes = opcodes
+        self.operands1 = operands1
+        self.operands2 = operands2
+        # The operands that are not ints
+        self.objects = objects
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def size(self) -> int:
+        """
+        The number of bytes held by the code, counted like `size_of_instructions`
+        """
+
+        size = sys.getsizeof(self) + sys.getsizeof(self.objects)
+        size += sys.getsizeof(self.opcodes) + sys.getsizeof(self.operands1) + sys.getsizeof(self.operands2)
+        for value in self.objects:
+            if hasattr(value, "__dict__"):
+                size += _size_of(value)
+        return size
+
+
+def _size_of(instruction) -> int:
+    size = sys.getsizeof(instruction) + sys.getsizeof(instruction.__dict__)
+    for value in vars(instruction).values():
+        if isinstance(value, (tuple, dict)):
+            size += sys.getsizeof(value)
+    return size
+
+
+def size_of_instructions(instructions: tuple) -> int:
+    """
+    The number of bytes held by a tuple of instruction objects: the tuple, each object with its __dict__
+    and the tuples and dicts of the switches, but not the functions and small ints that instructions share
+    """
+
+    return sys.getsizeof(instructions) + sum(_size_of(instruction) for instruction in instructions)
+
+
+class _Encoder:
+    """
+    Appends the encoding of decoded instructions to the arrays of a CompactCode
+    """
+
+    def __init__(self):
+        self.opcodes = array("B")
+        self.operands1 = array("i")
+        self.operands2 = array("i")
+        self.objects = []
+        # value -> index in `objects`, to store each function or typecode once
+        self.interned = {}
+
+    def emit(self, opcode: int, operand1: int = 0, operand2: int = 0):
+        self.opcodes.append(opcode)
+        self.operands1.append(operand1)
+        self.operands2.append(operand2)
+
+    def object(self, value) -> int:
+        index = self.interned.get(value)
+        if index is None:
+            index = self.interned[value] = len(self.objects)
+            self.objects.append(value)
+        return index
+
+    def table(self, value) -> int:
+        self.objects.append(value)
+        return len(self.objects) - 1
+
+    def encode(self, instruction, position: int):
+        """
+        Encode an instruction decoded at a byte offset; a branch target is left as a byte offset in the code
+        """
+
+        kind = type(instruction)
+        if kind is Iload or kind is Istore:
+            self.emit(LOAD if kind is Iload else STORE, instruction.index)
+        elif kind in _LOCALS:
+            self.emit(*_LOCALS[kind])
+        elif kind is Push:
+            if instruction.value is None:
+                self.emit(PUSH_NULL)
+            else:
+                self.emit(PUSH, instruction.value)
+        elif kind is Iinc:
+            self.emit(IINC, instruction.index, instruction.const)
+        elif kind is Arithmetic2:
+            function = instruction.function
+            if function in _INLINED:
+                self.emit(_INLINED[function])
+            else:
+                self.emit(ARITHMETIC2, self.object(function))
+        elif kind is Arithmetic1:
+            self.emit(ARITHMETIC1, self.object(instruction.function))
+        elif kind is UnresolvedBranchIf2:
+            self.emit(_BRANCHES_IF2[instruction.predicate], position + instruction.offset)
+        elif kind is UnresolvedBranchIf1:
+            self.emit(_BRANCHES_IF1[instruction.predicate, instruction.operand], position + instruction.offset)
+        elif kind is RawIfne or kind is RawGoto:
+            self.emit(IFNE if kind is RawIfne else GOTO, position + instruction.branchbyte)
+        elif kind is RawTableswitch or kind is RawLookupswitch:
+            # Resolved by `encode` once the indices of all the instructions are known
+            self.emit(TABLESWITCH if kind is RawTableswitch else LOOKUPSWITCH, self.table(instruction), position)
+        elif kind in _INDEXED:
+            self.emit(_INDEXED[kind], instruction.index)
+        elif kind in _SIMPLE:
+            self.emit(_SIMPLE[kind])
+        elif kind is Newarray:
+            self.emit(NEWARRAY, self.object(instruction.typecode))
+        elif kind is Arraystore:
+            self.emit(ARRAYSTORE, -1 if instruction.convert is None else self.object(instruction.convert))
+        else:
+            self.emit(UNSUPPORTED, self.table(instruction))
+
+
+_LOCALS = {Iload0: (LOAD, 0), Iload1: (LOAD, 1), Iload2: (LOAD, 2), Istore1: (STORE, 1), Istore2: (STORE, 2)}
+_INDEXED = {
+    Ldc: LDC, Getstatic: GETSTATIC, Putstatic: PUTSTATIC, Getfield: GETFIELD, Putfield: PUTFIELD,
+    Invokevirtual: INVOKEVIRTUAL, Invokespecial: INVOKESPECIAL, InvokeStatic: INVOKESTATIC,
+    Invokedynamic: INVOKEDYNAMIC, New: NEW, Anewarray: ANEWARRAY,
+}
+_SIMPLE = {
+    Arrayload: ARRAYLOAD, Arraylength: ARRAYLENGTH, Pop: POP, Dup: DUP, DupX1: DUP_X1, Swap: SWAP, Return: RETURN,
+    Ireturn: VALUE_RETURN,
+}
+_BRANCHES = frozenset(range(IFEQ, GOTO + 1))
+
+
+def encode(code) -> CompactCode:
+    """
+    Encode the code of a method in one pass over it, the instructions being decoded one at a time
+    """
+
+    encoder = _Encoder()
+    positions = []
+    pc = 0
+    end = len(code)
+    while pc < end:
+        positions.append(pc)
+        instruction, following = decode_at(code, pc)
+        encoder.encode(instruction, pc)
+        pc = following
+
+    # Turn the byte offsets of the branch targets into indices of instructions
+    indices = {position: index for index, position in enumerate(positions)}
+    opcodes, operands1, operands2, objects = encoder.opcodes, encoder.operands1, encoder.operands2, encoder.objects
+    for i, opcode in enumerate(opcodes):
+        if opcode in _BRANCHES:
+            operands1[i] = indices[operands1[i]]
+        elif opcode == TABLESWITCH or opcode == LOOKUPSWITCH:
+            # The byte offset of the switch is its second operand until then
+            objects[operands1[i]] = objects[operands1[i]].resolve(operands2[i], indices)
+            operands2[i] = 0
+    return CompactCode(opcodes, operands1, operands2, tuple(objects))
+
+
+class CompactFrame:
+    __slots__ = ("cls", "code", "local_variables", "operand_stack", "pc", "return_value", "caller", "memo",
+                 "memo_key")
+
+    def __init__(self, cls, code: CompactCode, local_variables, caller=None):
+        self.cls = cls
+        self.code = code
+        self.local_variables = local_variables
+        self.operand_stack = []
+        self.pc = 0
+        # Set when the method returns a value to no caller
+        self.return_value = None
+        self.caller = caller
+        # The Memo that stores the return value under `memo_key`, if the method is memoized
+        self.memo = None
+
+
+# Each handler is called with `frame.pc` already pointing to the next instruction and the first operand.
+# Like those of toyjava.dispatch, it returns the frame to continue with.
+
+def _unresolved_field(frame, index: int, mnemonic: str) -> NotImplementedError:
+    field = frame.cls.constant_pool.resolved[index]
+    return NotImplementedError(f"'{mnemonic}' cannot resolve {field.class_name}.{field.name}")
+
+
+def _push(frame, value):
+    frame.operand_stack.append(value)
+    return frame
+
+
+def _push_null(frame, _):
+    frame.operand_stack.append(None)
+    return frame
+
+
+def _ldc(frame, index):
+    frame.operand_stack.append(frame.cls.constant_pool.resolved[index])
+    return frame
+
+
+def _load(frame, index):
+    frame.operand_stack.append(frame.local_variables[index])
+    return frame
+
+
+def _store(frame, index):
+    frame.local_variables[index] = frame.operand_stack.pop()
+    return frame
+
+
+def _iinc(frame, index):
+    # The only instruction with a second operand that the interpreter reads
+    const = frame.code.operands2[frame.pc - 1]
+    local_variables = frame.local_variables
+    value = local_variables[index] + const
+    local_variables[index] = value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value)
+    return frame
+
+
+def _iadd(frame, _):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop() + operand_stack.pop()
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _isub(frame, _):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    value = operand_stack.pop() - value2
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _imul(frame, _):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop() * operand_stack.pop()
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _arithmetic2(frame, function):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    value1 = operand_stack.pop()
+    operand_stack.append(frame.code.objects[function](value1, value2))
+    return frame
+
+
+def _arithmetic1(frame, function):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = frame.code.objects[function](operand_stack[-1])
+    return frame
+
+
+def _ifeq(frame, target):
+    if frame.operand_stack.pop() == 0:
+        frame.pc = target
+    return frame
+
+
+def _ifne(frame, target):
+    if frame.operand_stack.pop() != 0:
+        frame.pc = target
+    return frame
+
+
+def _iflt(frame, target):
+    if frame.operand_stack.pop() < 0:
+        frame.pc = target
+    return frame
+
+
+def _ifge(frame, target):
+    if frame.operand_stack.pop() >= 0:
+        frame.pc = target
+    return frame
+
+
+def _ifgt(frame, target):
+    if frame.operand_stack.pop() > 0:
+        frame.pc = target
+    return frame
+
+
+def _ifle(frame, target):
+    if frame.operand_stack.pop() <= 0:
+        frame.pc = target
+    return frame
+
+
+def _if_icmpeq(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() == value2:
+        frame.pc = target
+    return frame
+
+
+def _if_icmpne(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() != value2:
+        frame.pc = target
+    return frame
+
+
+def _if_icmplt(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() < value2:
+        frame.pc = target
+    return frame
+
+
+def _if_icmpge(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() >= value2:
+        frame.pc = target
+    return frame
+
+
+def _if_icmpgt(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() > value2:
+        frame.pc = target
+    return frame
+
+
+def _if_icmple(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() <= value2:
+        frame.pc = target
+    return frame
+
+
+def _if_acmpeq(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() is value2:
+        frame.pc = target
+    return frame
+
+
+def _if_acmpne(frame, target):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    if operand_stack.pop() is not value2:
+        frame.pc = target
+    return frame
+
+
+def _ifnull(frame, target):
+    if frame.operand_stack.pop() is None:
+        frame.pc = target
+    return frame
+
+
+def _ifnonnull(frame, target):
+    if frame.operand_stack.pop() is not None:
+        frame.pc = target
+    return frame
+
+
+def _goto(frame, target):
+    frame.pc = target
+    return frame
+
+
+def _tableswitch(frame, table):
+    switch = frame.code.objects[table]
+    i = frame.operand_stack.pop() - switch.low
+    indices = switch.indices
+    frame.pc = indices[i] if 0 <= i < len(indices) else switch.default
+    return frame
+
+
+def _lookupswitch(frame, table):
+    switch = frame.code.objects[table]
+    frame.pc = switch.indices.get(frame.operand_stack.pop(), switch.default)
+    return frame
+
+
+def _getstatic(frame, index):
+    cell = frame.cls.constant_pool.resolved[index].cell
+    if cell is None:
+        raise _unresolved_field(frame, index, "getstatic")
+    frame.operand_stack.append(cell.value)
+    return frame
+
+
+def _putstatic(frame, index):
+    cell = frame.cls.constant_pool.resolved[index].cell
+    if cell is None:
+        raise _unresolved_field(frame, index, "putstatic")
+    cell.value = frame.operand_stack.pop()
+    return frame
+
+
+def _getfield(frame, index):
+    operand_stack = frame.operand_stack
+    fieldref = frame.cls.constant_pool.resolved[index]
+    objectref = operand_stack[-1]
+    if objectref is None:
+        raise null_field_access(fieldref)
+    operand_stack[-1] = getattr(objectref, fieldref.slot)
+    return frame
+
+
+def _putfield(frame, index):
+    operand_stack = frame.operand_stack
+    fieldref = frame.cls.constant_pool.resolved[index]
+    value = operand_stack.pop()
+    objectref = operand_stack.pop()
+    if objectref is None:
+        raise null_field_access(fieldref)
+    setattr(objectref, fieldref.slot, value)
+    return frame
+
+
+def _call(frame, methodref, target, args):
+    """
+    Return the frame of an instance method whose receiver and arguments are `args`
+    """
+
+    if methodref.wide is not None:
+        args = args[:1] + methodref.local_variables(args[1:])
+    if target.max_locals > len(args):
+        args += repeat(None, target.max_locals - len(args))
+    return CompactFrame(target.cls, target.compact, args, frame)
+
+
+def _invokevirtual(frame, index):
+    methodref = frame.cls.constant_pool.resolved[index]
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count - 1
+    args = operand_stack[split:]
+    del operand_stack[split:]
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+
+    receiver = args[0]
+    if receiver is None:
+        raise NullPointerError(f"Cannot invoke {methodref.class_name}.{methodref.name} on null")
+    return _call(frame, methodref, virtual_method(type(receiver), methodref.name, methodref.descriptor), args)
+
+
+def _invokespecial(frame, index):
+    methodref = frame.cls.constant_pool.resolved[index]
+    if methodref.target is None:
+        raise NotImplementedError(f"'invokespecial' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count - 1
+    args = operand_stack[split:]
+    del operand_stack[split:]
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+    return _call(frame, methodref, methodref.target, args)
+
+
+def _invokestatic(frame, index):
+    methodref = frame.cls.constant_pool.resolved[index]
+    if methodref.target is None:
+        raise NotImplementedError(f"'invokestatic' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count
+    args = operand_stack[split:]
+    del operand_stack[split:]
+
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+
+    target = methodref.target
+    statics = target.cls.statics
+    if not statics.initialized:
+        statics.initialize()
+    memo = memo_of(target)
+    if memo is not None:
+        key = tuple(args)
+        return_value = memo.lookup(key)
+        if return_value is not MISSING:
+            operand_stack.append(return_value)
+            return frame
+    if methodref.wide is not None:
+        args = methodref.local_variables(args)
+    if target.max_locals > len(args):
+        args += repeat(None, target.max_locals - len(args))
+    callee = CompactFrame(target.cls, target.compact, args, frame)
+    if memo is not None:
+        callee.memo = memo
+        callee.memo_key = key
+    return callee
+
+
+def _invokedynamic(frame, index):
+    callsite = frame.cls.constant_pool.resolved[index]
+    if callsite.target is None:
+        raise NotImplementedError(f"'invokedynamic' cannot link {callsite.name} to {callsite.class_name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - callsite.arg_count
+    return_value = callsite.target(*operand_stack[split:])
+    del operand_stack[split:]
+    if callsite.return_kind != "V":
+        operand_stack.append(return_value)
+    return frame
+
+
+def _new(frame, index):
+    constant_pool = frame.cls.constant_pool
+    layout = constant_pool.resolved[index]
+    if layout is None:
+        raise NotImplementedError(f"'new' cannot resolve {constant_pool[constant_pool[index].name_index]}")
+    statics = layout.statics
+    if not statics.initialized:
+        statics.initialize()
+    frame.operand_stack.append(layout())
+    return frame
+
+
+def _newarray(frame, typecode):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = new_array(frame.code.objects[typecode], operand_stack[-1])
+    return frame
+
+
+def _anewarray(frame, _):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = new_reference_array(operand_stack[-1])
+    return frame
+
+
+def _arrayload(frame, _):
+    operand_stack = frame.operand_stack
+    index = operand_stack.pop()
+    array = operand_stack[-1]
+    # A negative index would count from the end of a Python sequence
+    if index < 0 or index >= len(array):
+        raise out_of_bounds(index, len(array))
+    operand_stack[-1] = array[index]
+    return frame
+
+
+def _arraystore(frame, convert):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop()
+    index = operand_stack.pop()
+    array = operand_stack.pop()
+    if index < 0 or index >= len(array):
+        raise out_of_bounds(index, len(array))
+    array[index] = value if convert < 0 else frame.code.objects[convert](value)
+    return frame
+
+
+def _arraylength(frame, _):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = len(operand_stack[-1])
+    return frame
+
+
+def _pop(frame, _):
+    frame.operand_stack.pop()
+    return frame
+
+
+def _dup(frame, _):
+    operand_stack = frame.operand_stack
+    operand_stack.append(operand_stack[-1])
+    return frame
+
+
+def _dup_x1(frame, _):
+    operand_stack = frame.operand_stack
+    operand_stack.insert(-2, operand_stack[-1])
+    return frame
+
+
+def _swap(frame, _):
+    operand_stack = frame.operand_stack
+    operand_stack[-1], operand_stack[-2] = operand_stack[-2], operand_stack[-1]
+    return frame
+
+
+def _return(frame, _):
+    return frame.caller
+
+
+def _value_return(frame, _):
+    caller = frame.caller
+    value = frame.operand_stack.pop()
+    if frame.memo is not None:
+        frame.memo.store(frame.memo_key, value)
+    if caller is None:
+        frame.return_value = value
+    else:
+        caller.operand_stack.append(value)
+    return caller
+
+
+def _unsupported(frame, instruction):
+    raise NotImplementedError(frame.code.objects[instruction])
+
+
+_HANDLERS = {
+    PUSH: _push, PUSH_NULL: _push_null, LDC: _ldc, LOAD: _load, STORE: _store, IINC: _iinc,
+    IADD: _iadd, ISUB: _isub, IMUL: _imul, ARITHMETIC2: _arithmetic2, ARITHMETIC1: _arithmetic1,
+    IFEQ: _ifeq, IFNE: _ifne, IFLT: _iflt, IFGE: _ifge, IFGT: _ifgt, IFLE: _ifle,
+    IF_ICMPEQ: _if_icmpeq, IF_ICMPNE: _if_icmpne, IF_ICMPLT: _if_icmplt, IF_ICMPGE: _if_icmpge,
+    IF_ICMPGT: _if_icmpgt, IF_ICMPLE: _if_icmple, IF_ACMPEQ: _if_acmpeq, IF_ACMPNE: _if_acmpne,
+    IFNULL: _ifnull, IFNONNULL: _ifnonnull, GOTO: _goto,
+    TABLESWITCH: _tableswitch, LOOKUPSWITCH: _lookupswitch,
+    GETSTATIC: _getstatic, PUTSTATIC: _putstatic, GETFIELD: _getfield, PUTFIELD: _putfield,
+    INVOKEVIRTUAL: _invokevirtual, INVOKESPECIAL: _invokespecial, INVOKESTATIC: _invokestatic,
+    INVOKEDYNAMIC: _invokedynamic, NEW: _new,
+    NEWARRAY: _newarray, ANEWARRAY: _anewarray, ARRAYLOAD: _arrayload, ARRAYSTORE: _arraystore,
+    ARRAYLENGTH: _arraylength,
+    POP: _pop, DUP: _dup, DUP_X1: _dup_x1, SWAP: _swap, RETURN: _return, VALUE_RETURN: _value_return,
+    UNSUPPORTED: _unsupported,
+}
+# Indexed by opcode
+HANDLERS = tuple(_HANDLERS[opcode] for opcode in range(len(_HANDLERS)))
+
+
+def execute(code: CompactCode, cls, local_variables):
+    """
+    Run a method whose code is encoded by `encode`, and so are those of its callees
+    """
+
+    frame = CompactFrame(cls, code, local_variables)
+    handlers = HANDLERS
+    opcodes, operands = code.opcodes, code.operands1
+    current = frame
+    while True:
+        pc = current.pc
+        current.pc = pc + 1
+        following = handlers[opcodes[pc]](current, operands[pc])
+        if following is not current:
+            if following is None:
+                return frame.return_value
+            current = following
+            code = current.code
+            opcodes, operands = code.opcodes, code.operands1
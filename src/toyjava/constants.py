@@ -1,19 +1,30 @@
 import logging
+import struct
 from dataclasses import dataclass
+from sys import intern
 
 logger = logging.getLogger(__name__)
 
 TAG_UTF8 = 1
+TAG_INTEGER = 3
+TAG_FLOAT = 4
+TAG_LONG = 5
+TAG_DOUBLE = 6
 TAG_CLASS = 7
 TAG_STRING = 8
 TAG_FIELDREF = 9
 TAG_METHODREF = 10
 TAG_NAME_AND_TYPE = 12
+TAG_METHOD_HANDLE = 15
+TAG_METHOD_TYPE = 16
+TAG_INVOKE_DYNAMIC = 18
 
 
 class ConstantPool:
     def __init__(self, constants):
         self._constants = constants
+        # Filled in by toyjava.linker.link and indexed like the constant pool itself
+        self.resolved = None
 
     def __getitem__(self, item):
         return self._constants[item - 1]
@@ -22,6 +33,30 @@ class ConstantPool:
         return len(self._constants)
 
 
+@dataclass
+class Integer:
+    value: int
+
+
+@dataclass
+class Float:
+    value: float
+
+
+@dataclass
+class Long:
+    value: int
+
+
+@dataclass
+class Double:
+    value: float
+
+
+# Constants that take two entries of the constant pool, the second of which is unusable
+WIDE_CONSTANTS = (Long, Double)
+
+
 @dataclass
 class String:
     string_index: int
@@ -50,6 +85,24 @@ class NameAndType:
     descriptor_index: int
 
 
+@dataclass
+class MethodHandle:
+    reference_kind: int
+    reference_index: int
+
+
+@dataclass
+class MethodType:
+    descriptor_index: int
+
+
+@dataclass
+class InvokeDynamic:
+    # An index into the BootstrapMethods attribute of the class
+    bootstrap_method_attr_index: int
+    name_and_type_index: int
+
+
 class ConstantPoolReader:
     """
     https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.4
@@ -60,27 +113,40 @@ class ConstantPoolReader:
         self.constant_pool_count = constant_pool_count
 
     def read(self) -> ConstantPool:
-        return ConstantPool(tuple(self._next() for _ in range(self.constant_pool_count - 1)))
+        constants = []
+        while len(constants) < self.constant_pool_count - 1:
+            constant = self._next()
+            constants.append(constant)
+            if isinstance(constant, WIDE_CONSTANTS):
+                constants.append(None)
+        return ConstantPool(tuple(constants))
 
     def _next(self):
         tag = self.reader.next_u1()
         if tag == TAG_UTF8:
             length = self.reader.next_u2()
-            bytes_ = self.reader.read(length)
-            info = {"tag": tag, "length": length, "bytes": bytes_}
-            logger.debug(f"Read a Utf8_info: {info}")
-            return bytes_.decode()
+            # The reader may return a memoryview, which has no decode()
+            value = str(self.reader.read(length), "utf-8")
+            logger.debug("Read a Utf8_info: %r", value)
+            return value
+
+        elif tag in NUMERIC_CONSTANTS:
+            constant_type, value_struct = NUMERIC_CONSTANTS[tag]
+            (value,) = value_struct.unpack(self.reader.read(value_struct.size))
+            info = constant_type(value)
+            logger.debug("Read a %s_info: %s", constant_type.__name__, info)
+            return info
 
         elif tag == TAG_CLASS:
             info = Class(
                 name_index=self._read_index()
             )
-            logger.debug(f"Read a Class_info: {info}")
+            logger.debug("Read a Class_info: %s", info)
             return info
 
         elif tag == TAG_STRING:
             info = String(string_index=self._read_index())
-            logger.debug(f"Read a String_info: {info}")
+            logger.debug("Read a String_info: %s", info)
             return info
 
         elif tag == TAG_FIELDREF:
@@ -88,7 +154,7 @@ class ConstantPoolReader:
                 class_index=self._read_index(),
                 name_and_type_index=self._read_index()
             )
-            logger.debug(f"Read a Fieldref_info: {info}")
+            logger.debug("Read a Fieldref_info: %s", info)
             return info
 
         elif tag == TAG_METHODREF:
@@ -96,7 +162,7 @@ class ConstantPoolReader:
                 class_index=self._read_index(),
                 name_and_type_index=self._read_index()
             )
-            logger.debug(f"Read a Methodref_info: {info}")
+            logger.debug("Read a Methodref_info: %s", info)
             return info
 
         elif tag == TAG_NAME_AND_TYPE:
@@ -104,7 +170,28 @@ class ConstantPoolReader:
                 name_index=self._read_index(),
                 descriptor_index=self._read_index()
             )
-            logger.debug(f"Read a NameAndType_info: {info}")
+            logger.debug("Read a NameAndType_info: %s", info)
+            return info
+
+        elif tag == TAG_METHOD_HANDLE:
+            info = MethodHandle(
+                reference_kind=self.reader.next_u1(),
+                reference_index=self._read_index()
+            )
+            logger.debug("Read a MethodHandle_info: %s", info)
+            return info
+
+        elif tag == TAG_METHOD_TYPE:
+            info = MethodType(descriptor_index=self._read_index())
+            logger.debug("Read a MethodType_info: %s", info)
+            return info
+
+        elif tag == TAG_INVOKE_DYNAMIC:
+            info = InvokeDynamic(
+                bootstrap_method_attr_index=self.reader.next_u2(),
+                name_and_type_index=self._read_index()
+            )
+            logger.debug("Read a InvokeDynamic_info: %s", info)
             return info
         else:
             raise NotImplementedError(tag)
@@ -113,3 +200,166 @@ class ConstantPoolReader:
         index = self.reader.next_u2()
         assert index in range(1, self.constant_pool_count)
         return index
+
+
+U2 = struct.Struct(">H")
+U2_U2 = struct.Struct(">HH")
+U1_U2 = struct.Struct(">BH")
+
+# tag -> (type, struct of the value)
+NUMERIC_CONSTANTS = {
+    TAG_INTEGER: (Integer, struct.Struct(">i")),
+    TAG_FLOAT: (Float, struct.Struct(">f")),
+    TAG_LONG: (Long, struct.Struct(">q")),
+    TAG_DOUBLE: (Double, struct.Struct(">d")),
+}
+
+
+def read_constant(buffer, offset: int, count: int):
+    """
+    Unpack the constant at an offset of a buffer and return it with the offset of the next constant
+    """
+
+    tag = buffer[offset]
+    if tag == TAG_UTF8:
+        (length,) = U2.unpack_from(buffer, offset + 1)
+        offset += 3
+        return str(buffer[offset:offset + length], "utf-8"), offset + length
+    elif tag in NUMERIC_CONSTANTS:
+        constant_type, value_struct = NUMERIC_CONSTANTS[tag]
+        (value,) = value_struct.unpack_from(buffer, offset + 1)
+        return constant_type(value), offset + 1 + value_struct.size
+    elif tag == TAG_CLASS or tag == TAG_STRING or tag == TAG_METHOD_TYPE:
+        (index,) = U2.unpack_from(buffer, offset + 1)
+        assert 0 < index < count
+        constant_type = Class if tag == TAG_CLASS else String if tag == TAG_STRING else MethodType
+        return constant_type(index), offset + 3
+    elif tag == TAG_FIELDREF or tag == TAG_METHODREF or tag == TAG_NAME_AND_TYPE:
+        index1, index2 = U2_U2.unpack_from(buffer, offset + 1)
+        assert 0 < index1 < count and 0 < index2 < count
+        if tag == TAG_FIELDREF:
+            return Fieldref(index1, index2), offset + 5
+        elif tag == TAG_METHODREF:
+            return Methodref(index1, index2), offset + 5
+        else:
+            return NameAndType(index1, index2), offset + 5
+    elif tag == TAG_METHOD_HANDLE:
+        kind, index = U1_U2.unpack_from(buffer, offset + 1)
+        assert 0 < index < count
+        return MethodHandle(kind, index), offset + 4
+    elif tag == TAG_INVOKE_DYNAMIC:
+        bootstrap_method_attr_index, index = U2_U2.unpack_from(buffer, offset + 1)
+        assert 0 < index < count
+        return InvokeDynamic(bootstrap_method_attr_index, index), offset + 5
+    else:
+        raise NotImplementedError(tag)
+
+
+def skip_constant(buffer, offset: int) -> int:
+    """
+    Return the offset of the constant following the one at an offset of a buffer
+    """
+
+    tag = buffer[offset]
+    if tag == TAG_UTF8:
+        (length,) = U2.unpack_from(buffer, offset + 1)
+        return offset + 3 + length
+    elif tag in NUMERIC_CONSTANTS:
+        return offset + 1 + NUMERIC_CONSTANTS[tag][1].size
+    elif tag == TAG_CLASS or tag == TAG_STRING or tag == TAG_METHOD_TYPE:
+        return offset + 3
+    elif tag == TAG_METHOD_HANDLE:
+        return offset + 4
+    elif tag == TAG_FIELDREF or tag == TAG_METHODREF or tag == TAG_NAME_AND_TYPE or tag == TAG_INVOKE_DYNAMIC:
+        return offset + 5
+    else:
+        raise NotImplementedError(tag)
+
+
+class BufferConstantPoolReader:
+    """
+    A ConstantPoolReader that unpacks the entries straight from the buffer of a BufferReader
+    """
+
+    def __init__(self, reader, constant_pool_count: int):
+        self.reader = reader
+        self.constant_pool_count = constant_pool_count
+
+    def read(self) -> ConstantPool:
+        buffer = self.reader.buffer
+        offset = self.reader.offset
+        count = self.constant_pool_count
+        constants = []
+        while len(constants) < count - 1:
+            constant, offset = read_constant(buffer, offset, count)
+            constants.append(constant)
+            if isinstance(constant, WIDE_CONSTANTS):
+                constants.append(None)
+        self.reader.offset = offset
+        logger.debug("Read %s constants", len(constants))
+        return ConstantPool(tuple(constants))
+
+
+_UNDECODED = object()
+
+
+class LazyConstantPool(ConstantPool):
+    """
+    A constant pool that only knows the offset of each constant until it is looked up
+
+    The offset of the unusable entry following a long or double constant is None.
+    """
+
+    def __init__(self, buffer, offsets: list, constant_pool_count: int):
+        super().__init__([_UNDECODED if offset is not None else None for offset in offsets])
+        self._buffer = buffer
+        self._offsets = offsets
+        self._constant_pool_count = constant_pool_count
+
+    def __getitem__(self, item):
+        constant = self._constants[item - 1]
+        if constant is _UNDECODED:
+            constant, _ = read_constant(self._buffer, self._offsets[item - 1], self._constant_pool_count)
+            self._constants[item - 1] = constant
+        return constant
+
+    def decoded_count(self) -> int:
+        return sum(1 for c in self._constants if c is not _UNDECODED and c is not None)
+
+
+class LazyConstantPoolReader:
+    """
+    A ConstantPoolReader that records the offset of each constant in the buffer of a BufferReader
+    """
+
+    def __init__(self, reader, constant_pool_count: int):
+        self.reader = reader
+        self.constant_pool_count = constant_pool_count
+
+    def read(self) -> LazyConstantPool:
+        buffer = self.reader.buffer
+        offset = self.reader.offset
+        offsets = []
+        while len(offsets) < self.constant_pool_count - 1:
+            offsets.append(offset)
+            if buffer[offset] == TAG_LONG or buffer[offset] == TAG_DOUBLE:
+                offsets.append(None)
+            offset = skip_constant(buffer, offset)
+        self.reader.offset = offset
+        logger.debug("Indexed %s constants", len(offsets))
+        return LazyConstantPool(buffer, offsets, self.constant_pool_count)
+
+
+def loadable_value(constant_pool, index: int):
+    """
+    Return the value that ldc, ldc_w or ldc2_w pushes for a constant
+
+    Strings are interned, so the equal String constants of all classes are the same object as in Java.
+    """
+
+    c = constant_pool[index]
+    if isinstance(c, String):
+        return intern(constant_pool[c.string_index])
+    if isinstance(c, (Integer, Float, Long, Double)):
+        return c.value
+    raise NotImplementedError(c)
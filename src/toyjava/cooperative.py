@@ -0,0 +1,63 @@
+"""
+Run methods as asyncio coroutines that give the event loop a turn every slice of instructions
+
+The dispatch engine keeps the Java call stack in Frames, so toyjava.dispatch.execute_sliced can pause anywhere
+between two instructions. Each pause awaits asyncio.sleep(0), which puts the task at the back of the ready queue:
+programs running concurrently in one event loop take turns of `slice_size` instructions each.
+A task cancelled while it is paused stops there with CancelledError.
+
+Instructions are counted as the engine runs them, so a peephole-fused instruction counts once.
+<clinit> methods and natives run within a slice, uncounted.
+"""
+
+import asyncio
+import time
+
+from toyjava import dispatch
+
+# Interpreting a slice takes about a millisecond, which keeps the latency of the event loop low
+# while the cost of the pauses stays small
+SLICE_SIZE = 5000
+
+
+class InstructionBudgetExceeded(RuntimeError):
+    pass
+
+
+class TimeBudgetExceeded(TimeoutError):
+    pass
+
+
+async def execute(instructions, cls, local_variables, optimize=False, slice_size: int = SLICE_SIZE,
+                  max_instructions: int | None = None, timeout: float | None = None):
+    """
+    Run a method like toyjava.dispatch.execute and return its return value
+
+    It raises InstructionBudgetExceeded if the method needs more than `max_instructions` instructions
+    and TimeBudgetExceeded if it takes longer than `timeout` seconds, which is checked after every slice.
+    """
+
+    if slice_size < 1:
+        raise ValueError(f"The slice size must be positive: {slice_size}")
+    deadline = None if timeout is None else time.monotonic() + timeout
+    remaining = max_instructions
+    steps = dispatch.execute_sliced(instructions, cls, local_variables, optimize)
+    steps.send(None)
+    try:
+        while True:
+            if remaining is None:
+                count = slice_size
+            elif remaining > 0:
+                count = min(slice_size, remaining)
+                remaining -= count
+            else:
+                raise InstructionBudgetExceeded(f"The budget of {max_instructions} instructions is exhausted")
+            try:
+                steps.send(count)
+            except StopIteration as e:
+                return e.value
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeBudgetExceeded(f"The budget of {timeout} seconds is exhausted")
+            await asyncio.sleep(0)
+    finally:
+        steps.close()
@@ -0,0 +1,571 @@
+"""
+An interpreter that dispatches each instruction through a handler table keyed by its type
+
+Calls between Java methods do not nest Python calls: invokestatic pushes a Frame linked to its caller
+and the return instructions pop it, so the depth of Java recursion is bounded by memory only.
+"""
+
+from itertools import repeat
+
+from toyjava.arithmetic import wrap_int
+from toyjava.arrays import new_array, new_reference_array, out_of_bounds
+from toyjava.instructions import Getstatic, Ldc, Invokevirtual, Return, Istore1, Iload1, Istore2, Iload2, Iinc, Goto, \
+    Push, Ifne, BranchIf2, InvokeStatic, Iload0, Ireturn, Arithmetic1, Arithmetic2, Iload, Istore, BranchIf1, \
+    Tableswitch, Lookupswitch, Newarray, Anewarray, Arrayload, Arraystore, Arraylength, Invokespecial, New, Getfield, \
+    Putfield, Pop, Dup, DupX1, Swap, LoadLoadArithmetic, LoadConstArithmetic, BranchIfLocals, BranchIfLocalConst, \
+    IincGoto, Putstatic, Invokedynamic, Iadd, Isub, Imul, IaddLocalConst, IaddLocals, IsubLocals
+from toyjava.memoization import MISSING, memo_of
+from toyjava.objects import NullPointerError, null_field_access, virtual_method
+
+
+class Frame:
+    __slots__ = ("cls", "instructions", "local_variables", "operand_stack", "pc", "return_value", "optimize", "caller",
+                 "memo", "memo_key")
+
+    def __init__(self, cls, instructions, local_variables, optimize=False, caller=None):
+        self.cls = cls
+        self.instructions = instructions
+        self.local_variables = local_variables
+        self.operand_stack = []
+        self.pc = 0
+        # Set when the method returns a value to no caller
+        self.return_value = None
+        # Whether callees run their peephole-optimized instructions
+        self.optimize = optimize
+        self.caller = caller
+        # The Memo that stores the return value under `memo_key`, if the method is memoized
+        self.memo = None
+
+
+# Each handler is called with `frame.pc` already pointing to the next instruction.
+# It returns the frame to continue with: the same one, a callee, or the caller when the method returns,
+# which is None for the frame that `execute` started with.
+
+def _unresolved_field(frame, instruction, mnemonic: str) -> NotImplementedError:
+    field = frame.cls.constant_pool.resolved[instruction.index]
+    return NotImplementedError(f"'{mnemonic}' cannot resolve {field.class_name}.{field.name}")
+
+
+def _getstatic(frame, instruction):
+    cell = frame.cls.constant_pool.resolved[instruction.index].cell
+    if cell is None:
+        raise _unresolved_field(frame, instruction, "getstatic")
+    frame.operand_stack.append(cell.value)
+    return frame
+
+
+def _putstatic(frame, instruction):
+    cell = frame.cls.constant_pool.resolved[instruction.index].cell
+    if cell is None:
+        raise _unresolved_field(frame, instruction, "putstatic")
+    cell.value = frame.operand_stack.pop()
+    return frame
+
+
+def _ldc(frame, instruction):
+    # Resolved once by the linker, so a string is looked up and interned only once
+    frame.operand_stack.append(frame.cls.constant_pool.resolved[instruction.index])
+    return frame
+
+
+def _call(frame, methodref, target, args):
+    """
+    Return the frame of an instance method whose receiver and arguments are `args`
+    """
+
+    if methodref.wide is not None:
+        args = args[:1] + methodref.local_variables(args[1:])
+    if target.max_locals > len(args):
+        args += repeat(None, target.max_locals - len(args))
+    if frame.optimize:
+        return Frame(target.cls, target.optimized, args, True, frame)
+    return Frame(target.cls, target.instructions, args, False, frame)
+
+
+def _invokevirtual(frame, instruction):
+    methodref = frame.cls.constant_pool.resolved[instruction.index]
+    # Pop the arguments and the object reference
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count - 1
+    args = operand_stack[split:]
+    del operand_stack[split:]
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+
+    receiver = args[0]
+    if receiver is None:
+        raise NullPointerError(f"Cannot invoke {methodref.class_name}.{methodref.name} on null")
+    return _call(frame, methodref, virtual_method(type(receiver), methodref.name, methodref.descriptor), args)
+
+
+def _invokespecial(frame, instruction):
+    methodref = frame.cls.constant_pool.resolved[instruction.index]
+    if methodref.target is None:
+        raise NotImplementedError(f"'invokespecial' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count - 1
+    args = operand_stack[split:]
+    del operand_stack[split:]
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+    return _call(frame, methodref, methodref.target, args)
+
+
+def _invokestatic(frame, instruction):
+    cls = frame.cls
+    methodref = cls.constant_pool.resolved[instruction.index]
+    if methodref.target is None:
+        raise NotImplementedError(f"'invokestatic' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count
+    args = operand_stack[split:]
+    del operand_stack[split:]
+
+    if methodref.native:
+        return_value = methodref.target(*args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+
+    target = methodref.target
+    statics = target.cls.statics
+    if not statics.initialized:
+        statics.initialize()
+    memo = memo_of(target)
+    if memo is not None:
+        key = tuple(args)
+        return_value = memo.lookup(key)
+        if return_value is not MISSING:
+            operand_stack.append(return_value)
+            return frame
+    # The arguments become the first local variables
+    if methodref.wide is not None:
+        args = methodref.local_variables(args)
+    if target.max_locals > len(args):
+        args += repeat(None, target.max_locals - len(args))
+    if frame.optimize:
+        callee = Frame(target.cls, target.optimized, args, True, frame)
+    else:
+        callee = Frame(target.cls, target.instructions, args, False, frame)
+    if memo is not None:
+        callee.memo = memo
+        callee.memo_key = key
+    return callee
+
+
+def _invokedynamic(frame, instruction):
+    callsite = frame.cls.constant_pool.resolved[instruction.index]
+    if callsite.target is None:
+        raise NotImplementedError(f"'invokedynamic' cannot link {callsite.name} to {callsite.class_name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - callsite.arg_count
+    return_value = callsite.target(*operand_stack[split:])
+    del operand_stack[split:]
+    if callsite.return_kind != "V":
+        operand_stack.append(return_value)
+    return frame
+
+
+def _new(frame, instruction):
+    constant_pool = frame.cls.constant_pool
+    layout = constant_pool.resolved[instruction.index]
+    if layout is None:
+        raise NotImplementedError(f"'new' cannot resolve {constant_pool[constant_pool[instruction.index].name_index]}")
+    statics = layout.statics
+    if not statics.initialized:
+        statics.initialize()
+    frame.operand_stack.append(layout())
+    return frame
+
+
+def _getfield(frame, instruction):
+    operand_stack = frame.operand_stack
+    fieldref = frame.cls.constant_pool.resolved[instruction.index]
+    objectref = operand_stack[-1]
+    if objectref is None:
+        raise null_field_access(fieldref)
+    operand_stack[-1] = getattr(objectref, fieldref.slot)
+    return frame
+
+
+def _putfield(frame, instruction):
+    operand_stack = frame.operand_stack
+    fieldref = frame.cls.constant_pool.resolved[instruction.index]
+    value = operand_stack.pop()
+    objectref = operand_stack.pop()
+    if objectref is None:
+        raise null_field_access(fieldref)
+    setattr(objectref, fieldref.slot, value)
+    return frame
+
+
+def _pop(frame, instruction):
+    frame.operand_stack.pop()
+    return frame
+
+
+def _dup(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack.append(operand_stack[-1])
+    return frame
+
+
+def _dup_x1(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack.insert(-2, operand_stack[-1])
+    return frame
+
+
+def _swap(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack[-1], operand_stack[-2] = operand_stack[-2], operand_stack[-1]
+    return frame
+
+
+def _return(frame, instruction):
+    return frame.caller
+
+
+def _ireturn(frame, instruction):
+    caller = frame.caller
+    value = frame.operand_stack.pop()
+    if frame.memo is not None:
+        frame.memo.store(frame.memo_key, value)
+    if caller is None:
+        frame.return_value = value
+    else:
+        caller.operand_stack.append(value)
+    return caller
+
+
+def _push(frame, instruction):
+    frame.operand_stack.append(instruction.value)
+    return frame
+
+
+def _arithmetic2(frame, instruction):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    value1 = operand_stack.pop()
+    operand_stack.append(instruction.function(value1, value2))
+    return frame
+
+
+def _arithmetic1(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = instruction.function(operand_stack[-1])
+    return frame
+
+
+def _istore1(frame, instruction):
+    frame.local_variables[1] = frame.operand_stack.pop()
+    return frame
+
+
+def _istore2(frame, instruction):
+    frame.local_variables[2] = frame.operand_stack.pop()
+    return frame
+
+
+def _istore(frame, instruction):
+    frame.local_variables[instruction.index] = frame.operand_stack.pop()
+    return frame
+
+
+def _iload(frame, instruction):
+    frame.operand_stack.append(frame.local_variables[instruction.index])
+    return frame
+
+
+def _iload0(frame, instruction):
+    frame.operand_stack.append(frame.local_variables[0])
+    return frame
+
+
+def _iload1(frame, instruction):
+    frame.operand_stack.append(frame.local_variables[1])
+    return frame
+
+
+def _iload2(frame, instruction):
+    frame.operand_stack.append(frame.local_variables[2])
+    return frame
+
+
+def _newarray(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = new_array(instruction.typecode, operand_stack[-1])
+    return frame
+
+
+def _anewarray(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = new_reference_array(operand_stack[-1])
+    return frame
+
+
+def _arrayload(frame, instruction):
+    operand_stack = frame.operand_stack
+    index = operand_stack.pop()
+    array = operand_stack[-1]
+    # A negative index would count from the end of a Python sequence
+    if index < 0 or index >= len(array):
+        raise out_of_bounds(index, len(array))
+    operand_stack[-1] = array[index]
+    return frame
+
+
+def _arraystore(frame, instruction):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop()
+    index = operand_stack.pop()
+    array = operand_stack.pop()
+    if index < 0 or index >= len(array):
+        raise out_of_bounds(index, len(array))
+    array[index] = value if instruction.convert is None else instruction.convert(value)
+    return frame
+
+
+def _arraylength(frame, instruction):
+    operand_stack = frame.operand_stack
+    operand_stack[-1] = len(operand_stack[-1])
+    return frame
+
+
+def _ifne(frame, instruction):
+    if frame.operand_stack.pop() != 0:
+        frame.pc = instruction.index
+    return frame
+
+
+def _branch_if2(frame, instruction):
+    operand_stack = frame.operand_stack
+    v2 = operand_stack.pop()
+    v1 = operand_stack.pop()
+    if instruction.predicate(v1, v2):
+        frame.pc = instruction.index
+    return frame
+
+
+def _branch_if1(frame, instruction):
+    if instruction.predicate(frame.operand_stack.pop(), instruction.operand):
+        frame.pc = instruction.index
+    return frame
+
+
+def _tableswitch(frame, instruction):
+    i = frame.operand_stack.pop() - instruction.low
+    indices = instruction.indices
+    frame.pc = indices[i] if 0 <= i < len(indices) else instruction.default
+    return frame
+
+
+def _lookupswitch(frame, instruction):
+    frame.pc = instruction.indices.get(frame.operand_stack.pop(), instruction.default)
+    return frame
+
+
+def _iinc(frame, instruction):
+    local_variables = frame.local_variables
+    value = local_variables[instruction.index] + instruction.const
+    local_variables[instruction.index] = value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value)
+    return frame
+
+
+def _goto(frame, instruction):
+    frame.pc = instruction.index
+    return frame
+
+
+def _load_load_arithmetic(frame, instruction):
+    local_variables = frame.local_variables
+    frame.operand_stack.append(
+        instruction.function(local_variables[instruction.first], local_variables[instruction.second])
+    )
+    return frame
+
+
+def _load_const_arithmetic(frame, instruction):
+    frame.operand_stack.append(instruction.function(frame.local_variables[instruction.local], instruction.value))
+    return frame
+
+
+def _branch_if_locals(frame, instruction):
+    local_variables = frame.local_variables
+    if instruction.predicate(local_variables[instruction.first], local_variables[instruction.second]):
+        frame.pc = instruction.index
+    return frame
+
+
+def _branch_if_local_const(frame, instruction):
+    if instruction.predicate(frame.local_variables[instruction.local], instruction.value):
+        frame.pc = instruction.index
+    return frame
+
+
+def _iinc_goto(frame, instruction):
+    local_variables = frame.local_variables
+    value = local_variables[instruction.local] + instruction.const
+    local_variables[instruction.local] = value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value)
+    frame.pc = instruction.index
+    return frame
+
+
+# The handlers of the int-specialized instructions, which wrap results like toyjava.arithmetic without calling it
+
+def _iadd(frame, instruction):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop() + operand_stack.pop()
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _isub(frame, instruction):
+    operand_stack = frame.operand_stack
+    value2 = operand_stack.pop()
+    value = operand_stack.pop() - value2
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _imul(frame, instruction):
+    operand_stack = frame.operand_stack
+    value = operand_stack.pop() * operand_stack.pop()
+    operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _iadd_local_const(frame, instruction):
+    value = frame.local_variables[instruction.local] + instruction.value
+    frame.operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _iadd_locals(frame, instruction):
+    local_variables = frame.local_variables
+    value = local_variables[instruction.first] + local_variables[instruction.second]
+    frame.operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+def _isub_locals(frame, instruction):
+    local_variables = frame.local_variables
+    value = local_variables[instruction.first] - local_variables[instruction.second]
+    frame.operand_stack.append(value if -0x8000_0000 <= value <= 0x7FFF_FFFF else wrap_int(value))
+    return frame
+
+
+HANDLERS = {
+    Getstatic: _getstatic,
+    Putstatic: _putstatic,
+    Ldc: _ldc,
+    Invokevirtual: _invokevirtual,
+    InvokeStatic: _invokestatic,
+    Invokespecial: _invokespecial,
+    Invokedynamic: _invokedynamic,
+    New: _new,
+    Getfield: _getfield,
+    Putfield: _putfield,
+    Pop: _pop,
+    Dup: _dup,
+    DupX1: _dup_x1,
+    Swap: _swap,
+    Return: _return,
+    Ireturn: _ireturn,
+    Push: _push,
+    Arithmetic1: _arithmetic1,
+    Arithmetic2: _arithmetic2,
+    Istore: _istore,
+    Istore1: _istore1,
+    Istore2: _istore2,
+    Iload: _iload,
+    Iload0: _iload0,
+    Iload1: _iload1,
+    Iload2: _iload2,
+    Newarray: _newarray,
+    Anewarray: _anewarray,
+    Arrayload: _arrayload,
+    Arraystore: _arraystore,
+    Arraylength: _arraylength,
+    Ifne: _ifne,
+    BranchIf1: _branch_if1,
+    BranchIf2: _branch_if2,
+    Tableswitch: _tableswitch,
+    Lookupswitch: _lookupswitch,
+    Iinc: _iinc,
+    Goto: _goto,
+    LoadLoadArithmetic: _load_load_arithmetic,
+    LoadConstArithmetic: _load_const_arithmetic,
+    BranchIfLocals: _branch_if_locals,
+    BranchIfLocalConst: _branch_if_local_const,
+    IincGoto: _iinc_goto,
+    Iadd: _iadd,
+    Isub: _isub,
+    Imul: _imul,
+    IaddLocalConst: _iadd_local_const,
+    IaddLocals: _iadd_locals,
+    IsubLocals: _isub_locals,
+}
+
+
+def execute(instructions, cls, local_variables, optimize=False):
+    """
+    Run a method; if `optimize` is true, `instructions` are expected to be peephole-optimized
+    and so are those that callees run
+    """
+
+    frame = Frame(cls, instructions, local_variables, optimize)
+    handlers = HANDLERS
+    current = frame
+    while True:
+        instruction = instructions[current.pc]
+        current.pc += 1
+        try:
+            handler = handlers[type(instruction)]
+        except KeyError:
+            raise NotImplementedError(instruction) from None
+        following = handler(current, instruction)
+        if following is not current:
+            if following is None:
+                return frame.return_value
+            current = following
+            instructions = current.instructions
+
+
+def execute_sliced(instructions, cls, local_variables, optimize=False):
+    """
+    A generator that runs a method like `execute`, pausing after each slice of instructions
+
+    It is sent the number of instructions of each slice and yields once they have run.
+    The return value of the method is the value of the StopIteration that ends it.
+    Since the Java call stack is a chain of Frames, a pause never leaves a Python call of the program in progress.
+    """
+
+    frame = Frame(cls, instructions, local_variables, optimize)
+    handlers = HANDLERS
+    current = frame
+    count = yield
+    while True:
+        for _ in repeat(None, count):
+            instruction = instructions[current.pc]
+            current.pc += 1
+            try:
+                handler = handlers[type(instruction)]
+            except KeyError:
+                raise NotImplementedError(instruction) from None
+            following = handler(current, instruction)
+            if following is not current:
+                if following is None:
+                    return frame.return_value
+                current = following
+                instructions = current.instructions
+        count = yield
@@ -1,8 +1,11 @@
 import operator as op
+import struct
 from dataclasses import dataclass
-from io import BytesIO
 from typing import BinaryIO
-from collections.abc import Iterable, Callable
+from collections.abc import Callable
+
+from toyjava import arithmetic
+from toyjava.arrays import TYPECODES
 
 CODE_iconst_m1 = b"\x02"
 CODE_iconst_0 = b"\x03"
@@ -30,6 +33,12 @@ class Getstatic:
     index: int
 
 
+@dataclass
+class Putstatic:
+    CODE = b"\xb3"
+    index: int
+
+
 @dataclass
 class Ldc:
     CODE = b"\x12"
@@ -42,6 +51,54 @@ class Invokevirtual:
     index: int
 
 
+@dataclass
+class Invokespecial:
+    """
+    https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-6.html#jvms-6.5.invokespecial
+    """
+
+    CODE = b"\xb7"
+    index: int
+
+
+@dataclass
+class New:
+    CODE = b"\xbb"
+    index: int
+
+
+@dataclass
+class Getfield:
+    CODE = b"\xb4"
+    index: int
+
+
+@dataclass
+class Putfield:
+    CODE = b"\xb5"
+    index: int
+
+
+@dataclass
+class Pop:
+    CODE = b"W"
+
+
+@dataclass
+class Dup:
+    CODE = b"Y"
+
+
+@dataclass
+class DupX1:
+    CODE = b"Z"
+
+
+@dataclass
+class Swap:
+    CODE = b"_"
+
+
 @dataclass
 class Return:
     CODE = b"\xb1"
@@ -83,16 +140,59 @@ class Iload2:
 
 
 @dataclass
-class UnresolvedBranchIf2:
+class Iload:
+    """
+    iload, and iload_3 which has no class of its own
+    """
+
+    index: int
+
+
+@dataclass
+class Istore:
+    """
+    istore, and istore_0 and istore_3 which have no classes of their own
+    """
+
+    index: int
+
+
+class UnresolvedBranch:
+    """
+    A branch whose target is still a byte offset relative to the branch instruction
+    """
+
+    def resolve(self, position: int, indices: dict):
+        raise NotImplementedError
+
+
+@dataclass
+class UnresolvedBranchIf2(UnresolvedBranch):
+    offset: int
+    predicate: Callable[[int, int], bool]
+
+    def resolve(self, position: int, indices: dict):
+        return BranchIf2(indices[position + self.offset], self.predicate)
+
+
+@dataclass
+class UnresolvedBranchIf1(UnresolvedBranch):
     offset: int
     predicate: Callable[[int, int], bool]
+    operand: int | None = 0
+
+    def resolve(self, position: int, indices: dict):
+        return BranchIf1(indices[position + self.offset], self.predicate, self.operand)
 
 
 @dataclass
-class RawIfne:
+class RawIfne(UnresolvedBranch):
     CODE = b"\x9a"
     branchbyte: int
 
+    def resolve(self, position: int, indices: dict):
+        return Ifne(indices[position + self.branchbyte])
+
 
 @dataclass
 class Iinc:
@@ -107,10 +207,95 @@ class Arithmetic2:
 
 
 @dataclass
-class RawGoto:
+class Arithmetic1:
+    """
+    Replace the value on top of the operand stack with `function(value)`, e.g. ineg and the conversions
+    """
+
+    function: Callable[[int], int]
+
+
+@dataclass
+class Newarray:
+    """
+    newarray, with its atype operand translated into the type code of an array.array (see toyjava.arrays)
+    """
+
+    typecode: str
+
+
+@dataclass
+class Anewarray:
+    # The index of the component class, which is not resolved
+    index: int
+
+
+@dataclass
+class Arrayload:
+    """
+    Any <t>aload: push array[index]
+    """
+
+
+@dataclass
+class Arraystore:
+    """
+    Any <t>astore: array[index] = convert(value), where `convert` narrows an int to a byte, char or short
+    """
+
+    convert: Callable[[int], int] | None = None
+
+
+@dataclass
+class Arraylength:
+    pass
+
+
+@dataclass
+class RawGoto(UnresolvedBranch):
     CODE = b"\xa7"
     branchbyte: int
 
+    def resolve(self, position: int, indices: dict):
+        return Goto(indices[position + self.branchbyte])
+
+
+@dataclass
+class RawTableswitch(UnresolvedBranch):
+    default: int
+    low: int
+    offsets: tuple
+
+    def resolve(self, position: int, indices: dict):
+        return Tableswitch(
+            indices[position + self.default],
+            self.low,
+            tuple(indices[position + offset] for offset in self.offsets),
+        )
+
+
+@dataclass
+class RawLookupswitch(UnresolvedBranch):
+    default: int
+    # (match, offset) pairs
+    pairs: tuple
+
+    def resolve(self, position: int, indices: dict):
+        return Lookupswitch(
+            indices[position + self.default],
+            {match: indices[position + offset] for match, offset in self.pairs},
+        )
+
+
+@dataclass
+class Generic:
+    """
+    An instruction that is decoded but not executed by any engine
+    """
+
+    mnemonic: str
+    operands: tuple = ()
+
 
 @dataclass
 class InvokeStatic:
@@ -118,92 +303,23 @@ class InvokeStatic:
     index: int
 
 
+@dataclass
+class Invokedynamic:
+    """
+    https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-6.html#jvms-6.5.invokedynamic
+    """
+
+    CODE = b"\xba"
+    # The index of an InvokeDynamic constant, whose call site is linked by toyjava.linker.resolve
+    index: int
+
+
 class InstructionReader:
     def __init__(self, stream: BinaryIO):
         self.stream = stream
 
-    def _read_index(self, bytes_length: int) -> int:
-        return int.from_bytes(self.stream.read(bytes_length), "big")
-
-    def _read_sint(self, bytes_length: int) -> int:
-        return int.from_bytes(self.stream.read(bytes_length), "big", signed=True)
-
-    def _read(self) -> Iterable:
-        while True:
-            code = self.stream.read(1)
-            if code == b"":
-                break
-            elif code == Getstatic.CODE:
-                yield Getstatic(self._read_index(2))
-            elif code == Ldc.CODE:
-                yield Ldc(self._read_index(1))
-            elif code == Invokevirtual.CODE:
-                yield Invokevirtual(self._read_index(2))
-            elif code == InvokeStatic.CODE:
-                yield InvokeStatic(self._read_index(2))
-            elif code == Return.CODE:
-                yield Return()
-            elif code == Ireturn.CODE:
-                yield Ireturn()
-            elif code == CODE_iconst_m1:
-                yield Push(-1)
-            elif code == CODE_iconst_0:
-                yield Push(0)
-            elif code == CODE_iconst_1:
-                yield Push(1)
-            elif code == CODE_iconst_2:
-                yield Push(2)
-            elif code == CODE_iconst_3:
-                yield Push(3)
-            elif code == CODE_iconst_4:
-                yield Push(4)
-            elif code == CODE_iconst_5:
-                yield Push(5)
-            elif code == CODE_irem:
-                yield Arithmetic2(function=op.mod)
-            elif code == CODE_iadd:
-                yield Arithmetic2(function=op.add)
-            elif code == CODE_isub:
-                yield Arithmetic2(function=op.sub)
-            elif code == CODE_imul:
-                yield Arithmetic2(function=op.mul)
-            elif code == CODE_bipush:
-                yield Push(self._read_sint(1))
-            elif code == Istore1.CODE:
-                yield Istore1()
-            elif code == Istore2.CODE:
-                yield Istore2()
-            elif code == Iload0.CODE:
-                yield Iload0()
-            elif code == Iload1.CODE:
-                yield Iload1()
-            elif code == Iload2.CODE:
-                yield Iload2()
-            elif code == RawIfne.CODE:
-                branchbyte = self._read_index(2)
-                yield RawIfne(branchbyte)
-            elif code == CODE_if_icmpge:
-                yield UnresolvedBranchIf2(offset=self._read_sint(2), predicate=op.ge)
-            elif code == CODE_if_icmpgt:
-                yield UnresolvedBranchIf2(offset=self._read_sint(2), predicate=op.gt)
-            elif code == Iinc.CODE:
-                yield Iinc(self._read_index(1), self._read_index(1))
-            elif code == RawGoto.CODE:
-                b = self.stream.read(2)
-                yield RawGoto(int.from_bytes(b, "big", signed=True))
-            else:
-                raise NotImplementedError(code)
-
     def read(self):
-        raw_instructions = []
-        positions = [0]
-        for raw_instruction in self._read():
-            raw_instructions.append(raw_instruction)
-            positions.append(self.stream.tell())
-
-        positions.pop()
-
-        return tuple(raw_instructions), positions
+        return decode(self.stream.read())
 
 
 @dataclass
@@ -217,6 +333,17 @@ class BranchIf2:
     predicate: Callable[[int, int], bool]
 
 
+@dataclass
+class BranchIf1:
+    """
+    Branch if `predicate(value, operand)` holds for the popped value
+    """
+
+    index: int
+    predicate: Callable[[int, int], bool]
+    operand: int | None = 0
+
+
 @dataclass
 class IfIcmpge:
     index: int
@@ -232,25 +359,462 @@ class Goto:
     index: int
 
 
+@dataclass
+class Tableswitch:
+    default: int
+    low: int
+    # The target index for each value from `low`
+    indices: tuple
+
+
+@dataclass
+class Lookupswitch:
+    default: int
+    # match -> target index
+    indices: dict
+
+
+# Superinstructions, which toyjava.peephole makes from common sequences of the instructions above
+
+
+@dataclass
+class LoadLoadArithmetic:
+    """
+    Iload(first), Iload(second), Arithmetic2(function)
+    """
+
+    first: int
+    second: int
+    function: Callable[[int, int], int]
+
+
+@dataclass
+class LoadConstArithmetic:
+    """
+    Iload(local), Push(value), Arithmetic2(function)
+    """
+
+    local: int
+    value: int
+    function: Callable[[int, int], int]
+
+
+@dataclass
+class BranchIfLocals:
+    """
+    Iload(first), Iload(second), BranchIf2(index, predicate)
+    """
+
+    index: int
+    first: int
+    second: int
+    predicate: Callable[[int, int], bool]
+
+
+@dataclass
+class BranchIfLocalConst:
+    """
+    Iload(local), Push(value), BranchIf2(index, predicate)
+    """
+
+    index: int
+    local: int
+    value: int
+    predicate: Callable[[int, int], bool]
+
+
+@dataclass
+class IincGoto:
+    """
+    Iinc(local, const), Goto(index)
+    """
+
+    index: int
+    local: int
+    const: int
+
+
+# Int-specialized instructions, which toyjava.peephole.specialize substitutes in the methods that toyjava.verifier
+# proves to compute with ints only. Their handlers spell out the operation instead of calling toyjava.arithmetic.
+
+
+@dataclass
+class Iadd:
+    pass
+
+
+@dataclass
+class Isub:
+    pass
+
+
+@dataclass
+class Imul:
+    pass
+
+
+@dataclass
+class IaddLocalConst:
+    """
+    LoadConstArithmetic(local, value, iadd), and LoadConstArithmetic(local, -value, isub)
+    """
+
+    local: int
+    value: int
+
+
+@dataclass
+class IaddLocals:
+    """
+    LoadLoadArithmetic(first, second, iadd)
+    """
+
+    first: int
+    second: int
+
+
+@dataclass
+class IsubLocals:
+    """
+    LoadLoadArithmetic(first, second, isub)
+    """
+
+    first: int
+    second: int
+
+
+# The control flow of decoded instructions, for the passes over whole methods
+
+LOADS = {Iload0: 0, Iload1: 1, Iload2: 2}
+STORES = {Istore1: 1, Istore2: 2}
+SWITCHES = (Tableswitch, Lookupswitch)
+# Instructions whose `index` is a branch target
+JUMPS = (Goto, Ifne, BranchIf1, BranchIf2, BranchIfLocalConst, BranchIfLocals, IincGoto)
+BRANCHES = JUMPS + SWITCHES
+# Instructions that never continue with the following one
+TERMINATORS = (Goto, IincGoto, Return, Ireturn) + SWITCHES
+
+
+def load_index(instruction) -> int | None:
+    """
+    The local variable that an int load reads, None if the instruction is none
+    """
+
+    if isinstance(instruction, Iload):
+        return instruction.index
+    return LOADS.get(type(instruction))
+
+
+def store_index(instruction) -> int | None:
+    """
+    The local variable that an int store writes, None if the instruction is none
+    """
+
+    if isinstance(instruction, Istore):
+        return instruction.index
+    return STORES.get(type(instruction))
+
+
+def switch_targets(instruction) -> dict:
+    if isinstance(instruction, Tableswitch):
+        return {instruction.low + i: index for i, index in enumerate(instruction.indices)}
+    return instruction.indices
+
+
+def branch_targets(instruction) -> list:
+    """
+    The indices of the instructions that an instruction may branch to, none if it is not a branch
+    """
+
+    if isinstance(instruction, JUMPS):
+        return [instruction.index]
+    if isinstance(instruction, SWITCHES):
+        return [instruction.default, *switch_targets(instruction).values()]
+    return []
+
+
+@dataclass(frozen=True)
+class Opcode:
+    """
+    How to decode an opcode: `operands` is a struct format for the operands following the opcode,
+    or None if the operands have a variable length.
+    `factory` makes an instruction from the unpacked operands.
+    """
+
+    mnemonic: str
+    operands: struct.Struct | None
+    factory: Callable
+
+
+# https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-6.html#jvms-6.5
+# https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-7.html
+OPCODES: list[Opcode | None] = [None] * 256
+
+
+def _opcode(code: int, mnemonic: str, operands: str | None = "", factory: Callable | None = None):
+    if factory is None:
+        def factory(*args):
+            return Generic(mnemonic, args)
+    OPCODES[code] = Opcode(mnemonic, None if operands is None else struct.Struct(">" + operands), factory)
+
+
+def _constant(value):
+    return lambda: Push(value)
+
+
+def _instance(cls, *args):
+    return lambda: cls(*args)
+
+
+def _arithmetic(mnemonic: str):
+    """
+    The factory of an int or long operation implemented in toyjava.arithmetic, or None for float and double ones
+    """
+
+    function = getattr(arithmetic, mnemonic, None)
+    if function is None:
+        return None
+    unary = mnemonic.endswith("neg") or "2" in mnemonic
+    return _instance(Arithmetic1 if unary else Arithmetic2, function)
+
+
+def _newarray(atype: int):
+    if atype not in TYPECODES:
+        # Invalid, so no engine runs it
+        return Generic("newarray", (atype,))
+    return Newarray(TYPECODES[atype])
+
+
+def _branch_if1(predicate, operand=0):
+    return lambda offset: UnresolvedBranchIf1(offset, predicate, operand)
+
+
+def _branch_if2(predicate):
+    return lambda offset: UnresolvedBranchIf2(offset, predicate)
+
+
+_opcode(0x00, "nop")
+_opcode(0x01, "aconst_null", "", _constant(None))
+for _value in range(-1, 6):
+    _opcode(0x03 + _value, f"iconst_{_value}".replace("-1", "m1"), "", _constant(_value))
+_opcode(0x09, "lconst_0", "", _constant(0))
+_opcode(0x0A, "lconst_1", "", _constant(1))
+_opcode(0x0B, "fconst_0")
+_opcode(0x0C, "fconst_1")
+_opcode(0x0D, "fconst_2")
+_opcode(0x0E, "dconst_0")
+_opcode(0x0F, "dconst_1")
+_opcode(0x10, "bipush", "b", Push)
+_opcode(0x11, "sipush", "h", Push)
+_opcode(0x12, "ldc", "B", Ldc)
+_opcode(0x13, "ldc_w", "H", Ldc)
+_opcode(0x14, "ldc2_w", "H", Ldc)
+
+# A local variable holds an int, a long or a reference alike, so their loads and stores share instructions
+for _code, _type in enumerate("ilfda"):
+    _typed = _type in "ila"
+    _opcode(0x15 + _code, f"{_type}load", "B", Iload if _typed else None)
+    _opcode(0x36 + _code, f"{_type}store", "B", Istore if _typed else None)
+    for _index in range(4):
+        _opcode(0x1A + 4 * _code + _index, f"{_type}load_{_index}", "", _instance(Iload, _index) if _typed else None)
+        _opcode(0x3B + 4 * _code + _index, f"{_type}store_{_index}", "", _instance(Istore, _index) if _typed else None)
+_opcode(0x1A, "iload_0", "", Iload0)
+_opcode(0x1B, "iload_1", "", Iload1)
+_opcode(0x1C, "iload_2", "", Iload2)
+_opcode(0x1D, "iload_3", "", _instance(Iload, 3))
+_opcode(0x3B, "istore_0", "", _instance(Istore, 0))
+_opcode(0x3C, "istore_1", "", Istore1)
+_opcode(0x3D, "istore_2", "", Istore2)
+_opcode(0x3E, "istore_3", "", _instance(Istore, 3))
+
+# bastore also stores to boolean arrays, whose values are 0 or 1 anyway
+_NARROWING = {"b": arithmetic.i2b, "c": arithmetic.i2c, "s": arithmetic.i2s}
+for _code, _type in enumerate("ilfdabcs"):
+    _opcode(0x2E + _code, f"{_type}aload", "", Arrayload)
+    _opcode(0x4F + _code, f"{_type}astore", "", _instance(Arraystore, _NARROWING.get(_type)))
+
+for _code, _mnemonic in enumerate(["pop", "pop2", "dup", "dup_x1", "dup_x2", "dup2", "dup2_x1", "dup2_x2", "swap"]):
+    _opcode(0x57 + _code, _mnemonic)
+# The forms of the others depend on whether the values are longs or doubles, which the engines cannot tell apart
+_opcode(0x57, "pop", "", Pop)
+_opcode(0x59, "dup", "", Dup)
+_opcode(0x5A, "dup_x1", "", DupX1)
+_opcode(0x5F, "swap", "", Swap)
+
+for _code, _operation in enumerate(["add", "sub", "mul", "div", "rem", "neg"]):
+    for _offset, _type in enumerate("ilfd"):
+        _mnemonic = f"{_type}{_operation}"
+        _opcode(0x60 + 4 * _code + _offset, _mnemonic, "", _arithmetic(_mnemonic))
+for _code, _operation in enumerate(["shl", "shr", "ushr", "and", "or", "xor"]):
+    for _offset, _type in enumerate("il"):
+        _mnemonic = f"{_type}{_operation}"
+        _opcode(0x78 + 2 * _code + _offset, _mnemonic, "", _arithmetic(_mnemonic))
+
+_opcode(0x84, "iinc", "Bb", Iinc)
+
+for _code, _mnemonic in enumerate(["i2l", "i2f", "i2d", "l2i", "l2f", "l2d", "f2i", "f2l", "f2d", "d2i", "d2l", "d2f",
+                                   "i2b", "i2c", "i2s", "lcmp", "fcmpl", "fcmpg", "dcmpl", "dcmpg"]):
+    _opcode(0x85 + _code, _mnemonic, "", _arithmetic(_mnemonic))
+
+_opcode(0x99, "ifeq", "h", _branch_if1(op.eq))
+_opcode(0x9A, "ifne", "h", RawIfne)
+_opcode(0x9B, "iflt", "h", _branch_if1(op.lt))
+_opcode(0x9C, "ifge", "h", _branch_if1(op.ge))
+_opcode(0x9D, "ifgt", "h", _branch_if1(op.gt))
+_opcode(0x9E, "ifle", "h", _branch_if1(op.le))
+_opcode(0x9F, "if_icmpeq", "h", _branch_if2(op.eq))
+_opcode(0xA0, "if_icmpne", "h", _branch_if2(op.ne))
+_opcode(0xA1, "if_icmplt", "h", _branch_if2(op.lt))
+_opcode(0xA2, "if_icmpge", "h", _branch_if2(op.ge))
+_opcode(0xA3, "if_icmpgt", "h", _branch_if2(op.gt))
+_opcode(0xA4, "if_icmple", "h", _branch_if2(op.le))
+_opcode(0xA5, "if_acmpeq", "h", _branch_if2(op.is_))
+_opcode(0xA6, "if_acmpne", "h", _branch_if2(op.is_not))
+_opcode(0xA7, "goto", "h", RawGoto)
+# Subroutines are not allowed in class files of version 51 or later
+_opcode(0xA8, "jsr", "h")
+_opcode(0xA9, "ret", "B")
+_opcode(0xAA, "tableswitch", None)
+_opcode(0xAB, "lookupswitch", None)
+
+_opcode(0xAC, "ireturn", "", Ireturn)
+# Any value is returned alike
+_opcode(0xAD, "lreturn", "", Ireturn)
+_opcode(0xAE, "freturn", "", Ireturn)
+_opcode(0xAF, "dreturn", "", Ireturn)
+_opcode(0xB0, "areturn", "", Ireturn)
+_opcode(0xB1, "return", "", Return)
+
+_opcode(0xB2, "getstatic", "H", Getstatic)
+_opcode(0xB3, "putstatic", "H", Putstatic)
+_opcode(0xB4, "getfield", "H", Getfield)
+_opcode(0xB5, "putfield", "H", Putfield)
+_opcode(0xB6, "invokevirtual", "H", Invokevirtual)
+_opcode(0xB7, "invokespecial", "H", Invokespecial)
+_opcode(0xB8, "invokestatic", "H", InvokeStatic)
+# index, count, 0
+_opcode(0xB9, "invokeinterface", "HBB")
+# index, 0, 0
+_opcode(0xBA, "invokedynamic", "HBB", lambda index, *_: Invokedynamic(index))
+_opcode(0xBB, "new", "H", New)
+_opcode(0xBC, "newarray", "B", _newarray)
+_opcode(0xBD, "anewarray", "H", Anewarray)
+_opcode(0xBE, "arraylength", "", Arraylength)
+_opcode(0xBF, "athrow")
+_opcode(0xC0, "checkcast", "H")
+_opcode(0xC1, "instanceof", "H")
+_opcode(0xC2, "monitorenter")
+_opcode(0xC3, "monitorexit")
+_opcode(0xC4, "wide", None)
+_opcode(0xC5, "multianewarray", "HB")
+_opcode(0xC6, "ifnull", "h", _branch_if1(op.is_, None))
+_opcode(0xC7, "ifnonnull", "h", _branch_if1(op.is_not, None))
+_opcode(0xC8, "goto_w", "i", RawGoto)
+_opcode(0xC9, "jsr_w", "i")
+# Reserved opcodes, which must not appear in a class file
+_opcode(0xCA, "breakpoint")
+_opcode(0xFE, "impdep1")
+_opcode(0xFF, "impdep2")
+
+MNEMONICS = {opcode.mnemonic: code for code, opcode in enumerate(OPCODES) if opcode is not None}
+
+S4 = struct.Struct(">i")
+S4_S4 = struct.Struct(">ii")
+S4_S4_S4 = struct.Struct(">iii")
+WIDE_INDEX = struct.Struct(">H")
+WIDE_IINC = struct.Struct(">Hh")
+
+
+def _decode_variable(code, pc: int, mnemonic: str) -> tuple[object, int]:
+    """
+    Decode an instruction with variable-length operands and return it with the position of the next instruction
+    """
+
+    if mnemonic == "wide":
+        opcode = OPCODES[code[pc + 1]]
+        if opcode is None or opcode.operands is None or opcode.mnemonic == "wide":
+            raise NotImplementedError(bytes([code[pc + 1]]))
+        if opcode.mnemonic == "iinc":
+            return opcode.factory(*WIDE_IINC.unpack_from(code, pc + 2)), pc + 2 + WIDE_IINC.size
+        return opcode.factory(*WIDE_INDEX.unpack_from(code, pc + 2)), pc + 2 + WIDE_INDEX.size
+
+    # The operands start at the next multiple of 4 from the start of the code
+    aligned = (pc + 4) & ~3
+    if mnemonic == "tableswitch":
+        default, low, high = S4_S4_S4.unpack_from(code, aligned)
+        count = high - low + 1
+        offsets = struct.unpack_from(f">{count}i", code, aligned + S4_S4_S4.size)
+        return RawTableswitch(default, low, offsets), aligned + S4_S4_S4.size + 4 * count
+    else:
+        default, npairs = S4_S4.unpack_from(code, aligned)
+        pairs = struct.unpack_from(f">{2 * npairs}i", code, aligned + S4_S4.size)
+        return RawLookupswitch(default, tuple(zip(pairs[::2], pairs[1::2]))), aligned + S4_S4.size + 8 * npairs
+
+
+def decode(code) -> tuple[tuple, list]:
+    """
+    Decode the code of a method and return the instructions with their byte offsets in the code
+
+    The targets of branches are still byte offsets relative to the branch instructions.
+    """
+
+    instructions = []
+    positions = []
+    pc = 0
+    end = len(code)
+    while pc < end:
+        positions.append(pc)
+        instruction, pc = decode_at(code, pc)
+        instructions.append(instruction)
+    return tuple(instructions), positions
+
+
+def decode_at(code, pc: int) -> tuple[object, int]:
+    """
+    Decode the instruction at a position in the code of a method and return it with the position of the next one
+    """
+
+    opcode = OPCODES[code[pc]]
+    if opcode is None:
+        raise NotImplementedError(bytes([code[pc]]))
+    operands = opcode.operands
+    if operands is None:
+        return _decode_variable(code, pc, opcode.mnemonic)
+    return opcode.factory(*operands.unpack_from(code, pc + 1)), pc + 1 + operands.size
+
+
+def mnemonics(code) -> list[str]:
+    """
+    Return the mnemonic of each instruction in the code of a method, that of the widened one for wide
+    """
+
+    result = []
+    pc = 0
+    end = len(code)
+    while pc < end:
+        opcode = OPCODES[code[pc]]
+        if opcode is None:
+            raise NotImplementedError(bytes([code[pc]]))
+        if opcode.operands is None:
+            # Which checks the opcode that wide widens
+            _, following = _decode_variable(code, pc, opcode.mnemonic)
+            result.append(OPCODES[code[pc + 1]].mnemonic if opcode.mnemonic == "wide" else opcode.mnemonic)
+            pc = following
+        else:
+            result.append(opcode.mnemonic)
+            pc += 1 + opcode.operands.size
+    return result
+
+
 def convert(instructions, positions: list):
+    indices = {position: index for index, position in enumerate(positions)}
     for pos, instruction in zip(positions, instructions):
-        if isinstance(instruction, RawIfne):
-            branchbyte = pos + instruction.branchbyte
-            index = positions.index(branchbyte)
-            yield Ifne(index)
-        elif isinstance(instruction, UnresolvedBranchIf2):
-            branchbyte = pos + instruction.offset
-            index = positions.index(branchbyte)
-            yield BranchIf2(index, instruction.predicate)
-        elif isinstance(instruction, RawGoto):
-            branchbyte = pos + instruction.branchbyte
-            index = positions.index(branchbyte)
-            yield Goto(index)
+        if isinstance(instruction, UnresolvedBranch):
+            yield instruction.resolve(pos, indices)
         else:
             yield instruction
 
 
 def parse_instructions(code: bytes) -> tuple:
-    reader = InstructionReader(BytesIO(code))
-    instructions, positions = reader.read()
+    instructions, positions = decode(code)
     return tuple(convert(instructions, positions))
@@ -0,0 +1,576 @@
+"""
+A tier that translates hot methods into Python source and compiles them into Python functions
+
+Methods are interpreted with the dispatch engine while their invocations and backward branches are counted.
+Once a method reaches the threshold, its decoded instructions are translated into a function
+whose local variables and operand stack slots are Python variables.
+Basic blocks are laid out in order inside a `while True` loop and selected by a `pc` state variable,
+so fall-through and forward branches run straight down the loop body and backward branches `continue` it.
+A loop that gets hot in the middle of an invocation is entered through the same `pc` parameter (on-stack replacement).
+"""
+
+import logging
+import operator as op
+import re
+from itertools import repeat
+
+from toyjava import arithmetic, arrays, dispatch
+from toyjava.linker import WIDE_TYPES, parse_method_descriptor
+from toyjava.instructions import Getstatic, Ldc, Invokevirtual, Return, Istore1, Iload1, Istore2, Iload2, Iinc, Goto, \
+    Push, Ifne, BranchIf2, InvokeStatic, Iload0, Ireturn, Arithmetic1, Arithmetic2, Iload, Istore, BranchIf1, \
+    Newarray, Anewarray, Arrayload, Arraystore, Arraylength, Invokespecial, New, Getfield, Putfield, Pop, Dup, DupX1, \
+    Swap, Putstatic, Invokedynamic, BRANCHES, SWITCHES, TERMINATORS, branch_targets, load_index, store_index, \
+    switch_targets
+from toyjava.memoization import MISSING, memo_of
+from toyjava.objects import NullPointerError, null_field_access, virtual_method
+
+logger = logging.getLogger(__name__)
+
+JIT_THRESHOLD = 1000
+
+OPERATORS = {
+    op.and_: "&",
+    op.or_: "|",
+    op.xor: "^",
+    op.eq: "==",
+    op.ne: "!=",
+    op.lt: "<",
+    op.le: "<=",
+    op.gt: ">",
+    op.ge: ">=",
+    op.is_: "is",
+    op.is_not: "is not",
+}
+
+# Operations of toyjava.arithmetic inlined as (operator, the range of the type, the function wrapping a result into it)
+WRAPPED_OPERATORS = {
+    arithmetic.iadd: ("+", arithmetic.INT_MIN, arithmetic.INT_MAX, arithmetic.wrap_int),
+    arithmetic.isub: ("-", arithmetic.INT_MIN, arithmetic.INT_MAX, arithmetic.wrap_int),
+    arithmetic.imul: ("*", arithmetic.INT_MIN, arithmetic.INT_MAX, arithmetic.wrap_int),
+    arithmetic.ladd: ("+", arithmetic.LONG_MIN, arithmetic.LONG_MAX, arithmetic.wrap_long),
+    arithmetic.lsub: ("-", arithmetic.LONG_MIN, arithmetic.LONG_MAX, arithmetic.wrap_long),
+    arithmetic.lmul: ("*", arithmetic.LONG_MIN, arithmetic.LONG_MAX, arithmetic.wrap_long),
+}
+
+
+class UnsupportedMethod(Exception):
+    pass
+
+
+def stack_effect(instruction, cls) -> tuple[int, int]:
+    """
+    Return the numbers of values an instruction pops from and pushes to the operand stack
+    """
+
+    if isinstance(instruction, (Getstatic, Ldc, Push, Iload, Iload0, Iload1, Iload2, New)):
+        return 0, 1
+    elif isinstance(instruction, (Istore, Istore1, Istore2, Ifne, BranchIf1, Ireturn, Pop, Putstatic) + SWITCHES):
+        return 1, 0
+    elif isinstance(instruction, (Arithmetic2,)):
+        return 2, 1
+    elif isinstance(instruction, (BranchIf2, Putfield)):
+        return 2, 0
+    elif isinstance(instruction, Dup):
+        return 1, 2
+    elif isinstance(instruction, DupX1):
+        return 2, 3
+    elif isinstance(instruction, Swap):
+        return 2, 2
+    elif isinstance(instruction, (Invokevirtual, Invokespecial)):
+        methodref = cls.constant_pool.resolved[instruction.index]
+        return methodref.arg_count + 1, 0 if methodref.return_kind == "V" else 1
+    elif isinstance(instruction, (InvokeStatic, Invokedynamic)):
+        methodref = cls.constant_pool.resolved[instruction.index]
+        return methodref.arg_count, 0 if methodref.return_kind == "V" else 1
+    elif isinstance(instruction, (Arithmetic1, Newarray, Anewarray, Arraylength, Getfield)):
+        return 1, 1
+    elif isinstance(instruction, Arrayload):
+        return 2, 1
+    elif isinstance(instruction, Arraystore):
+        return 3, 0
+    elif isinstance(instruction, (Iinc, Goto, Return)):
+        return 0, 0
+    raise UnsupportedMethod(instruction)
+
+
+def stack_depths(instructions, cls) -> list:
+    """
+    Compute the operand stack depth before each reachable instruction
+    """
+
+    depths = [None] * len(instructions)
+    pending = [(0, 0)]
+    while pending:
+        pc, depth = pending.pop()
+        while True:
+            if depths[pc] is not None:
+                if depths[pc] != depth:
+                    raise UnsupportedMethod(f"Inconsistent stack depth at {pc}")
+                break
+            depths[pc] = depth
+            instruction = instructions[pc]
+            pops, pushes = stack_effect(instruction, cls)
+            depth += pushes - pops
+            if isinstance(instruction, BRANCHES):
+                pending.extend((target, depth) for target in branch_targets(instruction))
+            if isinstance(instruction, TERMINATORS):
+                break
+            pc += 1
+    return depths
+
+
+class Translator:
+    def __init__(self, entry, cls, jit):
+        self.entry = entry
+        self.cls = cls
+        self.jit = jit
+        self.function_name = "jitted_" + re.sub(r"\W", "_", entry.name)
+        self.namespace = {}
+
+    def constant(self, value) -> str:
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def wrapped(self, variable: str, expression: str, function) -> list:
+        """
+        The lines assigning an int or long expression to a variable, wrapped like `function` of toyjava.arithmetic
+        """
+
+        _, low, high, wrap = WRAPPED_OPERATORS[function]
+        return [
+            f"{variable} = {expression}",
+            f"if not {low} <= {variable} <= {high}:",
+            f"    {variable} = {self.constant(wrap)}({variable})",
+        ]
+
+    def bounds_check(self, array: str, index: str) -> list:
+        return [
+            f"if {index} < 0 or {index} >= len({array}):",
+            f"    raise {self.constant(arrays.out_of_bounds)}({index}, len({array}))",
+        ]
+
+    def null_check(self, objectref: str, fieldref) -> list:
+        return [
+            f"if {objectref} is None:",
+            f"    raise {self.constant(null_field_access)}({self.constant(fieldref)})",
+        ]
+
+    def initialize(self, statics) -> list:
+        """
+        The lines initializing a class before it is used, which are needed only if it is not initialized yet
+        """
+
+        if statics.initialized:
+            return []
+        return [f"{self.constant(statics.initialize)}()"]
+
+    def translate(self) -> str:
+        instructions = self.entry.instructions
+        cls = self.cls
+        depths = stack_depths(instructions, cls)
+
+        leaders = {0}
+        for pc, instruction in enumerate(instructions):
+            if isinstance(instruction, BRANCHES):
+                leaders.update(branch_targets(instruction))
+            if isinstance(instruction, BRANCHES + TERMINATORS):
+                leaders.add(pc + 1)
+
+        num_locals = sum(2 if param in WIDE_TYPES else 1 for param in parse_method_descriptor(self.entry.descriptor)[0])
+        for instruction in instructions:
+            index = load_index(instruction)
+            if index is None:
+                index = store_index(instruction)
+            if index is None and isinstance(instruction, Iinc):
+                index = instruction.index
+            if index is not None:
+                num_locals = max(num_locals, index + 1)
+        # Extra positional arguments are the unused local variables of the interpreter
+        params = "".join(f"l{i}=None, " for i in range(num_locals))
+        lines = [f"def {self.function_name}({params}*_, pc=0):", "    while True:"]
+
+        for pc, instruction in enumerate(instructions):
+            depth = depths[pc]
+            if depth is None:
+                continue
+            if pc in leaders:
+                lines.append(f"        if pc == {pc}:")
+            top = f"s{depth - 1}"
+            below = f"s{depth - 2}"
+            pushed = f"s{depth}"
+            emit = []
+
+            if isinstance(instruction, Push):
+                emit.append(f"{pushed} = {instruction.value!r}")
+            elif isinstance(instruction, (Getstatic, Putstatic)):
+                cell = cls.constant_pool.resolved[instruction.index].cell
+                if cell is None:
+                    raise UnsupportedMethod(instruction)
+                if isinstance(instruction, Getstatic):
+                    emit.append(f"{pushed} = {self.constant(cell)}.value")
+                else:
+                    emit.append(f"{self.constant(cell)}.value = {top}")
+            elif isinstance(instruction, Ldc):
+                value = cls.constant_pool.resolved[instruction.index]
+                if isinstance(value, int):
+                    emit.append(f"{pushed} = {value!r}")
+                elif isinstance(value, (str, float)):
+                    # The interned string itself rather than an equal literal, so that == compares them as in Java
+                    emit.append(f"{pushed} = {self.constant(value)}")
+                else:
+                    raise UnsupportedMethod(instruction)
+            elif load_index(instruction) is not None:
+                emit.append(f"{pushed} = l{load_index(instruction)}")
+            elif store_index(instruction) is not None:
+                emit.append(f"l{store_index(instruction)} = {top}")
+            elif isinstance(instruction, Iinc):
+                local = f"l{instruction.index}"
+                emit.extend(self.wrapped(local, f"{local} + {instruction.const!r}", arithmetic.iadd))
+            elif isinstance(instruction, Arithmetic1):
+                emit.append(f"{top} = {self.constant(instruction.function)}({top})")
+            elif isinstance(instruction, Arithmetic2):
+                if instruction.function in WRAPPED_OPERATORS:
+                    symbol = WRAPPED_OPERATORS[instruction.function][0]
+                    emit.extend(self.wrapped(below, f"{below} {symbol} {top}", instruction.function))
+                elif instruction.function in OPERATORS:
+                    emit.append(f"{below} = {below} {OPERATORS[instruction.function]} {top}")
+                else:
+                    emit.append(f"{below} = {self.constant(instruction.function)}({below}, {top})")
+            elif isinstance(instruction, Newarray):
+                emit.append(f"{top} = {self.constant(arrays.new_array)}({instruction.typecode!r}, {top})")
+            elif isinstance(instruction, Anewarray):
+                emit.append(f"{top} = {self.constant(arrays.new_reference_array)}({top})")
+            elif isinstance(instruction, Arraylength):
+                emit.append(f"{top} = len({top})")
+            elif isinstance(instruction, Arrayload):
+                emit.extend(self.bounds_check(below, top))
+                emit.append(f"{below} = {below}[{top}]")
+            elif isinstance(instruction, Arraystore):
+                array, index = f"s{depth - 3}", below
+                emit.extend(self.bounds_check(array, index))
+                if instruction.convert is None:
+                    emit.append(f"{array}[{index}] = {top}")
+                else:
+                    emit.append(f"{array}[{index}] = {self.constant(instruction.convert)}({top})")
+            elif isinstance(instruction, New):
+                layout = cls.constant_pool.resolved[instruction.index]
+                if layout is None:
+                    raise UnsupportedMethod(instruction)
+                emit.extend(self.initialize(layout.statics))
+                emit.append(f"{pushed} = {self.constant(layout)}()")
+            elif isinstance(instruction, Getfield):
+                fieldref = cls.constant_pool.resolved[instruction.index]
+                emit.extend(self.null_check(top, fieldref))
+                # The slot name is an attribute that Python looks up through the slot descriptor of the layout
+                emit.append(f"{top} = {top}.{fieldref.slot}")
+            elif isinstance(instruction, Putfield):
+                fieldref = cls.constant_pool.resolved[instruction.index]
+                emit.extend(self.null_check(below, fieldref))
+                emit.append(f"{below}.{fieldref.slot} = {top}")
+            elif isinstance(instruction, Pop):
+                emit.append("pass")
+            elif isinstance(instruction, Dup):
+                emit.append(f"{pushed} = {top}")
+            elif isinstance(instruction, DupX1):
+                emit.append(f"{below}, {top}, {pushed} = {top}, {below}, {top}")
+            elif isinstance(instruction, Swap):
+                emit.append(f"{below}, {top} = {top}, {below}")
+            elif isinstance(instruction, (Invokevirtual, Invokespecial, InvokeStatic, Invokedynamic)):
+                # A call site of invokedynamic is linked to a native function, which is called like a static method
+                methodref = cls.constant_pool.resolved[instruction.index]
+                instance = not isinstance(instruction, (InvokeStatic, Invokedynamic))
+                n = methodref.arg_count + instance
+                if methodref.target is None:
+                    raise UnsupportedMethod(instruction)
+                elif methodref.native:
+                    function = self.constant(methodref.target)
+                elif isinstance(instruction, Invokevirtual):
+                    function = self.constant(self.jit.virtual_invoker(methodref))
+                elif isinstance(instruction, InvokeStatic) and memo_of(methodref.target) is not None:
+                    # Even a recursive call goes through the cache
+                    emit.extend(self.initialize(methodref.target.cls.statics))
+                    invoker = self.jit.invoker(methodref.target.cls, methodref.target)
+                    function = self.constant(memo_of(methodref.target).wrap(invoker))
+                elif methodref.target is self.entry:
+                    function = self.function_name
+                else:
+                    emit.extend(self.initialize(methodref.target.cls.statics))
+                    function = self.constant(self.jit.invoker(methodref.target.cls, methodref.target))
+                args = [f"s{i}" for i in range(depth - n, depth)]
+                if not methodref.native:
+                    # A long or double argument takes two parameters of a compiled method
+                    args = args[:instance] + methodref.local_variables(args[instance:])
+                    args = ["None" if arg is None else arg for arg in args]
+                args = ", ".join(args)
+                result = "" if methodref.return_kind == "V" else f"s{depth - n} = "
+                emit.append(f"{result}{function}({args})")
+            elif isinstance(instruction, Return):
+                emit.append("return None")
+            elif isinstance(instruction, Ireturn):
+                emit.append(f"return {top}")
+            elif isinstance(instruction, Goto):
+                emit.append(f"pc = {instruction.index}")
+                if instruction.index <= pc:
+                    emit.append("continue")
+            elif isinstance(instruction, SWITCHES):
+                targets = self.constant(switch_targets(instruction))
+                emit.extend([f"pc = {targets}.get({top}, {instruction.default})", "continue"])
+            elif isinstance(instruction, (Ifne, BranchIf1, BranchIf2)):
+                if isinstance(instruction, Ifne):
+                    condition = f"{top} != 0"
+                elif isinstance(instruction, BranchIf1):
+                    if instruction.predicate in OPERATORS:
+                        condition = f"{top} {OPERATORS[instruction.predicate]} {instruction.operand!r}"
+                    else:
+                        condition = f"{self.constant(instruction.predicate)}({top}, {instruction.operand!r})"
+                elif instruction.predicate in OPERATORS:
+                    condition = f"{below} {OPERATORS[instruction.predicate]} {top}"
+                else:
+                    condition = f"{self.constant(instruction.predicate)}({below}, {top})"
+                if instruction.index <= pc:
+                    emit.extend([f"if {condition}:", f"    pc = {instruction.index}", "    continue", f"pc = {pc + 1}"])
+                else:
+                    emit.append(f"pc = {instruction.index} if {condition} else {pc + 1}")
+            else:
+                raise UnsupportedMethod(instruction)
+
+            lines.extend("            " + line for line in emit)
+            if pc + 1 in leaders and not isinstance(instruction, BRANCHES + TERMINATORS):
+                lines.append(f"            pc = {pc + 1}")
+
+        return "\n".join(lines) + "\n"
+
+    def compile(self):
+        source = self.translate()
+        logger.debug("Translated %s%s:\n%s", self.entry.name, self.entry.descriptor, source)
+        code = compile(source, f"<jit {self.entry.name}{self.entry.descriptor}>", "exec")
+        exec(code, self.namespace)
+        return self.namespace[self.function_name]
+
+
+class JitFrame(dispatch.Frame):
+    __slots__ = ("entry", "method", "jit")
+
+    def __init__(self, cls, entry, local_variables, jit):
+        super().__init__(cls, entry.instructions, local_variables)
+        self.entry = entry
+        self.method = jit.method(entry)
+        self.jit = jit
+
+
+def _invokestatic(frame, instruction):
+    cls = frame.cls
+    methodref = cls.constant_pool.resolved[instruction.index]
+    if methodref.target is None:
+        raise NotImplementedError(f"'invokestatic' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count
+    args = operand_stack[split:]
+    del operand_stack[split:]
+
+    if methodref.native:
+        return_value = methodref.target(*args)
+    else:
+        target = methodref.target
+        statics = target.cls.statics
+        if not statics.initialized:
+            statics.initialize()
+        memo = memo_of(target)
+        if memo is None:
+            return_value = frame.jit.invoke(target.cls, target, methodref.local_variables(args))
+        else:
+            key = tuple(args)
+            return_value = memo.lookup(key)
+            if return_value is MISSING:
+                return_value = memo.store(key, frame.jit.invoke(target.cls, target, methodref.local_variables(args)))
+    if methodref.return_kind != "V":
+        operand_stack.append(return_value)
+    return frame
+
+
+def _invoke_instance(frame, instruction, virtual: bool):
+    methodref = frame.cls.constant_pool.resolved[instruction.index]
+    if methodref.target is None:
+        mnemonic = "invokevirtual" if virtual else "invokespecial"
+        raise NotImplementedError(f"'{mnemonic}' cannot resolve {methodref.class_name}.{methodref.name}")
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - methodref.arg_count - 1
+    args = operand_stack[split:]
+    del operand_stack[split:]
+
+    if methodref.native:
+        return_value = methodref.target(*args)
+    else:
+        receiver = args[0]
+        if receiver is None:
+            raise NullPointerError(f"Cannot invoke {methodref.class_name}.{methodref.name} on null")
+        target = virtual_method(type(receiver), methodref.name, methodref.descriptor) if virtual else methodref.target
+        if methodref.wide is not None:
+            args = args[:1] + methodref.local_variables(args[1:])
+        return_value = frame.jit.invoke(target.cls, target, args)
+    if methodref.return_kind != "V":
+        operand_stack.append(return_value)
+    return frame
+
+
+def _invokevirtual(frame, instruction):
+    return _invoke_instance(frame, instruction, True)
+
+
+def _invokespecial(frame, instruction):
+    return _invoke_instance(frame, instruction, False)
+
+
+def _backward_branch(frame, index):
+    """
+    Count a backward branch and continue the invocation in compiled code once the method is hot
+    """
+
+    method = frame.method
+    method.backedges += 1
+    frame.pc = index
+    if method.backedges >= frame.jit.threshold and not frame.operand_stack:
+        native = frame.jit.compiled(frame.cls, frame.entry)
+        if native is not None:
+            frame.return_value = native(*frame.local_variables, pc=index)
+            return None
+    return frame
+
+
+def _goto(frame, instruction):
+    if instruction.index < frame.pc:
+        return _backward_branch(frame, instruction.index)
+    frame.pc = instruction.index
+    return frame
+
+
+def _ifne(frame, instruction):
+    if frame.operand_stack.pop() != 0:
+        if instruction.index < frame.pc:
+            return _backward_branch(frame, instruction.index)
+        frame.pc = instruction.index
+    return frame
+
+
+def _branch_if1(frame, instruction):
+    if instruction.predicate(frame.operand_stack.pop(), instruction.operand):
+        if instruction.index < frame.pc:
+            return _backward_branch(frame, instruction.index)
+        frame.pc = instruction.index
+    return frame
+
+
+def _branch_if2(frame, instruction):
+    operand_stack = frame.operand_stack
+    v2 = operand_stack.pop()
+    v1 = operand_stack.pop()
+    if instruction.predicate(v1, v2):
+        if instruction.index < frame.pc:
+            return _backward_branch(frame, instruction.index)
+        frame.pc = instruction.index
+    return frame
+
+
+HANDLERS = {
+    **dispatch.HANDLERS,
+    InvokeStatic: _invokestatic,
+    Invokevirtual: _invokevirtual,
+    Invokespecial: _invokespecial,
+    Goto: _goto,
+    Ifne: _ifne,
+    BranchIf1: _branch_if1,
+    BranchIf2: _branch_if2,
+}
+
+
+class JitMethod:
+    """
+    The counts and the compiled function of a method in one Jit
+    """
+
+    __slots__ = ("invocations", "backedges", "native")
+
+    def __init__(self):
+        self.invocations = 0
+        self.backedges = 0
+        # The compiled function, or False if the method cannot be compiled
+        self.native = None
+
+
+class Jit:
+    def __init__(self, threshold: int = JIT_THRESHOLD):
+        self.threshold = threshold
+        # MethodEntry -> its JitMethod, so that each VirtualMachine counts and compiles the methods that it runs
+        self.methods = {}
+
+    def method(self, entry) -> JitMethod:
+        try:
+            return self.methods[entry]
+        except KeyError:
+            method = self.methods[entry] = JitMethod()
+            return method
+
+    def compiled(self, cls, entry):
+        """
+        Return the compiled function of a method, or None if the method cannot be translated
+        """
+
+        method = self.method(entry)
+        if method.native is None:
+            try:
+                method.native = Translator(entry, cls, self).compile()
+            except UnsupportedMethod as e:
+                logger.debug("Cannot compile %s%s: %s", entry.name, entry.descriptor, e)
+                method.native = False
+        return method.native or None
+
+    def invoker(self, cls, entry):
+        def invoke(*args):
+            return self.invoke(cls, entry, list(args))
+
+        return invoke
+
+    def virtual_invoker(self, methodref):
+        """
+        Return a function that calls the method that invokevirtual selects for the class of the receiver
+        """
+
+        name = methodref.name
+        descriptor = methodref.descriptor
+
+        def invoke(receiver, *args):
+            if receiver is None:
+                raise NullPointerError(f"Cannot invoke {methodref.class_name}.{name} on null")
+            entry = virtual_method(type(receiver), name, descriptor)
+            return self.invoke(entry.cls, entry, [receiver, *args])
+
+        return invoke
+
+    def invoke(self, cls, entry, local_variables):
+        method = self.method(entry)
+        if method.native:
+            return method.native(*local_variables)
+        method.invocations += 1
+        if method.invocations >= self.threshold and self.compiled(cls, entry) is not None:
+            return method.native(*local_variables)
+        return self.interpret(cls, entry, local_variables)
+
+    def interpret(self, cls, entry, local_variables):
+        if len(local_variables) < entry.max_locals:
+            local_variables += repeat(None, entry.max_locals - len(local_variables))
+        frame = JitFrame(cls, entry, local_variables, self)
+        instructions = frame.instructions
+        handlers = HANDLERS
+        current = frame
+        while current is not None:
+            instruction = instructions[current.pc]
+            current.pc += 1
+            try:
+                handler = handlers[type(instruction)]
+            except KeyError:
+                raise NotImplementedError(instruction) from None
+            current = handler(current, instruction)
+        return frame.return_value
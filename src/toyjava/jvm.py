@@ -1,22 +1,133 @@
 import logging
-from dataclasses import dataclass
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from io import BytesIO
 from itertools import repeat
 from typing import BinaryIO
 
-from toyjava.constants import ConstantPoolReader, String
+from toyjava import closures, compact, cooperative, dispatch, peephole, verifier
+from toyjava.jit import Jit, JIT_THRESHOLD
+from toyjava.memoization import MEMO_SIZE, Memoization, current_memoization
+from toyjava.output import BufferedOutput, current_output
+from toyjava.profiler import Profiler, ProfileReport
+from toyjava.statics import ClassStatics, current_interpreter
+from toyjava.arithmetic import wrap_int
+from toyjava.constants import BufferConstantPoolReader, ConstantPoolReader, LazyConstantPoolReader
 from toyjava.instructions import parse_instructions, Getstatic, Ldc, Invokevirtual, Return, Istore1, Iload1, Istore2, \
-    Iload2, Iinc, Goto, Push, Ifne, BranchIf2, InvokeStatic, Iload0, Ireturn, Arithmetic2
+    Iload2, Iinc, Goto, Push, Ifne, BranchIf2, InvokeStatic, Iload0, Ireturn, Arithmetic1, Arithmetic2
 
 logger = logging.getLogger(__name__)
 
 
 class VirtualMachine:
+    """
+    Runs the main method of a class with the selected interpreter engine:
+
+    - "dispatch": looks up a handler for each instruction in a table (the default).
+      If `optimize` is true, it runs instructions rewritten by toyjava.peephole
+    - "loop": tests each instruction against a chain of isinstance checks
+    - "closure": compiles each method into closures with pre-resolved operands before running it
+    - "compact": runs over the code of each method encoded as parallel arrays by toyjava.compact
+    - "jit": interprets like "dispatch" and compiles methods into Python functions
+      once their invocations or backward branches reach `jit_threshold`
+
+    System.out writes to `output`, a BufferedOutput on sys.stdout unless given (see toyjava.output).
+    Classes referred to by other classes are loaded by `loader`, a ClassLoader with an empty classpath unless given.
+    If `memoize` is true, the engines other than "loop" memoize the pure static methods,
+    keeping up to `memo_size` return values of each; `memoization.stats()` counts their hits and misses
+    (see toyjava.memoization).
+    """
+
+    def __init__(self, engine: str = "dispatch", jit_threshold: int = JIT_THRESHOLD, output=None, loader=None,
+                 optimize: bool = True, memoize: bool = True, memo_size: int = MEMO_SIZE):
+        if engine not in ENGINES and engine != "jit":
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+        self.optimize = optimize
+        self.jit = Jit(jit_threshold) if engine == "jit" else None
+        self.output = BufferedOutput() if output is None else output
+        self.memoization = Memoization(memo_size) if memoize else None
+        if loader is None:
+            # toyjava.loader imports this module
+            from toyjava.loader import ClassLoader
+            loader = ClassLoader()
+        self.loader = loader
+
+    def execute_class(self, name: str):
+        """
+        Run the main method of a class loaded by name
+        """
+
+        self.execute_main(self.loader.load(name))
+
     def execute_main(self, cls):
-        # Assume the number of local variables is not more than 10
-        local_variables = list(repeat(None, 10))
-        instructions = cls.main_instructions()
-        execute(instructions, cls, local_variables)
+        self._run_main(cls, self._invoke)
+
+    def profile_main(self, cls) -> ProfileReport:
+        """
+        Run the main method with the instrumented interpreter of toyjava.profiler in place of the engine
+        """
+
+        profiler = Profiler()
+        self._run_main(cls, profiler.invoke)
+        return profiler.finish()
+
+    def _invoke(self, entry, local_variables):
+        if self.jit is not None:
+            self.jit.invoke(entry.cls, entry, local_variables)
+        elif self.engine == "dispatch" and self.optimize:
+            dispatch.execute(entry.optimized, entry.cls, local_variables, True)
+        elif self.engine == "compact":
+            compact.execute(entry.compact, entry.cls, local_variables)
+        else:
+            ENGINES[self.engine](entry.instructions, entry.cls, local_variables)
+
+    async def execute_main_async(self, cls, slice_size: int = cooperative.SLICE_SIZE,
+                                 max_instructions: int | None = None, timeout: float | None = None):
+        """
+        Run the main method as a coroutine that yields to the event loop every `slice_size` instructions
+
+        It raises toyjava.cooperative.InstructionBudgetExceeded once main has run `max_instructions` instructions
+        without returning, and toyjava.cooperative.TimeBudgetExceeded once it has run for `timeout` seconds.
+        Only the dispatch engine can pause in the middle of a method, so the VM must use it.
+        Programs running concurrently must have VirtualMachines and ClassLoaders of their own.
+        """
+
+        if self.engine != "dispatch":
+            raise ValueError(f"The engine {self.engine} cannot run as a coroutine")
+        with self._running(cls, self._invoke) as (main, local_variables):
+            instructions = main.optimized if self.optimize else main.instructions
+            await cooperative.execute(
+                instructions, main.cls, local_variables, self.optimize, slice_size, max_instructions, timeout,
+            )
+
+    @contextmanager
+    def _running(self, cls, invoke):
+        """
+        Define and initialize a class and yield its main method and the local variables to call it with,
+        while System.out writes to `output` and classes are initialized with `invoke`
+        """
+
+        self.loader.define(cls)
+        main = cls.main_method()
+        # The first local variable is the String[] args
+        local_variables = list(repeat(None, max(main.max_locals, 1)))
+        token = current_output.set(self.output)
+        interpreter_token = current_interpreter.set(invoke)
+        memoization_token = current_memoization.set(self.memoization)
+        try:
+            cls.statics.initialize()
+            yield main, local_variables
+        finally:
+            current_memoization.reset(memoization_token)
+            current_interpreter.reset(interpreter_token)
+            current_output.reset(token)
+            self.output.main_returned()
+
+    def _run_main(self, cls, invoke):
+        with self._running(cls, invoke) as (main, local_variables):
+            invoke(main, local_variables)
 
 
 def execute(instructions, cls, local_variables):
@@ -26,44 +137,37 @@ def execute(instructions, cls, local_variables):
     while True:
         instruction = instructions[pc]
         if isinstance(instruction, Getstatic):
-            operand_stack.append(constant_pool[instruction.index])
+            operand_stack.append(constant_pool.resolved[instruction.index].cell.value)
         elif isinstance(instruction, Ldc):
-            c = constant_pool[instruction.index]
-            # Assume it is a String constant
-            assert isinstance(c, String)
-            value = constant_pool[c.string_index]
-            operand_stack.append(value)
+            operand_stack.append(constant_pool.resolved[instruction.index])
         elif isinstance(instruction, Invokevirtual):
-            # Assume the method only has one argument
-            methodref = constant_pool[instruction.index]
-            arg1 = operand_stack.pop()
-            objectref = operand_stack.pop()
+            methodref = constant_pool.resolved[instruction.index]
+            if not methodref.native:
+                raise NotImplementedError(f"'invokevirtual' is not implemented for {methodref.class_name}.{methodref.name}")
+            # Pop the arguments and the object reference
+            split = len(operand_stack) - methodref.arg_count - 1
+            args = operand_stack[split:]
+            del operand_stack[split:]
+            return_value = methodref.target(*args)
+            if methodref.return_kind != "V":
+                operand_stack.append(return_value)
+        elif isinstance(instruction, InvokeStatic):
+            methodref = constant_pool.resolved[instruction.index]
+            if methodref.target is None:
+                raise NotImplementedError(f"'invokestatic' cannot resolve {methodref.class_name}.{methodref.name}")
 
-            field_class = constant_pool[constant_pool[objectref.class_index].name_index]
-            field_name = constant_pool[constant_pool[objectref.name_and_type_index].name_index]
-            method_name = constant_pool[constant_pool[methodref.name_and_type_index].name_index]
+            split = len(operand_stack) - methodref.arg_count
+            args = operand_stack[split:]
+            del operand_stack[split:]
 
-            if field_class == "java/lang/System" and field_name == "out" and method_name == "println":
-                print(arg1)
+            if methodref.native:
+                return_value = methodref.target(*args)
             else:
-                raise NotImplementedError("'invokevirtual' is not implemented except System.out.println")
-        elif isinstance(instruction, InvokeStatic):
-            # stub
-            methodref = constant_pool[instruction.index]
-            name_and_type = constant_pool[methodref.name_and_type_index]
-            descriptor = constant_pool[name_and_type.descriptor_index]
-            # https://docs.oracle.com/javase/specs/jvms/se7/html/jvms-4.html#jvms-4.3.3
-            num_args = sum(1 for c in descriptor[1:descriptor.find(")")] if c in ["I", "L"])
-            method_name = constant_pool[name_and_type.name_index]
-
-            next_instructions = cls.find_instructions(method_name)
-
-            args = operand_stack[-num_args:]
-            for _ in range(num_args):
-                operand_stack.pop()
-
-            return_value = execute(next_instructions, cls, args)
-            operand_stack.append(return_value)
+                args = methodref.local_variables(args)
+                args += repeat(None, methodref.target.max_locals - len(args))
+                return_value = execute(methodref.target.instructions, methodref.target.cls, args)
+            if methodref.return_kind != "V":
+                operand_stack.append(return_value)
         elif isinstance(instruction, Return):
             return
         elif isinstance(instruction, Ireturn):
@@ -74,6 +178,8 @@ def execute(instructions, cls, local_variables):
             value2 = operand_stack.pop()
             value1 = operand_stack.pop()
             operand_stack.append(instruction.function(value1, value2))
+        elif isinstance(instruction, Arithmetic1):
+            operand_stack[-1] = instruction.function(operand_stack[-1])
         elif isinstance(instruction, Istore1):
             i = operand_stack.pop()
             local_variables[1] = i
@@ -101,7 +207,7 @@ def execute(instructions, cls, local_variables):
                 pc = instruction.index
                 continue
         elif isinstance(instruction, Iinc):
-            local_variables[instruction.index] += instruction.const
+            local_variables[instruction.index] = wrap_int(local_variables[instruction.index] + instruction.const)
         elif isinstance(instruction, Goto):
             pc = instruction.index
             continue
@@ -111,6 +217,14 @@ def execute(instructions, cls, local_variables):
         pc += 1
 
 
+ENGINES = {
+    "dispatch": dispatch.execute,
+    "loop": execute,
+    "closure": closures.execute,
+    "compact": compact.execute,
+}
+
+
 @dataclass(frozen=True)
 class ClassFile:
     """
@@ -121,79 +235,266 @@ class ClassFile:
     constant_pool_count: int
     constant_pool: tuple
     methods: tuple
+    this_class: int = 0
+    # 0 for java/lang/Object, which has no superclass
+    super_class: int = 0
+    fields: tuple = ()
+    bootstrap_methods: tuple = ()
+    method_table: "MethodTable" = field(init=False, repr=False, compare=False)
+    statics: ClassStatics = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "method_table", MethodTable(self))
+        object.__setattr__(self, "statics", ClassStatics(self))
+
+    @property
+    def name(self) -> str:
+        return self.constant_pool[self.constant_pool[self.this_class].name_index]
+
+    @property
+    def super_name(self) -> str | None:
+        if self.super_class == 0:
+            return None
+        return self.constant_pool[self.constant_pool[self.super_class].name_index]
+
+    def find_method(self, name, descriptor=None):
+        entry = self.method_table.lookup(name, descriptor)
+        if entry is not None:
+            return entry.method
+
+    def find_instructions(self, name, descriptor=None):
+        return self.method_table[name, descriptor].instructions
+
+    def main_method(self):
+        return self.method_table["main", "([Ljava/lang/String;)V"]
 
-    def find_method(self, name):
-        for m in self.methods:
-            utf8 = self.constant_pool[m.name_index]
-            if utf8 == name:
-                return m
+    def main_instructions(self):
+        return self.main_method().instructions
 
-    def find_instructions(self, name):
-        code = self.find_method(name).code
-        return parse_instructions(code)
 
-    def main_instructions(self):
-        return self.find_instructions("main")
+class MethodEntry:
+    """
+    A method of a loaded class whose code is decoded on first use, or when its class is verified
+    """
+
+    __slots__ = ("cls", "method", "name", "descriptor", "max_stack", "max_locals", "_instructions", "_optimized",
+                 "_compact", "closures", "verified", "int_only")
+
+    def __init__(self, cls: ClassFile, method, name: str, descriptor: str):
+        # The class that declares the method
+        self.cls = cls
+        self.method = method
+        self.name = name
+        self.descriptor = descriptor
+        self.max_stack = method.max_stack
+        self.max_locals = method.max_locals
+        self._instructions = None
+        self._optimized = None
+        self._compact = None
+        # Filled in by the closure tier
+        self.closures = None
+        # Whether toyjava.verifier inferred the types of the code, and proved that its operand stack only ever holds ints
+        self.verified = False
+        self.int_only = False
+
+    @property
+    def instructions(self) -> tuple:
+        instructions = self._instructions
+        if instructions is None:
+            logger.debug("Decode the method %s%s", self.name, self.descriptor)
+            instructions = self._instructions = parse_instructions(self.method.code)
+        return instructions
+
+    @instructions.setter
+    def instructions(self, instructions: tuple):
+        self._instructions = instructions
+        self._optimized = None
+
+    @property
+    def optimized(self) -> tuple:
+        """
+        The instructions rewritten by toyjava.peephole, for the dispatch engine
+        """
+
+        if self._optimized is None:
+            if self.int_only:
+                self._optimized = peephole.specialize(self.instructions, self.cls.constant_pool)
+            else:
+                self._optimized = peephole.optimize(self.instructions)
+        return self._optimized
+
+    @property
+    def compact(self):
+        """
+        The code encoded by toyjava.compact, for the compact engine
+        """
+
+        if self._compact is None:
+            logger.debug("Encode the method %s%s", self.name, self.descriptor)
+            self._compact = compact.encode(self.method.code)
+        return self._compact
+
+    @compact.setter
+    def compact(self, code):
+        self._compact = code
+
+
+class MethodTable:
+    """
+    The methods of a class keyed by (name, descriptor)
+
+    The table is populated on the first lookup and each method body is decoded at most once until `invalidate` is called.
+    """
+
+    def __init__(self, cls: ClassFile):
+        self._cls = cls
+        self._entries = None
+        self._by_name = None
+        self._verify = False
+        self._reject_unsupported = False
+
+    def _populate(self):
+        constant_pool = self._cls.constant_pool
+        entries = {}
+        by_name = {}
+        for m in self._cls.methods:
+            name = constant_pool[m.name_index]
+            descriptor = constant_pool[m.descriptor_index]
+            entry = MethodEntry(self._cls, m, name, descriptor)
+            entries[name, descriptor] = entry
+            by_name.setdefault(name, entry)
+        if self._verify:
+            # Before the entries are kept, so that a rejected class has none to run
+            for entry in entries.values():
+                verifier.verify_method(entry, self._reject_unsupported)
+        self._entries = entries
+        self._by_name = by_name
+
+    def lookup(self, name: str, descriptor: str | None = None) -> MethodEntry | None:
+        if self._entries is None:
+            self._populate()
+        if descriptor is None:
+            return self._by_name.get(name)
+        return self._entries.get((name, descriptor))
+
+    def __iter__(self):
+        if self._entries is None:
+            self._populate()
+        return iter(self._entries.values())
+
+    def __getitem__(self, key) -> MethodEntry:
+        name, descriptor = key
+        entry = self.lookup(name, descriptor)
+        if entry is None:
+            raise LookupError(f"No such method: {name}{descriptor or ''}")
+        return entry
+
+    def require_verification(self, reject_unsupported: bool = False):
+        """
+        Verify every method now, raising VerifyError for the first that is rejected,
+        and the entries made after `invalidate` when they are made
+
+        See toyjava.verifier.verify_method for `reject_unsupported`.
+        """
+
+        self._verify = True
+        self._reject_unsupported = reject_unsupported
+        if self._entries is None:
+            self._populate()
+            return
+        for entry in self._entries.values():
+            if not entry.verified:
+                verifier.verify_method(entry, reject_unsupported)
+
+    def invalidate(self):
+        self._entries = None
+        self._by_name = None
+        # The linked constant pool refers to the dropped entries
+        self._cls.constant_pool.resolved = None
 
 
 def parse_class_file(class_file: bytes) -> ClassFile:
-    stream = BytesIO(class_file)
-    reader = ClassFileReader(stream)
+    return read_class_file(ClassFileReader(BytesIO(class_file)))
+
+
+def parse_class_buffer(buffer) -> ClassFile:
+    """
+    Parse a class file from a buffer such as bytes or an mmap without copying it
+
+    The code of each method is a memoryview into the buffer.
+    """
+
+    return read_class_file(BufferReader(buffer))
+
+
+def parse_class_lazily(buffer) -> ClassFile:
+    """
+    Parse a class file from a buffer, recording only where each constant and method is
+
+    Constants and the Code attributes of methods are unpacked when they are first looked up,
+    so loading a big class costs little if only a few of its methods run.
+    """
+
+    return read_class_file(LazyBufferReader(buffer))
+
 
+def read_class_file(reader) -> ClassFile:
     magic = reader.next_u4()
-    logger.debug(f"Read the field 'magic': {magic}")
+    logger.debug("Read the field 'magic': %s", magic)
 
     minor_version = reader.next_u2()
-    logger.debug(f"Read the field 'minor_version': {minor_version}")
+    logger.debug("Read the field 'minor_version': %s", minor_version)
 
     major_version = reader.next_u2()
-    logger.debug(f"Read the field 'major_version': {major_version}")
+    logger.debug("Read the field 'major_version': %s", major_version)
 
     constant_pool_count = reader.next_u2()
-    logger.debug(f"Read the field 'constant_pool_count': {constant_pool_count}")
+    logger.debug("Read the field 'constant_pool_count': %s", constant_pool_count)
 
     # The index starts from 1
-    constant_pool = ConstantPoolReader(reader, constant_pool_count).read()
+    constant_pool = reader.constant_pool_reader(constant_pool_count).read()
 
     access_flags = reader.next_u2()
-    logger.debug(f"Read the field 'access_flags': {access_flags}")
+    logger.debug("Read the field 'access_flags': %s", access_flags)
 
     this_class = reader.next_u2()
-    logger.debug(f"Read the field 'this_class': {this_class}")
+    logger.debug("Read the field 'this_class': %s", this_class)
 
     super_class = reader.next_u2()
-    logger.debug(f"Read the field 'super_class': {super_class}")
+    logger.debug("Read the field 'super_class': %s", super_class)
 
     interfaces_count = reader.next_u2()
-    logger.debug(f"Read the field 'interfaces_count: {interfaces_count}")
+    logger.debug("Read the field 'interfaces_count: %s", interfaces_count)
 
     for _ in range(interfaces_count):
         interface = reader.next_u2()
-        logger.debug(f"Read an interface {interface}")
+        logger.debug("Read an interface %s", interface)
 
     fields_count = reader.next_u2()
-    logger.debug(f"Read the field 'fields_count': {fields_count}")
+    logger.debug("Read the field 'fields_count': %s", fields_count)
 
-    if fields_count != 0:
-        raise NotImplementedError
+    fields = tuple(read_field(reader, constant_pool) for _ in range(fields_count))
 
     methods_count = reader.next_u2()
-    logger.debug(f"Read the field 'methods_count': {methods_count}")
+    logger.debug("Read the field 'methods_count': %s", methods_count)
 
-    methods = MethodsReader(reader, methods_count).read()
+    methods = reader.methods_reader(methods_count, constant_pool).read()
 
     attributes_count = reader.next_u2()
-    logger.debug(f"Read the field 'attributes_count': {attributes_count}")
+    logger.debug("Read the field 'attributes_count': %s", attributes_count)
 
+    bootstrap_methods = ()
     for _ in range(attributes_count):
-        reader.next_u2()
-        attributes_count = reader.next_u4()
-        for _ in range(attributes_count):
-            reader.next_u1()
+        attribute_name = constant_pool[reader.next_u2()]
+        info = reader.read(reader.next_u4())
+        if attribute_name == "BootstrapMethods":
+            bootstrap_methods = read_bootstrap_methods(info)
 
-    assert reader.read(1) == b""
+    assert len(reader.read(1)) == 0
 
-    return ClassFile(magic, constant_pool_count, constant_pool, methods)
+    return ClassFile(
+        magic, constant_pool_count, constant_pool, methods, this_class, super_class, fields, bootstrap_methods,
+    )
 
 
 class ClassFileReader:
@@ -212,17 +513,133 @@ class ClassFileReader:
     def read(self, n: int) -> bytes:
         return self.stream.read(n)
 
+    def constant_pool_reader(self, constant_pool_count: int):
+        return ConstantPoolReader(self, constant_pool_count)
+
+    def methods_reader(self, methods_count: int, constant_pool):
+        return MethodsReader(self, methods_count, constant_pool)
+
+
+U2 = struct.Struct(">H")
+U4 = struct.Struct(">I")
+METHOD_INFO = struct.Struct(">HHHH")
+CODE_ATTRIBUTE = struct.Struct(">HIHHI")
+ATTRIBUTE = struct.Struct(">HI")
+
+
+class BufferReader:
+    """
+    A ClassFileReader over a buffer that unpacks fields at offsets and returns slices as memoryviews
+    """
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        self.offset = 0
+
+    def next_u4(self) -> int:
+        (value,) = U4.unpack_from(self.buffer, self.offset)
+        self.offset += 4
+        return value
+
+    def next_u2(self) -> int:
+        (value,) = U2.unpack_from(self.buffer, self.offset)
+        self.offset += 2
+        return value
+
+    def next_u1(self) -> int:
+        value = self.buffer[self.offset]
+        self.offset += 1
+        return value
+
+    def read(self, n: int) -> memoryview:
+        view = self.buffer[self.offset:self.offset + n]
+        self.offset += len(view)
+        return view
+
+    def constant_pool_reader(self, constant_pool_count: int):
+        return BufferConstantPoolReader(self, constant_pool_count)
+
+    def methods_reader(self, methods_count: int, constant_pool):
+        return BufferMethodsReader(self, methods_count, constant_pool)
+
+
+@dataclass
+class Field:
+    access_flags: int
+    name_index: int
+    descriptor_index: int
+    # The index of the initial value of a static field in the constant pool, 0 if the field has none
+    constant_value_index: int = 0
+
+
+def read_field(reader, constant_pool) -> Field:
+    """
+    Read a field_info with any reader, skipping its attributes other than ConstantValue
+
+    https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.5
+    """
+
+    access_flags = reader.next_u2()
+    name_index = reader.next_u2()
+    descriptor_index = reader.next_u2()
+    attributes_count = reader.next_u2()
+    constant_value_index = 0
+    for _ in range(attributes_count):
+        attribute_name = constant_pool[reader.next_u2()]
+        info = reader.read(reader.next_u4())
+        if attribute_name == "ConstantValue":
+            # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.2
+            constant_value_index = int.from_bytes(info, byteorder="big")
+    field_info = Field(access_flags, name_index, descriptor_index, constant_value_index)
+    logger.debug("Read a field_info: %s", field_info)
+    return field_info
+
+
+@dataclass
+class BootstrapMethod:
+    # The index of a MethodHandle in the constant pool
+    method_ref: int
+    # The indices of the static arguments in the constant pool
+    arguments: tuple
+
+
+def read_bootstrap_methods(info) -> tuple:
+    """
+    Unpack the BootstrapMethods attribute of a class
+
+    https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.23
+    """
+
+    (count,) = U2.unpack_from(info, 0)
+    offset = U2.size
+    bootstrap_methods = []
+    for _ in range(count):
+        method_ref, num_arguments = struct.unpack_from(">HH", info, offset)
+        offset += 4
+        arguments = struct.unpack_from(f">{num_arguments}H", info, offset)
+        offset += 2 * num_arguments
+        bootstrap_methods.append(BootstrapMethod(method_ref, arguments))
+    logger.debug("Read the BootstrapMethods attribute: %s", bootstrap_methods)
+    return tuple(bootstrap_methods)
+
 
 @dataclass
 class Method:
     name_index: int
+    descriptor_index: int
+    # A memoryview if the class is parsed by parse_class_buffer.
+    # Empty if the method has no Code attribute, like an abstract or native method.
     code: bytes
+    max_stack: int
+    max_locals: int
+    access_flags: int = 0
 
 
 class MethodsReader:
-    def __init__(self, reader: ClassFileReader, methods_count: int):
+    def __init__(self, reader: ClassFileReader, methods_count: int, constant_pool):
         self.reader = reader
         self.methods_count = methods_count
+        self.constant_pool = constant_pool
 
     def _next(self):
         """
@@ -230,55 +647,203 @@ class MethodsReader:
         """
 
         access_flags = self.reader.next_u2()
-        logger.debug(f"Read the field 'access_flags': {access_flags}")
+        logger.debug("Read the field 'access_flags': %s", access_flags)
 
         name_index = self.reader.next_u2()
-        logger.debug(f"Read the field 'name_index': {name_index}")
+        logger.debug("Read the field 'name_index': %s", name_index)
 
         descriptor_index = self.reader.next_u2()
-        logger.debug(f"Read the field 'descriptor_index': {descriptor_index}")
+        logger.debug("Read the field 'descriptor_index': %s", descriptor_index)
 
         attributes_count = self.reader.next_u2()
-        logger.debug(f"Read the field 'attributes_count': {attributes_count}")
+        logger.debug("Read the field 'attributes_count': %s", attributes_count)
 
-        # Assume it is CodeAttribute:
-        # https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.3
-        assert attributes_count == 1
+        code, max_stack, max_locals = b"", 0, 0
+        for _ in range(attributes_count):
+            attribute_name_index = self.reader.next_u2()
+            logger.debug("Read the field 'attribute_name_index': %s", attribute_name_index)
+            attribute_length = self.reader.next_u4()
+            logger.debug("Read the field 'attribute_length': %s", attribute_length)
+            if self.constant_pool[attribute_name_index] == "Code":
+                code, max_stack, max_locals = self._code()
+            else:
+                # Such as Exceptions or Signature
+                self.reader.read(attribute_length)
 
-        attribute_name_index = self.reader.next_u2()
-        logger.debug(f"Read the field 'attribute_name_index': {attribute_name_index}")
-        attribute_length = self.reader.next_u4()
-        logger.debug(f"Read the field 'attribute_length': {attribute_length}")
+        return Method(name_index, descriptor_index, code, max_stack, max_locals, access_flags)
 
-        # info = self.reader.read(attribute_length)
-        # logger.debug(f"Read the field 'info' {info.hex()}")
+    def _code(self):
+        """
+        https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.7.3
+        """
 
         max_stack = self.reader.next_u2()
-        logger.debug(f"Read the field 'max_stack': {max_stack}")
+        logger.debug("Read the field 'max_stack': %s", max_stack)
 
-        self.reader.next_u2()  # max_locals
+        max_locals = self.reader.next_u2()
+        logger.debug("Read the field 'max_locals': %s", max_locals)
 
         code_length = self.reader.next_u4()
-        logger.debug(f"Read the field 'code_length': {code_length}")
+        logger.debug("Read the field 'code_length': %s", code_length)
 
         code = self.reader.read(code_length)
-        logger.debug(f"Read the field 'code': {code}")
+        logger.debug("Read the field 'code': %s", code)
 
         exception_table_length = self.reader.next_u2()
-        logger.debug(
-            f"Read the field 'exception_table_length': {exception_table_length}"
-        )
+        logger.debug("Read the field 'exception_table_length': %s", exception_table_length)
         for _ in range(exception_table_length):
             self.reader.read(8)
 
         attributes_count = self.reader.next_u2()
-        logger.debug(f"Read the field 'attributes_count': {attributes_count}")
+        logger.debug("Read the field 'attributes_count': %s", attributes_count)
         for _ in range(attributes_count):
             self.reader.next_u2()  # attribute_name_index2
             attribute_length2 = self.reader.next_u4()
             self.reader.read(attribute_length2)
 
-        return Method(name_index, code)
+        return code, max_stack, max_locals
 
     def read(self):
         return tuple(self._next() for _ in range(self.methods_count))
+
+
+def read_code(buffer, offset: int) -> memoryview:
+    """
+    Return the code in the Code attribute at an offset of a buffer
+    """
+
+    _, _, _, _, code_length = CODE_ATTRIBUTE.unpack_from(buffer, offset)
+    offset += CODE_ATTRIBUTE.size
+    return buffer[offset:offset + code_length]
+
+
+def skip_attributes(buffer, offset: int, attributes_count: int) -> int:
+    for _ in range(attributes_count):
+        _, attribute_length = ATTRIBUTE.unpack_from(buffer, offset)
+        offset += ATTRIBUTE.size + attribute_length
+    return offset
+
+
+def find_code(buffer, offset: int, attributes_count: int, constant_pool) -> int | None:
+    """
+    Return the offset of the Code attribute among the attributes of a method at an offset of a buffer,
+    None if the method has none, like an abstract or native method
+    """
+
+    for _ in range(attributes_count):
+        attribute_name_index, attribute_length = ATTRIBUTE.unpack_from(buffer, offset)
+        if constant_pool[attribute_name_index] == "Code":
+            return offset
+        offset += ATTRIBUTE.size + attribute_length
+    return None
+
+
+class BufferMethodsReader:
+    """
+    A MethodsReader that unpacks the fields of each method_info at once from the buffer of a BufferReader
+    """
+
+    def __init__(self, reader: BufferReader, methods_count: int, constant_pool):
+        self.reader = reader
+        self.methods_count = methods_count
+        self.constant_pool = constant_pool
+
+    def read(self):
+        buffer = self.reader.buffer
+        offset = self.reader.offset
+        methods = []
+        for _ in range(self.methods_count):
+            access_flags, name_index, descriptor_index, attributes_count = METHOD_INFO.unpack_from(buffer, offset)
+            offset += METHOD_INFO.size
+            code_offset = find_code(buffer, offset, attributes_count, self.constant_pool)
+            offset = skip_attributes(buffer, offset, attributes_count)
+            if code_offset is None:
+                code, max_stack, max_locals = b"", 0, 0
+            else:
+                _, _, max_stack, max_locals, _ = CODE_ATTRIBUTE.unpack_from(buffer, code_offset)
+                code = read_code(buffer, code_offset)
+            methods.append(Method(name_index, descriptor_index, code, max_stack, max_locals, access_flags))
+        self.reader.offset = offset
+        logger.debug("Read %s methods", len(methods))
+        return tuple(methods)
+
+
+class LazyMethod:
+    """
+    A method whose code is unpacked from the buffer on first access
+    """
+
+    __slots__ = (
+        "name_index", "descriptor_index", "access_flags", "_buffer", "_attributes", "_attributes_count",
+        "_constant_pool", "_offset", "_code",
+    )
+
+    def __init__(self, name_index: int, descriptor_index: int, buffer, attributes: int, attributes_count: int,
+                 constant_pool, access_flags: int = 0):
+        self.name_index = name_index
+        self.descriptor_index = descriptor_index
+        self.access_flags = access_flags
+        self._buffer = buffer
+        # The offset of the attributes, among which the Code attribute is found on first access
+        self._attributes = attributes
+        self._attributes_count = attributes_count
+        self._constant_pool = constant_pool
+        # The offset of the Code attribute, None if the method has none and -1 until it is found
+        self._offset = -1
+        self._code = None
+
+    def _code_attribute(self) -> int | None:
+        if self._offset == -1:
+            self._offset = find_code(self._buffer, self._attributes, self._attributes_count, self._constant_pool)
+        return self._offset
+
+    @property
+    def max_stack(self) -> int:
+        offset = self._code_attribute()
+        return 0 if offset is None else CODE_ATTRIBUTE.unpack_from(self._buffer, offset)[2]
+
+    @property
+    def max_locals(self) -> int:
+        offset = self._code_attribute()
+        return 0 if offset is None else CODE_ATTRIBUTE.unpack_from(self._buffer, offset)[3]
+
+    @property
+    def code(self) -> memoryview:
+        if self._code is None:
+            offset = self._code_attribute()
+            self._code = b"" if offset is None else read_code(self._buffer, offset)
+        return self._code
+
+
+class LazyMethodsReader:
+    """
+    A MethodsReader that records the offset of the Code attribute of each method in the buffer of a BufferReader
+    """
+
+    def __init__(self, reader: BufferReader, methods_count: int, constant_pool):
+        self.reader = reader
+        self.methods_count = methods_count
+        self.constant_pool = constant_pool
+
+    def read(self):
+        buffer = self.reader.buffer
+        offset = self.reader.offset
+        methods = []
+        for _ in range(self.methods_count):
+            access_flags, name_index, descriptor_index, attributes_count = METHOD_INFO.unpack_from(buffer, offset)
+            offset += METHOD_INFO.size
+            methods.append(
+                LazyMethod(name_index, descriptor_index, buffer, offset, attributes_count, self.constant_pool, access_flags)
+            )
+            offset = skip_attributes(buffer, offset, attributes_count)
+        self.reader.offset = offset
+        logger.debug("Indexed %s methods", len(methods))
+        return tuple(methods)
+
+
+class LazyBufferReader(BufferReader):
+    def constant_pool_reader(self, constant_pool_count: int):
+        return LazyConstantPoolReader(self, constant_pool_count)
+
+    def methods_reader(self, methods_count: int, constant_pool):
+        return LazyMethodsReader(self, methods_count, constant_pool)
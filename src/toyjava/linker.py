@@ -0,0 +1,249 @@
+"""
+Resolve the symbolic references in a constant pool as they are first used
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-5.html#jvms-5.4.3
+"""
+
+import logging
+from dataclasses import dataclass
+
+from toyjava import natives
+from toyjava.constants import Class, Double, Fieldref, Float, Integer, InvokeDynamic, Long, \
+    Methodref, String, loadable_value
+from toyjava.objects import ACC_STATIC, find_field, slot_name
+from toyjava.statics import StaticField
+
+logger = logging.getLogger(__name__)
+
+# The descriptors of the types that take two local variables
+WIDE_TYPES = ("J", "D")
+
+
+@dataclass(frozen=True)
+class ResolvedMethod:
+    class_name: str
+    name: str
+    descriptor: str
+    arg_count: int
+    # The descriptor of the return type, "V" for void
+    return_kind: str
+    # A MethodEntry, or a Python function if `native` is true.
+    # None if the method cannot be resolved.
+    target: object
+    native: bool
+    # Whether each argument is a long or double, which takes two local variables of the callee.
+    # None if no argument is.
+    wide: tuple[bool, ...] | None = None
+
+    @property
+    def arg_slots(self) -> int:
+        """
+        The number of local variables that the arguments take
+        """
+
+        return self.arg_count + (0 if self.wide is None else sum(self.wide))
+
+    def local_variables(self, args: list) -> list:
+        """
+        Lay out the arguments of a call as the first local variables of the callee
+        """
+
+        if self.wide is None:
+            return args
+        local_variables = []
+        for arg, wide in zip(args, self.wide):
+            local_variables.append(arg)
+            if wide:
+                local_variables.append(None)
+        return local_variables
+
+
+@dataclass(frozen=True)
+class ResolvedField:
+    class_name: str
+    name: str
+    descriptor: str
+    # The storage of a static field (see toyjava.statics)
+    cell: StaticField | None = None
+    # The name of the slot of an instance field (see toyjava.objects)
+    slot: str | None = None
+
+
+def parse_method_descriptor(descriptor: str) -> tuple[tuple[str, ...], str]:
+    """
+    Split a method descriptor into the descriptors of its parameter types and its return type
+
+    https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.3.3
+    """
+
+    end = descriptor.index(")")
+    params = []
+    i = 1
+    while i < end:
+        start = i
+        while descriptor[i] == "[":
+            i += 1
+        if descriptor[i] == "L":
+            i = descriptor.index(";", i)
+        i += 1
+        params.append(descriptor[start:i])
+    return tuple(params), descriptor[end + 1:]
+
+
+def _member(constant_pool, ref) -> tuple[str, str, str]:
+    name_and_type = constant_pool[ref.name_and_type_index]
+    return (
+        constant_pool[constant_pool[ref.class_index].name_index],
+        constant_pool[name_and_type.name_index],
+        constant_pool[name_and_type.descriptor_index],
+    )
+
+
+def _load(cls, class_name: str, loader):
+    if class_name == cls.name:
+        return cls
+    if loader is not None:
+        try:
+            return loader.load(class_name)
+        except LookupError as e:
+            logger.debug("Cannot load the class %s: %s", class_name, e)
+
+
+def _hierarchy(owner, loader):
+    """
+    Yield a class and then its superclasses that `loader` can load
+    """
+
+    while owner is not None:
+        yield owner
+        owner = None if loader is None else loader.superclass(owner)
+
+
+def resolve_methodref(cls, methodref: Methodref, loader=None) -> ResolvedMethod:
+    class_name, name, descriptor = _member(cls.constant_pool, methodref)
+    params, return_kind = parse_method_descriptor(descriptor)
+
+    target = natives.METHODS.get((class_name, name, descriptor))
+    native = target is not None
+    if not native:
+        for owner in _hierarchy(_load(cls, class_name, loader), loader):
+            target = owner.method_table.lookup(name, descriptor)
+            if target is not None:
+                break
+    if target is None:
+        logger.debug("Cannot resolve the method %s.%s%s", class_name, name, descriptor)
+
+    wide = tuple(param in WIDE_TYPES for param in params)
+    return ResolvedMethod(
+        class_name, name, descriptor, len(params), return_kind, target, native, wide if any(wide) else None,
+    )
+
+
+def resolve_fieldref(cls, fieldref: Fieldref, loader=None) -> ResolvedField:
+    class_name, name, descriptor = _member(cls.constant_pool, fieldref)
+    key = class_name, name
+    if key in natives.STATIC_FIELDS:
+        return ResolvedField(class_name, name, descriptor, natives.STATIC_FIELDS[key])
+
+    for owner in _hierarchy(_load(cls, class_name, loader), loader):
+        f = find_field(owner, name, descriptor)
+        if f is None:
+            continue
+        if f.access_flags & ACC_STATIC:
+            return ResolvedField(class_name, name, descriptor, owner.statics.field(name, descriptor))
+        return ResolvedField(class_name, name, descriptor, slot=slot_name(owner.name, name))
+    logger.debug("Cannot resolve the field %s.%s", class_name, name)
+    return ResolvedField(class_name, name, descriptor)
+
+
+def resolve_class(cls, c: Class, loader=None) -> type | None:
+    """
+    Resolve a Class to the layout of its instances, or None if it cannot be loaded
+    """
+
+    name = cls.constant_pool[c.name_index]
+    if name in natives.CLASSES:
+        return natives.CLASSES[name]
+    owner = _load(cls, name, loader)
+    if owner is not None and loader is not None:
+        return loader.layout(owner)
+
+
+def resolve_invokedynamic(cls, c: InvokeDynamic) -> ResolvedMethod:
+    """
+    Link a call site to the function that its bootstrap method returns for the static arguments
+
+    Only the bootstrap methods in toyjava.natives.BOOTSTRAP_METHODS are supported,
+    so the target of any other call site is None.
+    """
+
+    constant_pool = cls.constant_pool
+    bootstrap_method = cls.bootstrap_methods[c.bootstrap_method_attr_index]
+    handle = constant_pool[bootstrap_method.method_ref]
+    class_name, bootstrap_name, _ = _member(constant_pool, constant_pool[handle.reference_index])
+    name_and_type = constant_pool[c.name_and_type_index]
+    name = constant_pool[name_and_type.name_index]
+    descriptor = constant_pool[name_and_type.descriptor_index]
+    params, return_kind = parse_method_descriptor(descriptor)
+
+    target = None
+    factory = natives.BOOTSTRAP_METHODS.get((class_name, bootstrap_name))
+    if factory is not None:
+        try:
+            arguments = [loadable_value(constant_pool, index) for index in bootstrap_method.arguments]
+        except NotImplementedError as e:
+            logger.debug("Cannot load a static argument of %s.%s: %s", class_name, bootstrap_name, e)
+        else:
+            target = factory(params, arguments)
+    if target is None:
+        logger.debug("Cannot link the call site %s%s to %s.%s", name, descriptor, class_name, bootstrap_name)
+    return ResolvedMethod(class_name, name, descriptor, len(params), return_kind, target, True)
+
+
+def resolve(cls, index: int, loader=None):
+    c = cls.constant_pool[index]
+    if isinstance(c, Methodref):
+        return resolve_methodref(cls, c, loader)
+    elif isinstance(c, Fieldref):
+        return resolve_fieldref(cls, c, loader)
+    elif isinstance(c, Class):
+        return resolve_class(cls, c, loader)
+    elif isinstance(c, (String, Integer, Float, Long, Double)):
+        # What ldc pushes, so that a String constant is looked up and interned once
+        return loadable_value(cls.constant_pool, index)
+    elif isinstance(c, InvokeDynamic):
+        return resolve_invokedynamic(cls, c)
+
+
+class LazyResolution(dict):
+    """
+    The resolved entries of a constant pool, each resolved on its first lookup
+    """
+
+    def __init__(self, cls, loader=None):
+        super().__init__()
+        self._cls = cls
+        self._loader = loader
+
+    def __missing__(self, index: int):
+        resolved = self[index] = resolve(self._cls, index, self._loader)
+        return resolved
+
+
+def link(cls, loader=None):
+    """
+    Prepare `cls.constant_pool.resolved` to map the index of every Methodref, Fieldref, Class, InvokeDynamic and
+    loadable constant to its resolved form
+
+    Methods and fields of other classes are looked up in the classes that `loader` loads, if it is given
+    (see toyjava.loader).
+    Each reference is resolved on its first lookup, so the classes it refers to are loaded only when they are
+    first used.
+    Linking a class twice has no effect.
+    """
+
+    constant_pool = cls.constant_pool
+    if constant_pool.resolved is not None:
+        return
+    cls.statics.loader = loader
+    constant_pool.resolved = LazyResolution(cls, loader)
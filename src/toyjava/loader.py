@@ -0,0 +1,164 @@
+"""
+Load classes by name from a classpath of directories and jar files
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-5.html#jvms-5.3
+"""
+
+import logging
+import mmap
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+
+from toyjava.jvm import ClassFile, parse_class_lazily
+from toyjava.linker import link
+from toyjava.objects import JavaObject, make_layout
+
+logger = logging.getLogger(__name__)
+
+# https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT 4.3.7
+LOCAL_FILE_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_FILE_HEADER_SIGNATURE = 0x04034B50
+
+
+class ClassNotFoundError(LookupError):
+    pass
+
+
+def _map(path: Path):
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            # An empty file cannot be mapped
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DirectoryEntries:
+    """
+    The class files under a directory, looked up in the file system on demand
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def find(self, name: str):
+        path = self.path / (name + ".class")
+        if path.is_file():
+            return _map(path)
+
+
+class JarEntries:
+    """
+    The class files in a jar (or zip) file
+
+    Only the central directory is read up front. The archive is mapped into memory
+    and an entry is sliced from the mapping, or decompressed from it, when it is looked up.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._buffer = _map(path)
+        with zipfile.ZipFile(self._buffer) as archive:
+            self._infos = {
+                info.filename[:-len(".class")]: info
+                for info in archive.infolist()
+                if info.filename.endswith(".class")
+            }
+
+    def find(self, name: str):
+        info = self._infos.get(name)
+        if info is None:
+            return None
+        header = LOCAL_FILE_HEADER.unpack_from(self._buffer, info.header_offset)
+        if header[0] != LOCAL_FILE_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header of {info.filename} in {self.path}")
+        start = info.header_offset + LOCAL_FILE_HEADER.size + header[-2] + header[-1]
+        data = memoryview(self._buffer)[start:start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_STORED:
+            return data
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        raise NotImplementedError(f"Compression method {info.compress_type} of {info.filename} in {self.path}")
+
+
+class ClassLoader:
+    """
+    Find, parse and link classes by their binary names such as "com/example/Main"
+
+    The classpath is searched in order. Each class is parsed with `parse` on its first reference
+    and kept in `classes`, which also holds the classes given to `define`.
+    The loader also keeps the instance layout of each class (see toyjava.objects).
+    If `verify` is true, the code of every method of a class is verified when the class is defined,
+    so malformed code is rejected before any of it runs (see toyjava.verifier).
+    A method with instructions that no engine runs is rejected too if `reject_unsupported` is true,
+    and otherwise runs unverified.
+    """
+
+    def __init__(self, classpath=(), parse=parse_class_lazily, verify: bool = True, reject_unsupported: bool = False):
+        self.parse = parse
+        self.verify = verify
+        self.reject_unsupported = reject_unsupported
+        self.classes = {}
+        self._layouts = {}
+        self._sources = [
+            DirectoryEntries(path) if path.is_dir() else JarEntries(path)
+            for path in map(Path, classpath)
+        ]
+
+    def define(self, cls: ClassFile) -> ClassFile:
+        """
+        Register and link a class parsed elsewhere, which has no effect if it is already defined
+        """
+
+        name = cls.name
+        defined = self.classes.get(name)
+        if defined is cls:
+            return cls
+        if defined is not None:
+            raise ValueError(f"The class {name} is already defined")
+        if self.verify:
+            cls.method_table.require_verification(self.reject_unsupported)
+        self.classes[name] = cls
+        link(cls, self)
+        return cls
+
+    def load(self, name: str) -> ClassFile:
+        cls = self.classes.get(name)
+        if cls is not None:
+            return cls
+        for source in self._sources:
+            buffer = source.find(name)
+            if buffer is not None:
+                logger.debug("Load the class %s from %s", name, source.path)
+                cls = self.parse(buffer)
+                if cls.name != name:
+                    raise ClassNotFoundError(f"{source.path} has {cls.name} in place of {name}")
+                return self.define(cls)
+        raise ClassNotFoundError(name)
+
+    def superclass(self, cls: ClassFile) -> ClassFile | None:
+        """
+        Return the superclass of a class, or None if it is java/lang/Object or another class that cannot be loaded
+        """
+
+        name = cls.super_name
+        if name is None:
+            return None
+        try:
+            return self.load(name)
+        except ClassNotFoundError:
+            logger.debug("Take the superclass %s of %s for java/lang/Object", name, cls.name)
+            return None
+
+    def layout(self, cls: ClassFile) -> type:
+        """
+        Return the class of the instances of a class, generated on first use
+        """
+
+        layout = self._layouts.get(cls.name)
+        if layout is None:
+            superclass = self.superclass(cls)
+            base = JavaObject if superclass is None else self.layout(superclass)
+            layout = self._layouts[cls.name] = make_layout(cls, base)
+        return layout
@@ -0,0 +1,191 @@
+"""
+Memoize the static methods that are provably pure
+
+A static method is pure if its parameters and return value are ints or longs and its code only computes with them
+and its local variables: it neither reads nor writes a field or an array, allocates nothing
+and only calls pure methods, including itself, and the natives in PURE_NATIVES.
+Its return value then depends on its arguments alone, so a repeated call can return the value of the previous one.
+Such a method gets a Memo, a bounded LRU cache of its return values keyed by its arguments.
+A call that throws stores nothing.
+
+Whether a method is memoized is decided on its first invokestatic under the Memoization of the VirtualMachine
+running it (see `current_memoization`), which keeps the decision and the Memo, so VMs do not share them.
+The profiler and the loop engine always run the methods in full.
+"""
+
+import logging
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from toyjava import natives
+from toyjava.instructions import Push, Iload, Istore, Iload0, Iload1, Iload2, Istore1, Istore2, Iinc, Arithmetic1, \
+    Arithmetic2, Goto, Ifne, BranchIf1, BranchIf2, Tableswitch, Lookupswitch, Ireturn, Pop, Dup, DupX1, Swap, Ldc, \
+    InvokeStatic
+
+logger = logging.getLogger(__name__)
+
+MEMO_SIZE = 4096
+
+# The descriptors of the types that are Python ints
+INT_TYPES = frozenset("BCSIJZ")
+
+# The instructions that only move and compute ints between the operand stack and the local variables
+PURE_INSTRUCTIONS = (
+    Push, Iload, Istore, Iload0, Iload1, Iload2, Istore1, Istore2, Iinc, Arithmetic1, Arithmetic2, Goto, Ifne,
+    BranchIf1, BranchIf2, Tableswitch, Lookupswitch, Ireturn, Pop, Dup, DupX1, Swap,
+)
+
+PURE_NATIVES = frozenset([max, min, natives.abs_int, natives.abs_long])
+
+# The Memoization of the VirtualMachine that is running, None if it does not memoize
+current_memoization: ContextVar = ContextVar("current_memoization", default=None)
+
+# What Memo.lookup returns for arguments that are not cached
+MISSING = object()
+
+
+class Memo:
+    """
+    The return values of a method keyed by the tuple of its arguments, of which the `maxsize` most recent are kept
+    """
+
+    __slots__ = ("entries", "maxsize", "hits", "misses")
+
+    def __init__(self, maxsize: int):
+        self.entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: tuple):
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def store(self, key: tuple, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return value
+
+    def wrap(self, function):
+        """
+        Memoize a function taking the arguments as positional arguments
+        """
+
+        def memoized(*args):
+            value = self.lookup(args)
+            if value is MISSING:
+                value = self.store(args, function(*args))
+            return value
+
+        return memoized
+
+
+@dataclass
+class MemoStats:
+    hits: int
+    misses: int
+    # The number of cached return values
+    size: int
+
+
+class Memoization:
+    """
+    The Memos of the methods that a VirtualMachine memoizes, each holding up to `maxsize` return values
+    """
+
+    def __init__(self, maxsize: int = MEMO_SIZE):
+        self.maxsize = maxsize
+        # "Class.name(descriptor)" -> Memo
+        self.memos = {}
+        # MethodEntry -> its Memo, or None if it is not memoized
+        self.decided = {}
+        # MethodEntry -> whether it is pure, shared by the proofs of the methods called
+        self.proven = {}
+
+    def memo(self, entry) -> Memo | None:
+        """
+        Return the Memo of a method, deciding whether to memoize it on the first call
+        """
+
+        try:
+            return self.decided[entry]
+        except KeyError:
+            pass
+        memo = None
+        if is_pure(entry, self.proven):
+            key = f"{entry.cls.name}.{entry.name}{entry.descriptor}"
+            logger.debug("Memoize the pure method %s", key)
+            memo = self.memos[key] = Memo(self.maxsize)
+        self.decided[entry] = memo
+        return memo
+
+    def stats(self) -> dict[str, MemoStats]:
+        return {key: MemoStats(memo.hits, memo.misses, len(memo.entries)) for key, memo in self.memos.items()}
+
+
+def memo_of(entry) -> Memo | None:
+    """
+    Return the Memo of a method called by invokestatic in the VirtualMachine that is running
+    """
+
+    memoization = current_memoization.get()
+    return None if memoization is None else memoization.memo(entry)
+
+
+def _pure_signature(descriptor: str) -> bool:
+    # Parameters and return type of single characters, e.g. (IJ)I
+    params, _, return_kind = descriptor[1:].partition(")")
+    return return_kind in INT_TYPES and all(param in INT_TYPES for param in params)
+
+
+def is_pure(entry, proven: dict | None = None, assumed: frozenset = frozenset()) -> bool:
+    """
+    Prove that a static method is pure, assuming that the methods in `assumed`, whose proofs are in progress, are.
+    `proven` records the finished proofs, MethodEntry -> whether it is pure, so that each method is proven once
+    """
+
+    if proven is None:
+        proven = {}
+    try:
+        return proven[entry]
+    except KeyError:
+        pass
+    if assumed:
+        pure = proven[entry] = _prove(entry, proven, assumed | {entry})
+        return pure
+    known = set(proven)
+    pure = proven[entry] = _prove(entry, proven, frozenset({entry}))
+    if not pure:
+        # The methods proven pure on the way may have assumed that a method in progress is, which this disproved
+        for method in [method for method in proven if proven[method] and method not in known]:
+            del proven[method]
+    return pure
+
+
+def _prove(entry, proven: dict, assumed: frozenset) -> bool:
+    if not _pure_signature(entry.descriptor):
+        return False
+    resolved = entry.cls.constant_pool.resolved
+    for instruction in entry.instructions:
+        if isinstance(instruction, PURE_INSTRUCTIONS):
+            continue
+        if isinstance(instruction, Ldc) and type(resolved[instruction.index]) is int:
+            continue
+        if isinstance(instruction, InvokeStatic):
+            methodref = resolved[instruction.index]
+            target = methodref.target
+            if methodref.native:
+                if target in PURE_NATIVES:
+                    continue
+            elif target is not None and (target in assumed or is_pure(target, proven, assumed)):
+                continue
+        return False
+    return True
@@ -0,0 +1,123 @@
+"""
+Python implementations of the JDK classes used by the example programs
+
+A method is resolved to its native when a class referring to it is linked (see toyjava.linker),
+so a call runs the Python function directly, without looking it up.
+"""
+
+import time
+
+from toyjava import arithmetic
+from toyjava.arrays import arraycopy
+from toyjava.output import get_output
+from toyjava.statics import StaticField
+from toyjava.strings import StringBuilder, char_at, length, make_concat, make_concat_with_constants, parse_int, string_value
+
+
+class PrintStream:
+    def newline(self):
+        get_output().println("")
+
+    def println(self, value):
+        get_output().println(string_value(value))
+
+    def println_char(self, value: int):
+        get_output().println(chr(value))
+
+    def println_boolean(self, value: int):
+        get_output().println("true" if value else "false")
+
+
+def object_init(self):
+    """
+    The constructor of java.lang.Object, which every constructor calls last
+    """
+
+
+def abs_int(a: int) -> int:
+    """
+    Math.abs(int), which is negative for Integer.MIN_VALUE as in Java
+    """
+
+    return a if a >= 0 else arithmetic.ineg(a)
+
+
+def abs_long(a: int) -> int:
+    return a if a >= 0 else arithmetic.lneg(a)
+
+
+def current_time_millis() -> int:
+    return time.time_ns() // 1_000_000
+
+
+SYSTEM_OUT = PrintStream()
+
+# (class name, field name) -> the field, which getstatic reads like those of loaded classes
+STATIC_FIELDS = {
+    ("java/lang/System", "out"): StaticField(SYSTEM_OUT),
+}
+
+# (class name, method name, descriptor) -> function taking the receiver (if any) and the arguments
+METHODS = {
+    ("java/io/PrintStream", "println", "()V"): PrintStream.newline,
+    ("java/io/PrintStream", "println", "(I)V"): PrintStream.println,
+    ("java/io/PrintStream", "println", "(J)V"): PrintStream.println,
+    ("java/io/PrintStream", "println", "(Ljava/lang/String;)V"): PrintStream.println,
+    ("java/io/PrintStream", "println", "(Ljava/lang/Object;)V"): PrintStream.println,
+    ("java/io/PrintStream", "println", "(C)V"): PrintStream.println_char,
+    ("java/io/PrintStream", "println", "(Z)V"): PrintStream.println_boolean,
+    ("java/lang/Object", "<init>", "()V"): object_init,
+    ("java/lang/System", "arraycopy", "(Ljava/lang/Object;ILjava/lang/Object;II)V"): arraycopy,
+    ("java/lang/System", "nanoTime", "()J"): time.perf_counter_ns,
+    ("java/lang/System", "currentTimeMillis", "()J"): current_time_millis,
+    # The builtins compare ints like Java, and being C functions they are the cheapest to call
+    ("java/lang/Math", "max", "(II)I"): max,
+    ("java/lang/Math", "max", "(JJ)J"): max,
+    ("java/lang/Math", "min", "(II)I"): min,
+    ("java/lang/Math", "min", "(JJ)J"): min,
+    ("java/lang/Math", "abs", "(I)I"): abs_int,
+    ("java/lang/Math", "abs", "(J)J"): abs_long,
+    ("java/lang/Integer", "parseInt", "(Ljava/lang/String;)I"): parse_int,
+    ("java/lang/Integer", "parseInt", "(Ljava/lang/String;I)I"): parse_int,
+    ("java/lang/String", "length", "()I"): length,
+    ("java/lang/String", "charAt", "(I)C"): char_at,
+    ("java/lang/StringBuilder", "<init>", "()V"): object_init,
+    ("java/lang/StringBuilder", "<init>", "(Ljava/lang/String;)V"): StringBuilder.init,
+    ("java/lang/StringBuilder", "<init>", "(I)V"): StringBuilder.init_capacity,
+    ("java/lang/StringBuilder", "append", "(Ljava/lang/String;)Ljava/lang/StringBuilder;"): StringBuilder.append,
+    ("java/lang/StringBuilder", "append", "(Ljava/lang/Object;)Ljava/lang/StringBuilder;"): StringBuilder.append,
+    ("java/lang/StringBuilder", "append", "(Ljava/lang/CharSequence;)Ljava/lang/StringBuilder;"): StringBuilder.append,
+    ("java/lang/StringBuilder", "append", "(I)Ljava/lang/StringBuilder;"): StringBuilder.append,
+    ("java/lang/StringBuilder", "append", "(J)Ljava/lang/StringBuilder;"): StringBuilder.append,
+    ("java/lang/StringBuilder", "append", "(C)Ljava/lang/StringBuilder;"): StringBuilder.append_char,
+    ("java/lang/StringBuilder", "append", "(Z)Ljava/lang/StringBuilder;"): StringBuilder.append_boolean,
+    ("java/lang/StringBuilder", "toString", "()Ljava/lang/String;"): StringBuilder.to_string,
+    ("java/lang/StringBuilder", "length", "()I"): StringBuilder.length,
+}
+
+
+def register(class_name: str, name: str, descriptor: str, function=None):
+    """
+    Implement a method with a Python function, which takes the receiver unless the method is static and the arguments
+
+    The classes linked afterwards call the function directly, even in place of a method of a loaded class.
+    Without `function`, return a decorator that registers the function it decorates.
+    """
+
+    if function is None:
+        return lambda f: register(class_name, name, descriptor, f)
+    METHODS[class_name, name, descriptor] = function
+    return function
+
+
+# Class name -> the layout of its instances, which new allocates like those of loaded classes (see toyjava.objects)
+CLASSES = {
+    "java/lang/StringBuilder": StringBuilder,
+}
+
+# (class name, method name) of a bootstrap method -> function taking the parameter descriptors and the static arguments
+# of a call site and returning the function the call site is linked to
+BOOTSTRAP_METHODS = {
+    ("java/lang/invoke/StringConcatFactory", "makeConcatWithConstants"): make_concat_with_constants,
+    ("java/lang/invoke/StringConcatFactory", "makeConcat"): make_concat,
+}
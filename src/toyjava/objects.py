@@ -0,0 +1,125 @@
+"""
+Instances of loaded classes
+
+Each class gets a generated Python class, its layout, whose __slots__ are the instance fields that the class declares.
+The layout of a subclass derives from that of its superclass, so inherited fields keep their places in the instance.
+A Fieldref is resolved to the name of its slot at link time, so that getfield and putfield look up
+a slot descriptor of a fixed offset and never search the fields of the class hierarchy.
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-2.html#jvms-2.7
+"""
+
+import re
+
+ACC_STATIC = 0x0008
+ACC_NATIVE = 0x0100
+ACC_ABSTRACT = 0x0400
+
+
+class JavaObject:
+    """
+    The base of all layouts, which stands for java.lang.Object
+    """
+
+    __slots__ = ()
+    # The ClassFile of the instances
+    java_class = None
+    # (slot, default value) of every field, including inherited ones
+    defaults = ()
+    # (name, descriptor) -> the MethodEntry that invokevirtual selects for the instances
+    vtable = {}
+
+
+class NullPointerError(TypeError):
+    pass
+
+
+def null_field_access(fieldref) -> NullPointerError:
+    return NullPointerError(f"Cannot access the field {fieldref.class_name}.{fieldref.name} of null")
+
+
+class AbstractMethodError(LookupError):
+    pass
+
+
+def default_value(descriptor: str):
+    """
+    The initial value of a field of a type
+    """
+
+    if descriptor in ("F", "D"):
+        return 0.0
+    if descriptor in ("B", "C", "I", "J", "S", "Z"):
+        return 0
+    return None
+
+
+def slot_name(class_name: str, field_name: str) -> str:
+    """
+    The name of the slot of a field, qualified by its class because a field may hide one of a superclass
+    """
+
+    return re.sub(r"\W", "_", f"{class_name}.{field_name}")
+
+
+def instance_fields(cls):
+    """
+    Yield (name, descriptor) of each instance field that a class declares
+    """
+
+    constant_pool = cls.constant_pool
+    for f in cls.fields:
+        if not f.access_flags & ACC_STATIC:
+            yield constant_pool[f.name_index], constant_pool[f.descriptor_index]
+
+
+def find_field(cls, name: str, descriptor: str):
+    """
+    Return the field_info of a field that a class declares, or None
+    """
+
+    constant_pool = cls.constant_pool
+    for f in cls.fields:
+        if constant_pool[f.name_index] == name and constant_pool[f.descriptor_index] == descriptor:
+            return f
+
+
+def make_layout(cls, base: type = JavaObject) -> type:
+    """
+    Generate the layout of a class whose superclass has the layout `base`
+    """
+
+    own = tuple((slot_name(cls.name, name), default_value(descriptor)) for name, descriptor in instance_fields(cls))
+    defaults = base.defaults + own
+    namespace = {
+        "__slots__": tuple(slot for slot, _ in own),
+        "java_class": cls,
+        "defaults": defaults,
+        "vtable": {},
+        "statics": cls.statics,
+    }
+    if defaults:
+        # An unassigned slot raises AttributeError, so every field gets its default value on allocation
+        source = "def __init__(self):\n" + "".join(f"    self.{slot} = {value!r}\n" for slot, value in defaults)
+        exec(source, namespace)
+    return type(re.sub(r"\W", "_", cls.name), (base,), namespace)
+
+
+def virtual_method(layout: type, name: str, descriptor: str):
+    """
+    Select the method that invokevirtual runs for an instance, searching its class and then the superclasses
+    """
+
+    key = name, descriptor
+    entry = layout.vtable.get(key)
+    if entry is None:
+        for base in layout.__mro__:
+            if base is JavaObject:
+                raise AbstractMethodError(f"{layout.java_class.name}.{name}{descriptor}")
+            entry = base.java_class.method_table.lookup(name, descriptor)
+            if entry is not None:
+                if entry.method.access_flags & ACC_ABSTRACT:
+                    raise AbstractMethodError(f"{layout.java_class.name}.{name}{descriptor}")
+                break
+        layout.vtable[key] = entry
+    return entry
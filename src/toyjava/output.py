@@ -0,0 +1,97 @@
+"""
+Where the output of System.out goes
+
+The natives write to the sink in `current_output`, which VirtualMachine.execute_main sets for the duration of a run.
+Being a context variable, it is separate for each thread and each asyncio task.
+"""
+
+import atexit
+import sys
+from contextvars import ContextVar
+from typing import TextIO
+
+DEFAULT_FLUSH_THRESHOLD = 8192
+
+# The sinks to flush at exit that hold lines, referenced until they are flushed so that no line is lost
+# if a sink is collected with its VirtualMachine before the interpreter exits.
+# A dict, so that they are flushed in the order that they started buffering.
+_unflushed = {}
+
+
+@atexit.register
+def _flush_all():
+    for output in list(_unflushed):
+        output.flush()
+
+
+class BufferedOutput:
+    """
+    Collect lines and write them to a stream in one call once they reach `flush_threshold` characters
+
+    A threshold of 0 writes every line immediately.
+    The lines are also written when main returns if `flush_on_return` is true,
+    and when the interpreter exits if `flush_on_exit` is true.
+    If `stream` is None, the lines are written to the `sys.stdout` of the time of flushing.
+    """
+
+    def __init__(self, stream: TextIO | None = None, flush_threshold: int = DEFAULT_FLUSH_THRESHOLD,
+                 flush_on_return: bool = True, flush_on_exit: bool = True):
+        self.stream = stream
+        self.flush_threshold = flush_threshold
+        self.flush_on_return = flush_on_return
+        self.flush_on_exit = flush_on_exit
+        self._lines = []
+        self._size = 0
+
+    def println(self, text: str):
+        if not self._lines and self.flush_on_exit:
+            _unflushed[self] = None
+        self._lines.append(text)
+        self._size += len(text) + 1
+        if self._size >= self.flush_threshold:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            stream = sys.stdout if self.stream is None else self.stream
+            self._lines.append("")
+            stream.write("\n".join(self._lines))
+            self._lines = []
+            self._size = 0
+            _unflushed.pop(self, None)
+            stream.flush()
+
+    def main_returned(self):
+        if self.flush_on_return:
+            self.flush()
+
+
+class CapturedOutput:
+    """
+    Keep the lines in memory, e.g. for tests
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def println(self, text: str):
+        self.lines.append(text)
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.lines)
+
+    def flush(self):
+        pass
+
+    def main_returned(self):
+        pass
+
+
+# Used outside VirtualMachine.execute_main
+UNBUFFERED = BufferedOutput(flush_threshold=0, flush_on_exit=False)
+
+current_output: ContextVar = ContextVar("current_output")
+
+
+def get_output():
+    return current_output.get(UNBUFFERED)
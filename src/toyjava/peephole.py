@@ -0,0 +1,147 @@
+"""
+A peephole optimizer over decoded instructions for the dispatch engine
+
+Constant arithmetic is folded first, and then common sequences are fused into the superinstructions
+at the end of toyjava.instructions, so that each costs a single dispatch.
+A sequence is rewritten only if no instruction but its first is a branch target.
+Branch targets are remapped after each rewrite.
+The methods that toyjava.verifier proves to compute with ints only are specialized further (see `specialize`).
+"""
+
+from dataclasses import replace
+
+from toyjava import arithmetic
+from toyjava.constants import loadable_value
+from toyjava.instructions import JUMPS, Arithmetic2, BranchIf2, BranchIfLocalConst, BranchIfLocals, Goto, Iadd, \
+    IaddLocalConst, IaddLocals, Iinc, IincGoto, Imul, Isub, IsubLocals, Ldc, LoadConstArithmetic, LoadLoadArithmetic, \
+    Lookupswitch, Push, Tableswitch, branch_targets, load_index
+
+
+def _retarget(instruction, indices: dict):
+    if isinstance(instruction, JUMPS):
+        return replace(instruction, index=indices[instruction.index])
+    if isinstance(instruction, Tableswitch):
+        return replace(
+            instruction,
+            default=indices[instruction.default],
+            indices=tuple(indices[index] for index in instruction.indices),
+        )
+    if isinstance(instruction, Lookupswitch):
+        return replace(
+            instruction,
+            default=indices[instruction.default],
+            indices={match: indices[index] for match, index in instruction.indices.items()},
+        )
+    return instruction
+
+
+def _fold(window: tuple):
+    """
+    Push(a), Push(b), Arithmetic2(f) -> Push(f(a, b))
+    """
+
+    if len(window) < 3:
+        return None
+    a, b, arithmetic = window[:3]
+    if isinstance(a, Push) and isinstance(b, Push) and isinstance(arithmetic, Arithmetic2):
+        try:
+            value = arithmetic.function(a.value, b.value)
+        except ArithmeticError:
+            # Leave it to raise at run time
+            return None
+        return [Push(value)], 3
+
+
+def _fuse(window: tuple):
+    first = window[0]
+    if isinstance(first, Iinc) and len(window) >= 2 and isinstance(window[1], Goto):
+        return [IincGoto(window[1].index, first.index, first.const)], 2
+
+    local = load_index(first)
+    if local is None or len(window) < 3:
+        return None
+    second, third = window[1:3]
+    other = load_index(second)
+    if other is not None:
+        if isinstance(third, Arithmetic2):
+            return [LoadLoadArithmetic(local, other, third.function)], 3
+        if isinstance(third, BranchIf2):
+            return [BranchIfLocals(third.index, local, other, third.predicate)], 3
+    elif isinstance(second, Push):
+        if isinstance(third, Arithmetic2):
+            return [LoadConstArithmetic(local, second.value, third.function)], 3
+        if isinstance(third, BranchIf2):
+            return [BranchIfLocalConst(third.index, local, second.value, third.predicate)], 3
+
+
+# The longest sequence that a rule rewrites
+WINDOW = 3
+
+
+def _rewrite(instructions: tuple, rule) -> tuple:
+    """
+    Replace the sequences for which `rule(window)` returns (replacement, length) and remap the branch targets
+    """
+
+    targets = {target for instruction in instructions for target in branch_targets(instruction)}
+    rewritten = []
+    indices = {}
+    i = 0
+    while i < len(instructions):
+        indices[i] = len(rewritten)
+        end = i + 1
+        while end < min(i + WINDOW, len(instructions)) and end not in targets:
+            end += 1
+        match = rule(instructions[i:end])
+        if match is None:
+            rewritten.append(instructions[i])
+            i += 1
+        else:
+            replacement, length = match
+            rewritten.extend(replacement)
+            i += length
+    return tuple(_retarget(instruction, indices) for instruction in rewritten)
+
+
+def optimize(instructions: tuple) -> tuple:
+    while True:
+        folded = _rewrite(instructions, _fold)
+        if len(folded) == len(instructions):
+            break
+        instructions = folded
+    return _rewrite(instructions, _fuse)
+
+
+INLINED = {arithmetic.iadd: Iadd, arithmetic.isub: Isub, arithmetic.imul: Imul}
+
+
+def _inline(instruction):
+    if isinstance(instruction, Arithmetic2):
+        inlined = INLINED.get(instruction.function)
+        return instruction if inlined is None else inlined()
+    if isinstance(instruction, LoadConstArithmetic):
+        if instruction.function is arithmetic.iadd:
+            return IaddLocalConst(instruction.local, instruction.value)
+        if instruction.function is arithmetic.isub:
+            return IaddLocalConst(instruction.local, -instruction.value)
+    elif isinstance(instruction, LoadLoadArithmetic):
+        if instruction.function is arithmetic.iadd:
+            return IaddLocals(instruction.first, instruction.second)
+        if instruction.function is arithmetic.isub:
+            return IsubLocals(instruction.first, instruction.second)
+    return instruction
+
+
+def specialize(instructions: tuple, constant_pool) -> tuple:
+    """
+    Optimize the instructions of a method whose operand stack only ever holds ints
+
+    Its ldc instructions can only load int constants, which become Push so that they are folded and fused like others,
+    and then the int additions, subtractions and multiplications are replaced with the int-specialized instructions.
+    """
+
+    instructions = tuple(
+        Push(loadable_value(constant_pool, instruction.index)) if isinstance(instruction, Ldc) else instruction
+        for instruction in instructions
+    )
+    return tuple(map(_inline, optimize(instructions)))
@@ -0,0 +1,294 @@
+"""
+An instrumented interpreter that reports where a program spends its time
+
+It runs methods like the dispatch engine, on a chain of frames, with handlers of its own for calls, returns and
+conditional branches, so the other engines carry no instrumentation at all.
+A method is timed from the call that makes its frame to the return that drops it.
+Instructions are counted by their mnemonics, so that iadd and isub or iconst_1 and bipush are told apart.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import repeat
+from time import perf_counter
+
+from toyjava import dispatch
+from toyjava.instructions import Ifne, BranchIf1, BranchIf2, Invokevirtual, InvokeStatic, Invokespecial, Ireturn, \
+    Return, mnemonics
+from toyjava.objects import NullPointerError, virtual_method
+
+
+@dataclass
+class MethodProfile:
+    invocations: int = 0
+    # Seconds in the method and its callees, counting only the outermost of recursive invocations
+    inclusive: float = 0.0
+    # Seconds in the method itself
+    exclusive: float = 0.0
+    _active: int = field(default=0, repr=False, compare=False)
+
+
+@dataclass
+class BranchProfile:
+    taken: int = 0
+    not_taken: int = 0
+
+    @property
+    def taken_ratio(self) -> float:
+        total = self.taken + self.not_taken
+        return self.taken / total if total else 0.0
+
+
+@dataclass
+class ProfileReport:
+    # Mnemonic -> executions
+    opcodes: Counter = field(default_factory=Counter)
+    # "Class.name(descriptor)" -> profile, including natives
+    methods: dict[str, MethodProfile] = field(default_factory=dict)
+    # ("Class.name(descriptor)", index of the branch instruction) -> profile
+    branches: dict[tuple[str, int], BranchProfile] = field(default_factory=dict)
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.opcodes.values())
+
+    def format(self, limit: int = 20) -> str:
+        lines = [f"{self.instructions} instructions", "", f"{'instruction':24} {'count':>12}"]
+        for name, count in self.opcodes.most_common(limit):
+            lines.append(f"{name:24} {count:12}")
+
+        lines += ["", f"{'method':48} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14}"]
+        methods = sorted(self.methods.items(), key=lambda item: item[1].exclusive, reverse=True)
+        for name, profile in methods[:limit]:
+            lines.append(
+                f"{name:48} {profile.invocations:10} {profile.inclusive * 1000:14.3f} {profile.exclusive * 1000:14.3f}"
+            )
+
+        lines += ["", f"{'branch':56} {'taken':>10} {'not taken':>10} {'ratio':>6}"]
+        branches = sorted(self.branches.items(), key=lambda item: item[1].taken + item[1].not_taken, reverse=True)
+        for (method, index), profile in branches[:limit]:
+            lines.append(
+                f"{method + ' @' + str(index):56} {profile.taken:10} {profile.not_taken:10} {profile.taken_ratio:6.2f}"
+            )
+        return "\n".join(lines)
+
+
+def _method_key(class_name: str, name: str, descriptor: str) -> str:
+    return f"{class_name}.{name}{descriptor}"
+
+
+class ProfileFrame(dispatch.Frame):
+    __slots__ = ("profiler", "key", "mnemonics", "profile", "start", "children")
+
+    def __init__(self, entry, local_variables, profiler, caller):
+        super().__init__(entry.cls, entry.instructions, local_variables, False, caller)
+        self.profiler = profiler
+        self.key = _method_key(entry.cls.name, entry.name, entry.descriptor)
+        # The mnemonic of each instruction
+        self.mnemonics, self.profile = profiler.enter(entry, self.key)
+        # Seconds spent in the callees so far
+        self.children = 0.0
+        # Last, so that setting up the frame is not timed
+        self.start = perf_counter()
+
+
+def _invoke(frame, instruction, arg_count):
+    methodref = frame.cls.constant_pool.resolved[instruction.index]
+    if methodref.target is None:
+        return dispatch.HANDLERS[type(instruction)](frame, instruction)
+
+    operand_stack = frame.operand_stack
+    split = len(operand_stack) - arg_count
+    args = operand_stack[split:]
+    del operand_stack[split:]
+
+    profiler = frame.profiler
+    if methodref.native:
+        key = _method_key(methodref.class_name, methodref.name, methodref.descriptor)
+        return_value = profiler.timed(frame, key, methodref.target, *args)
+        if methodref.return_kind != "V":
+            operand_stack.append(return_value)
+        return frame
+    elif isinstance(instruction, InvokeStatic):
+        methodref.target.cls.statics.initialize()
+        return profiler.call(methodref.target, methodref.local_variables(args), frame)
+    receiver = args[0]
+    if receiver is None:
+        raise NullPointerError(f"Cannot invoke {methodref.class_name}.{methodref.name} on null")
+    target = methodref.target
+    if isinstance(instruction, Invokevirtual):
+        target = virtual_method(type(receiver), methodref.name, methodref.descriptor)
+    return profiler.call(target, args[:1] + methodref.local_variables(args[1:]), frame)
+
+
+def _invokestatic(frame, instruction):
+    return _invoke(frame, instruction, frame.cls.constant_pool.resolved[instruction.index].arg_count)
+
+
+def _invokevirtual(frame, instruction):
+    # The arguments and the object reference
+    return _invoke(frame, instruction, frame.cls.constant_pool.resolved[instruction.index].arg_count + 1)
+
+
+def _invokespecial(frame, instruction):
+    return _invoke(frame, instruction, frame.cls.constant_pool.resolved[instruction.index].arg_count + 1)
+
+
+def _branch(frame, instruction, taken: bool):
+    """
+    Record the outcome of a conditional branch and take it if `taken`
+    """
+
+    branches = frame.profiler.report.branches
+    key = frame.key, frame.pc - 1
+    profile = branches.get(key)
+    if profile is None:
+        profile = branches[key] = BranchProfile()
+    if taken:
+        profile.taken += 1
+        frame.pc = instruction.index
+    else:
+        profile.not_taken += 1
+    return frame
+
+
+def _ifne(frame, instruction):
+    return _branch(frame, instruction, frame.operand_stack.pop() != 0)
+
+
+def _branch_if1(frame, instruction):
+    return _branch(frame, instruction, instruction.predicate(frame.operand_stack.pop(), instruction.operand))
+
+
+def _branch_if2(frame, instruction):
+    operand_stack = frame.operand_stack
+    v2 = operand_stack.pop()
+    v1 = operand_stack.pop()
+    return _branch(frame, instruction, instruction.predicate(v1, v2))
+
+
+def _finish(frame):
+    """
+    Add the time since a method was called to its profile and to the time its caller spent in callees
+    """
+
+    elapsed = perf_counter() - frame.start
+    profile = frame.profile
+    profile._active -= 1
+    if not profile._active:
+        profile.inclusive += elapsed
+    profile.exclusive += elapsed - frame.children
+    if frame.caller is not None:
+        frame.caller.children += elapsed
+
+
+def _return(frame, instruction):
+    _finish(frame)
+    return dispatch.HANDLERS[Return](frame, instruction)
+
+
+def _ireturn(frame, instruction):
+    _finish(frame)
+    return dispatch.HANDLERS[Ireturn](frame, instruction)
+
+
+HANDLERS = {
+    **dispatch.HANDLERS,
+    Return: _return,
+    Ireturn: _ireturn,
+    Invokevirtual: _invokevirtual,
+    InvokeStatic: _invokestatic,
+    Invokespecial: _invokespecial,
+    Ifne: _ifne,
+    BranchIf1: _branch_if1,
+    BranchIf2: _branch_if2,
+}
+
+
+class Profiler:
+    def __init__(self):
+        self.report = ProfileReport()
+        self._counts = Counter()
+        # MethodEntry -> (the mnemonic of each instruction, MethodProfile)
+        self._methods = {}
+        # The frame running in the innermost `invoke`, None outside of any
+        self._current = None
+
+    def _method(self, key: str) -> MethodProfile:
+        profile = self.report.methods.get(key)
+        if profile is None:
+            profile = self.report.methods[key] = MethodProfile()
+        return profile
+
+    def enter(self, entry, key: str) -> tuple[list[str], MethodProfile]:
+        """
+        Count an invocation of a method and return the mnemonics of its instructions and its profile
+        """
+
+        method = self._methods.get(entry)
+        if method is None:
+            method = self._methods[entry] = mnemonics(entry.method.code), self._method(key)
+        profile = method[1]
+        profile.invocations += 1
+        profile._active += 1
+        return method
+
+    def timed(self, frame, key: str, function, *args):
+        """
+        Call a native method from a frame
+        """
+
+        profile = self._method(key)
+        profile.invocations += 1
+        start = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = perf_counter() - start
+            profile.inclusive += elapsed
+            profile.exclusive += elapsed
+            frame.children += elapsed
+
+    def call(self, entry, local_variables, caller) -> ProfileFrame:
+        if len(local_variables) < entry.max_locals:
+            local_variables += repeat(None, entry.max_locals - len(local_variables))
+        return ProfileFrame(entry, local_variables, self, caller)
+
+    def invoke(self, entry, local_variables):
+        """
+        Run a method, such as main or a <clinit> that a running method triggers, and return its return value
+        """
+
+        outer = self._current
+        frame = current = self.call(entry, local_variables, None)
+        self._current = current
+        instructions = current.instructions
+        names = current.mnemonics
+        handlers = HANDLERS
+        counts = self._counts
+        try:
+            while True:
+                pc = current.pc
+                instruction = instructions[pc]
+                current.pc = pc + 1
+                counts[names[pc]] += 1
+                try:
+                    handler = handlers[type(instruction)]
+                except KeyError:
+                    raise NotImplementedError(instruction) from None
+                following = handler(current, instruction)
+                if following is not current:
+                    if following is None:
+                        return frame.return_value
+                    current = self._current = following
+                    instructions = current.instructions
+                    names = current.mnemonics
+        finally:
+            self._current = outer
+            if outer is not None:
+                # The time of a nested run counts as time in a callee of the frame that triggered it
+                outer.children += perf_counter() - frame.start
+
+    def finish(self) -> ProfileReport:
+        self.report.opcodes = self._counts
+        return self.report
@@ -0,0 +1,118 @@
+"""
+Static fields and class initialization
+
+Each static field is stored in a StaticField owned by its class (see ClassFile.statics),
+and a Fieldref to it is resolved to that object at link time.
+So getstatic and putstatic read and write an attribute of an object bound in advance,
+without looking up the field by name or walking the constant pool.
+
+A class is initialized, which runs its <clinit>, on the first getstatic, putstatic, invokestatic or new that uses it.
+Until then its fields are PendingStaticFields, whose first access initializes the class.
+Initializing turns them into plain StaticFields, so later accesses pay nothing for the check.
+
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-5.html#jvms-5.5
+"""
+
+import logging
+from contextvars import ContextVar
+
+from toyjava.constants import loadable_value
+from toyjava.objects import ACC_STATIC, default_value
+
+logger = logging.getLogger(__name__)
+
+# The function taking a MethodEntry and its local variables that runs <clinit>.
+# VirtualMachine sets it for the duration of a run, so that <clinit> runs in the engine of the program.
+current_interpreter: ContextVar = ContextVar("current_interpreter")
+
+
+class StaticField:
+    __slots__ = ("value", "owner")
+
+    def __init__(self, value, owner=None):
+        self.value = value
+        # The ClassStatics of the declaring class, None for the fields of natives
+        self.owner = owner
+
+
+_value = StaticField.value
+
+
+class PendingStaticField(StaticField):
+    """
+    A static field of a class that is not initialized yet
+    """
+
+    __slots__ = ()
+
+    @property
+    def value(self):
+        self.owner.initialize()
+        return _value.__get__(self)
+
+    @value.setter
+    def value(self, value):
+        self.owner.initialize()
+        _value.__set__(self, value)
+
+
+class ClassStatics:
+    """
+    The static fields of a class and whether it is initialized
+
+    The fields are created on the first lookup, with the value of their ConstantValue attribute if any.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        # The loader that finds the superclass, which is initialized first (set by toyjava.linker.link)
+        self.loader = None
+        self.initialized = False
+        self._fields = None
+
+    def _populate(self):
+        constant_pool = self.cls.constant_pool
+        self._fields = {}
+        for f in self.cls.fields:
+            if not f.access_flags & ACC_STATIC:
+                continue
+            name = constant_pool[f.name_index]
+            descriptor = constant_pool[f.descriptor_index]
+            if f.constant_value_index:
+                value = loadable_value(constant_pool, f.constant_value_index)
+            else:
+                value = default_value(descriptor)
+            field = self._fields[name, descriptor] = StaticField(value, self)
+            if not self.initialized:
+                field.__class__ = PendingStaticField
+
+    def field(self, name: str, descriptor: str) -> StaticField | None:
+        if self._fields is None:
+            self._populate()
+        return self._fields.get((name, descriptor))
+
+    def initialize(self):
+        """
+        Initialize the superclass and then run <clinit>, unless the class is initialized or being initialized
+        """
+
+        if self.initialized:
+            return
+        # Marked first, so that <clinit> itself and the classes it uses see the fields as they are
+        self.initialized = True
+        if self._fields is not None:
+            for field in self._fields.values():
+                field.__class__ = StaticField
+        if self.loader is not None:
+            superclass = self.loader.superclass(self.cls)
+            if superclass is not None:
+                superclass.statics.initialize()
+        clinit = self.cls.method_table.lookup("<clinit>", "()V")
+        if clinit is not None:
+            logger.debug("Initialize the class %s", self.cls.name)
+            current_interpreter.get()(clinit, [None] * clinit.max_locals)
+
+
+# The statics of a native class, which has neither static fields nor <clinit>
+NO_STATICS = ClassStatics(None)
+NO_STATICS.initialized = True
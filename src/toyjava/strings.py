@@ -0,0 +1,207 @@
+"""
+Java strings, which are Python strs
+
+String constants are interned when they are loaded (see toyjava.constants.loadable_value),
+so the equal literals of all classes are the same object, as `==` on them requires.
+
+javac compiles `"Fizz" + i` into an invokedynamic whose bootstrap method is StringConcatFactory.makeConcatWithConstants.
+The call site is linked to a function generated from its recipe,
+which formats all the parts with one f-string, i.e. a single join without intermediate strings.
+StringBuilder, which older compilers emit instead, keeps the appended strings in a list and joins them once in toString.
+
+A char is the code point of a character of a str rather than a UTF-16 code unit,
+so the strings of characters outside the Basic Multilingual Plane are shorter than in Java.
+
+https://docs.oracle.com/javase/specs/jls/se13/html/jls-15.html#jls-15.18.1
+https://docs.oracle.com/en/java/javase/13/docs/api/java.base/java/lang/invoke/StringConcatFactory.html
+"""
+
+from toyjava.arithmetic import INT_MAX, INT_MIN
+from toyjava.objects import NullPointerError
+from toyjava.statics import NO_STATICS
+
+# The tags of a recipe of makeConcatWithConstants
+TAG_ARGUMENT = "\1"
+TAG_CONSTANT = "\2"
+
+# The descriptor of a primitive type -> the expression converting a value of the type to a string in generated code.
+# The other primitive types convert like Python ints and floats, and references are converted by string_value.
+_CONVERSIONS = {
+    "B": "{}",
+    "S": "{}",
+    "I": "{}",
+    "J": "{}",
+    "F": "{}",
+    "D": "{}",
+    "C": "{{chr({})}}",
+    "Z": "{{'true' if {} else 'false'}}",
+}
+
+
+# The digits of radix 36, those of smaller radixes being a prefix
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class StringIndexOutOfBoundsError(IndexError):
+    pass
+
+
+class NumberFormatError(ValueError):
+    pass
+
+
+def length(s: str) -> int:
+    """
+    String.length()
+    """
+
+    if s is None:
+        raise NullPointerError("Cannot invoke java/lang/String.length on null")
+    return len(s)
+
+
+def char_at(s: str, index: int) -> int:
+    """
+    String.charAt(int)
+    """
+
+    if s is None:
+        raise NullPointerError("Cannot invoke java/lang/String.charAt on null")
+    if 0 <= index < len(s):
+        return ord(s[index])
+    raise StringIndexOutOfBoundsError(f"Index {index} out of bounds for length {len(s)}")
+
+
+def parse_int(s: str, radix: int = 10) -> int:
+    """
+    Integer.parseInt(String, int), which unlike int() accepts neither spaces, underscores nor prefixes like 0x
+    """
+
+    if s is None:
+        raise NumberFormatError("Cannot parse null string: null")
+    digits = s[1:] if s[:1] in ("+", "-") else s
+    if 2 <= radix <= 36 and digits and all(c in _DIGITS[:radix] for c in digits.lower()):
+        value = int(s, radix)
+        if INT_MIN <= value <= INT_MAX:
+            return value
+    suffix = "" if radix == 10 else f" under radix {radix}"
+    raise NumberFormatError(f'For input string: "{s}"{suffix}')
+
+
+def string_value(value) -> str:
+    """
+    String.valueOf(Object)
+    """
+
+    if type(value) is str:
+        return value
+    if value is None:
+        return "null"
+    if isinstance(value, StringBuilder):
+        return value.to_string()
+    return str(value)
+
+
+def concat_function(params: tuple, parts: list):
+    """
+    Generate a function that concatenates its arguments, of types `params`, as `parts` lay out
+
+    Each part is either a constant string or the index of an argument.
+    """
+
+    names = [f"a{i}" for i in range(len(params))]
+    namespace = {"string_value": string_value}
+    pieces = []
+    for part in parts:
+        if isinstance(part, str):
+            if part:
+                # A constant is a variable of the namespace rather than escaped into the source
+                name = f"c{len(namespace)}"
+                namespace[name] = part
+                pieces.append(f"{{{name}}}")
+        else:
+            conversion = _CONVERSIONS.get(params[part], "{{string_value({})}}")
+            if conversion == "{}":
+                conversion = "{{{}}}"
+            pieces.append(conversion.format(names[part]))
+    source = f"def concat({', '.join(names)}):\n    return f{''.join(pieces)!r}\n"
+    exec(source, namespace)
+    return namespace["concat"]
+
+
+def make_concat_with_constants(params: tuple, arguments: list):
+    """
+    Link a call site of StringConcatFactory.makeConcatWithConstants, whose first static argument is the recipe
+    """
+
+    recipe, *constants = arguments
+    constants = iter(constants)
+    parts = []
+    literal = []
+    index = 0
+    for c in recipe:
+        if c == TAG_ARGUMENT:
+            parts.append("".join(literal))
+            parts.append(index)
+            literal = []
+            index += 1
+        elif c == TAG_CONSTANT:
+            literal.append(string_value(next(constants)))
+        else:
+            literal.append(c)
+    parts.append("".join(literal))
+    return concat_function(params, parts)
+
+
+def make_concat(params: tuple, arguments: list):
+    """
+    Link a call site of StringConcatFactory.makeConcat, which concatenates all its arguments
+    """
+
+    return concat_function(params, list(range(len(params))))
+
+
+class StringBuilder:
+    """
+    java.lang.StringBuilder, which keeps the appended strings in a list until they are joined
+    """
+
+    __slots__ = ("parts",)
+    # Like the layout of a loaded class (see toyjava.objects)
+    statics = NO_STATICS
+
+    def __init__(self):
+        self.parts = []
+
+    def init(self, value: str):
+        self.parts.append(string_value(value))
+
+    def init_capacity(self, capacity: int):
+        pass
+
+    def append(self, value):
+        self.parts.append(string_value(value))
+        return self
+
+    def append_char(self, value: int):
+        self.parts.append(chr(value))
+        return self
+
+    def append_boolean(self, value: int):
+        self.parts.append("true" if value else "false")
+        return self
+
+    def to_string(self) -> str:
+        parts = self.parts
+        if len(parts) == 1:
+            return parts[0]
+        # The joined string replaces the parts, so that the next call does not join them again
+        joined = "".join(parts)
+        self.parts = [joined]
+        return joined
+
+    def length(self) -> int:
+        return len(self.to_string())
+
+    def __str__(self):
+        return self.to_string()
@@ -0,0 +1,388 @@
+"""
+Verify the code of a method by type inference before any of it runs
+
+A dataflow pass over the decoded instructions of each method infers the types of the operand stack and the local
+variables before every reachable instruction, like the verifier of class files older than version 50:
+https://docs.oracle.com/javase/specs/jvms/se13/html/jvms-4.html#jvms-4.10.2
+Newer class files carry such frames in their StackMapTable attributes, which are skipped and inferred instead,
+so that classes assembled without them are verified alike.
+
+A method is rejected with a VerifyError if its code cannot be decoded,
+pops a value of the wrong type, overflows `max_stack` or `max_locals`, reaches a branch target with different
+stack heights or types, or runs past its last instruction.
+A method with an instruction that no engine runs, such as checkcast or a float operation, cannot be inferred.
+Unless `reject_unsupported` is set, such a method is deliberately left unverified, with a warning, and runs until it
+reaches that instruction as it would without verification, since programs often only use these instructions on
+paths that they do not take. Otherwise it is rejected with an UnsupportedInstruction, a VerifyError, like malformed
+code.
+The verified methods whose operand stack only ever holds ints are marked `int_only`,
+and the dispatch engine runs them with int-specialized instructions (see toyjava.peephole.specialize).
+
+A ClassLoader verifies every method of a class when it defines it, so a program is rejected before any of it runs
+(see MethodTable.require_verification).
+
+The types are single characters like the descriptors they come from. As in the operand stack of the engines,
+a long or double is a single value on the operand stack and takes two local variables.
+"""
+
+import logging
+import struct
+from dataclasses import dataclass
+
+from toyjava.constants import Class, Double, Fieldref, Float, Integer, InvokeDynamic, Long, Methodref, String
+from toyjava.instructions import TERMINATORS, Generic, branch_targets, load_index, mnemonics, store_index
+from toyjava.linker import parse_method_descriptor
+from toyjava.objects import ACC_ABSTRACT, ACC_NATIVE, ACC_STATIC
+
+logger = logging.getLogger(__name__)
+
+INT = "I"
+LONG = "J"
+FLOAT = "F"
+DOUBLE = "D"
+REFERENCE = "L"
+# A local variable that cannot be loaded: never stored, the second half of a long or double,
+# or holding values of different types on different paths
+TOP = "T"
+
+WIDE = (LONG, DOUBLE)
+
+# The verification type of each descriptor, by its first character
+TYPES = {"B": INT, "C": INT, "S": INT, "I": INT, "Z": INT, "J": LONG, "F": FLOAT, "D": DOUBLE, "L": REFERENCE,
+         "[": REFERENCE}
+
+# The type of each prefix of the typed mnemonics such as iload, lastore and areturn
+PREFIXES = {"i": INT, "l": LONG, "f": FLOAT, "d": DOUBLE, "a": REFERENCE, "b": INT, "c": INT, "s": INT}
+
+
+def _effects() -> dict[str, tuple[str, str]]:
+    """
+    The types that each instruction with a fixed effect pops, bottom first, and pushes
+    """
+
+    effects = {"aconst_null": ("", REFERENCE), "lconst_0": ("", LONG), "lconst_1": ("", LONG),
+               "bipush": ("", INT), "sipush": ("", INT)}
+    for value in ["m1", "0", "1", "2", "3", "4", "5"]:
+        effects[f"iconst_{value}"] = ("", INT)
+    for prefix, kind in PREFIXES.items():
+        effects[f"{prefix}aload"] = (REFERENCE + INT, kind)
+        effects[f"{prefix}astore"] = (REFERENCE + INT + kind, "")
+    for prefix, kind in (("i", INT), ("l", LONG)):
+        for operation in ["add", "sub", "mul", "div", "rem", "and", "or", "xor"]:
+            effects[prefix + operation] = (kind + kind, kind)
+        for operation in ["shl", "shr", "ushr"]:
+            effects[prefix + operation] = (kind + INT, kind)
+        effects[prefix + "neg"] = (kind, kind)
+    effects.update({
+        "i2l": (INT, LONG), "l2i": (LONG, INT), "i2b": (INT, INT), "i2c": (INT, INT), "i2s": (INT, INT),
+        "lcmp": (LONG + LONG, INT),
+        "goto": ("", ""), "goto_w": ("", ""), "tableswitch": (INT, ""), "lookupswitch": (INT, ""),
+        "ifnull": (REFERENCE, ""), "ifnonnull": (REFERENCE, ""),
+        "if_acmpeq": (REFERENCE + REFERENCE, ""), "if_acmpne": (REFERENCE + REFERENCE, ""),
+        "new": ("", REFERENCE), "newarray": (INT, REFERENCE), "anewarray": (INT, REFERENCE),
+        "arraylength": (REFERENCE, INT),
+    })
+    for condition in ["eq", "ne", "lt", "ge", "gt", "le"]:
+        effects[f"if{condition}"] = (INT, "")
+        effects[f"if_icmp{condition}"] = (INT + INT, "")
+    return effects
+
+
+EFFECTS = _effects()
+
+
+class VerifyError(ValueError):
+    pass
+
+
+class UnsupportedInstruction(VerifyError):
+    """
+    The code has an instruction that no engine runs, whose effect on the types is unknown
+    """
+
+
+@dataclass(frozen=True)
+class StackMapFrame:
+    """
+    The types of the operand stack, bottom first, and of the local variables before an instruction
+    """
+
+    stack: tuple[str, ...]
+    local_variables: tuple[str, ...]
+
+
+def verification_type(descriptor: str) -> str:
+    return TYPES[descriptor[0]]
+
+
+def _merge(frame: StackMapFrame, other: StackMapFrame) -> StackMapFrame:
+    if frame.stack != other.stack:
+        raise ValueError(f"Inconsistent stacks {''.join(frame.stack)} and {''.join(other.stack)}")
+    local_variables = tuple(a if a == b else TOP for a, b in zip(frame.local_variables, other.local_variables))
+    if local_variables == frame.local_variables:
+        return frame
+    return StackMapFrame(frame.stack, local_variables)
+
+
+class _Inference:
+    """
+    The state of inferring the frames of one method
+    """
+
+    def __init__(self, entry, instructions, names: list[str]):
+        self.entry = entry
+        self.constant_pool = entry.cls.constant_pool
+        self.instructions = instructions
+        # The mnemonic of each instruction, which tells apart the types that the decoded instructions share
+        self.mnemonics = names
+        self.stack = []
+        self.local_variables = []
+
+    def initial(self) -> StackMapFrame:
+        params, _ = parse_method_descriptor(self.entry.descriptor)
+        local_variables = [] if self.entry.method.access_flags & ACC_STATIC else [REFERENCE]
+        for param in params:
+            kind = verification_type(param)
+            local_variables.append(kind)
+            if kind in WIDE:
+                local_variables.append(TOP)
+        if len(local_variables) > self.entry.max_locals:
+            raise ValueError(f"The parameters take {len(local_variables)} local variables, over max_locals")
+        local_variables += [TOP] * (self.entry.max_locals - len(local_variables))
+        return StackMapFrame((), tuple(local_variables))
+
+    def pop(self, kind: str | None = None) -> str:
+        if not self.stack:
+            raise ValueError("Pop from an empty stack")
+        popped = self.stack.pop()
+        if kind is not None and popped != kind:
+            raise ValueError(f"Expected {kind} on the stack but found {popped}")
+        return popped
+
+    def pop_all(self, kinds: str):
+        for kind in reversed(kinds):
+            self.pop(kind)
+
+    def push(self, kind: str):
+        self.stack.append(kind)
+        if sum(2 if kind in WIDE else 1 for kind in self.stack) > self.entry.max_stack:
+            raise ValueError(f"The stack grows over max_stack {self.entry.max_stack}")
+
+    def load(self, index: int, kind: str):
+        if index >= len(self.local_variables):
+            raise ValueError(f"Load from the local variable {index} over max_locals")
+        if self.local_variables[index] != kind:
+            raise ValueError(f"Expected {kind} in the local variable {index} but found {self.local_variables[index]}")
+        self.push(kind)
+
+    def store(self, index: int, kind: str):
+        self.pop(kind)
+        local_variables = self.local_variables
+        end = index + (2 if kind in WIDE else 1)
+        if end > len(local_variables):
+            raise ValueError(f"Store to the local variable {end - 1} over max_locals")
+        # Overwriting the second half of a long or double leaves its first half unusable
+        if index > 0 and local_variables[index - 1] in WIDE:
+            local_variables[index - 1] = TOP
+        local_variables[index:end] = [kind] if end == index + 1 else [kind, TOP]
+
+    def member_type(self, index: int, kinds: tuple) -> str:
+        """
+        The descriptor of the field, method or call site that a constant refers to
+        """
+
+        constant = self.constant_pool[index]
+        if not isinstance(constant, kinds):
+            raise ValueError(f"The constant {index} is not a {' or '.join(kind.__name__ for kind in kinds)}")
+        name_and_type = self.constant_pool[constant.name_and_type_index]
+        return self.constant_pool[name_and_type.descriptor_index]
+
+    def invoke(self, index: int, kinds: tuple, receiver: bool):
+        params, return_type = parse_method_descriptor(self.member_type(index, kinds))
+        for param in reversed(params):
+            self.pop(verification_type(param))
+        if receiver:
+            self.pop(REFERENCE)
+        if return_type != "V":
+            self.push(verification_type(return_type))
+
+    def ldc(self, index: int, mnemonic: str):
+        constant = self.constant_pool[index]
+        if mnemonic == "ldc2_w":
+            kinds = {Long: LONG, Double: DOUBLE}
+        else:
+            kinds = {Integer: INT, Float: FLOAT, String: REFERENCE, Class: REFERENCE}
+        kind = kinds.get(type(constant))
+        if kind is None:
+            raise ValueError(f"{mnemonic} cannot load the constant {constant}")
+        self.push(kind)
+
+    def execute(self, pc: int, mnemonic: str):
+        """
+        Apply the effect of an instruction to `stack` and `local_variables`
+        """
+
+        instruction = self.instructions[pc]
+        effect = EFFECTS.get(mnemonic)
+        if effect is not None:
+            pops, pushes = effect
+            self.pop_all(pops)
+            for kind in pushes:
+                self.push(kind)
+            return
+        prefix, _, suffix = mnemonic.partition("_")
+        if prefix[1:] == "load" and prefix[0] in "ilfda":
+            self.load(load_index(instruction), PREFIXES[prefix[0]])
+        elif prefix[1:] == "store" and prefix[0] in "ilfda":
+            self.store(store_index(instruction), PREFIXES[prefix[0]])
+        elif mnemonic == "iinc":
+            if instruction.index >= len(self.local_variables) or self.local_variables[instruction.index] != INT:
+                raise ValueError(f"Expected {INT} in the local variable {instruction.index}")
+        elif mnemonic in ("pop", "dup", "dup_x1", "swap"):
+            self.shuffle(mnemonic)
+        elif mnemonic in ("ldc", "ldc_w", "ldc2_w"):
+            self.ldc(instruction.index, mnemonic)
+        elif mnemonic == "return":
+            if not self.entry.descriptor.endswith(")V"):
+                raise ValueError(f"return in a method returning {self.entry.descriptor}")
+        elif prefix[1:] == "return":
+            _, return_type = parse_method_descriptor(self.entry.descriptor)
+            if return_type == "V" or verification_type(return_type) != PREFIXES[prefix[0]]:
+                raise ValueError(f"{mnemonic} in a method returning {return_type}")
+            self.pop(PREFIXES[prefix[0]])
+        elif mnemonic in ("getstatic", "putstatic", "getfield", "putfield"):
+            kind = verification_type(self.member_type(instruction.index, (Fieldref,)))
+            if mnemonic.startswith("put"):
+                self.pop(kind)
+            if mnemonic.endswith("field"):
+                self.pop(REFERENCE)
+            if mnemonic.startswith("get"):
+                self.push(kind)
+        elif mnemonic == "invokedynamic":
+            self.invoke(instruction.index, (InvokeDynamic,), False)
+        elif mnemonic in ("invokestatic", "invokevirtual", "invokespecial"):
+            self.invoke(instruction.index, (Methodref,), mnemonic != "invokestatic")
+        else:
+            raise ValueError(f"{mnemonic} is not supported")
+
+    def shuffle(self, mnemonic: str):
+        """
+        pop, dup, dup_x1 and swap, which only take ints, floats and references
+        """
+
+        count = 1 if mnemonic in ("pop", "dup") else 2
+        values = [self.pop() for _ in range(count)][::-1]
+        if any(kind in WIDE for kind in values):
+            raise ValueError(f"{mnemonic} of a long or double")
+        if mnemonic == "pop":
+            return
+        if mnemonic == "dup":
+            values *= 2
+        elif mnemonic == "dup_x1":
+            values.insert(0, values[1])
+        elif mnemonic == "swap":
+            values.reverse()
+        for kind in values:
+            self.push(kind)
+
+    def infer(self) -> list[StackMapFrame | None]:
+        instructions = self.instructions
+        frames = [None] * len(instructions)
+        frames[0] = self.initial()
+        pending = [0]
+        while pending:
+            pc = pending.pop()
+            frame = frames[pc]
+            self.stack = list(frame.stack)
+            self.local_variables = list(frame.local_variables)
+            try:
+                self.execute(pc, self.mnemonics[pc])
+            except ValueError as e:
+                raise VerifyError(f"{self.name()} at {pc} ({self.mnemonics[pc]}): {e}") from None
+            following = StackMapFrame(tuple(self.stack), tuple(self.local_variables))
+            instruction = instructions[pc]
+            successors = branch_targets(instruction)
+            if not isinstance(instruction, TERMINATORS):
+                successors.append(pc + 1)
+            for successor in successors:
+                if successor == len(instructions):
+                    raise VerifyError(f"{self.name()} runs past its last instruction")
+                before = frames[successor]
+                if before is None:
+                    frames[successor] = following
+                else:
+                    try:
+                        merged = _merge(before, following)
+                    except ValueError as e:
+                        raise VerifyError(f"{self.name()} at {successor}: {e}") from None
+                    if merged is before:
+                        continue
+                    frames[successor] = merged
+                pending.append(successor)
+        return frames
+
+    def name(self) -> str:
+        return f"{self.entry.cls.name}.{self.entry.name}{self.entry.descriptor}"
+
+
+def infer_frames(entry) -> list[StackMapFrame | None]:
+    """
+    Infer the frame before each instruction of a method, None for the unreachable ones
+    """
+
+    name = f"{entry.cls.name}.{entry.name}{entry.descriptor}"
+    try:
+        instructions = entry.instructions
+        names = mnemonics(entry.method.code)
+    except (NotImplementedError, KeyError, IndexError, struct.error) as e:
+        raise VerifyError(f"{name} cannot be decoded: {e!r}") from None
+    if not instructions:
+        raise VerifyError(f"{name} has no code")
+    if len(names) != len(instructions):
+        raise VerifyError(f"{name} has {len(instructions)} instructions for {len(names)} in its code")
+    for pc, instruction in enumerate(instructions):
+        if isinstance(instruction, Generic):
+            raise UnsupportedInstruction(f"{name} at {pc}: {instruction.mnemonic} is not supported")
+    return _Inference(entry, instructions, names).infer()
+
+
+def is_int_only(frames) -> bool:
+    """
+    Whether every value that a method puts on its operand stack is an int
+    """
+
+    return all(frame is None or all(kind == INT for kind in frame.stack) for frame in frames)
+
+
+def verify_method(entry, reject_unsupported: bool = False):
+    """
+    Verify a method and mark it `verified` and `int_only` if it is, raising VerifyError if it is rejected
+
+    A method with unsupported instructions is rejected if `reject_unsupported` is true, and left unverified otherwise.
+    """
+
+    if entry.method.access_flags & (ACC_ABSTRACT | ACC_NATIVE):
+        # No code to verify
+        entry.verified = True
+        return
+    try:
+        frames = infer_frames(entry)
+    except UnsupportedInstruction as e:
+        if reject_unsupported:
+            raise
+        logger.warning("Run a method unverified: %s", e)
+        entry.verified = entry.int_only = False
+        return
+    entry.verified = True
+    entry.int_only = is_int_only(frames)
+    if entry.int_only:
+        logger.debug("The method %s.%s%s is int-only", entry.cls.name, entry.name, entry.descriptor)
+
+
+def verify(cls, reject_unsupported: bool = False):
+    """
+    Verify every method of a class, raising VerifyError for the first that is rejected
+    """
+
+    for entry in cls.method_table:
+        verify_method(entry, reject_unsupported)
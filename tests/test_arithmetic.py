@@ -0,0 +1,136 @@
+import pytest
+
+from toyjava import arithmetic
+from toyjava.arithmetic import INT_MAX, INT_MIN, LONG_MAX, LONG_MIN
+from toyjava.classwriter import Assembler, ClassWriter
+from toyjava.constants import Integer, Long
+from toyjava.instructions import Arithmetic1, Arithmetic2, Iload, Istore, Ireturn, Ldc, Push, parse_instructions
+from toyjava.jvm import parse_class_file, parse_class_buffer, parse_class_lazily, VirtualMachine
+from toyjava.output import CapturedOutput
+
+
+def test_int_overflow():
+    assert arithmetic.iadd(INT_MAX, 1) == INT_MIN
+    assert arithmetic.isub(INT_MIN, 1) == INT_MAX
+    assert arithmetic.imul(0x10000, 0x10000) == 0
+    assert arithmetic.imul(INT_MAX, INT_MAX) == 1
+    assert arithmetic.ineg(INT_MIN) == INT_MIN
+    assert arithmetic.idiv(INT_MIN, -1) == INT_MIN
+    assert arithmetic.irem(INT_MIN, -1) == 0
+
+
+def test_long_overflow():
+    assert arithmetic.ladd(LONG_MAX, 1) == LONG_MIN
+    assert arithmetic.lsub(LONG_MIN, 1) == LONG_MAX
+    assert arithmetic.lmul(LONG_MAX, 2) == -2
+    assert arithmetic.lneg(LONG_MIN) == LONG_MIN
+    assert arithmetic.ldiv(LONG_MIN, -1) == LONG_MIN
+
+
+@pytest.mark.parametrize("a, b, quotient, remainder", [
+    (7, 2, 3, 1),
+    (-7, 2, -3, -1),
+    (7, -2, -3, 1),
+    (-7, -2, 3, -1),
+    (0, -5, 0, 0),
+])
+def test_division_rounds_toward_zero(a, b, quotient, remainder):
+    assert arithmetic.idiv(a, b) == arithmetic.ldiv(a, b) == quotient
+    assert arithmetic.irem(a, b) == arithmetic.lrem(a, b) == remainder
+
+
+@pytest.mark.parametrize("function", [arithmetic.idiv, arithmetic.irem, arithmetic.ldiv, arithmetic.lrem])
+def test_division_by_zero(function):
+    with pytest.raises(ZeroDivisionError):
+        function(1, 0)
+
+
+def test_shifts():
+    assert arithmetic.ishl(1, 31) == INT_MIN
+    # Only the low 5 bits of the shift distance count
+    assert arithmetic.ishl(1, 32) == 1
+    assert arithmetic.ishr(-8, 1) == -4
+    assert arithmetic.iushr(-8, 1) == 0x7FFFFFFC
+    assert arithmetic.iushr(-1, 0) == -1
+    assert arithmetic.lshl(1, 63) == LONG_MIN
+    assert arithmetic.lshl(1, 64) == 1
+    assert arithmetic.lushr(-1, 1) == LONG_MAX
+
+
+def test_conversions():
+    assert arithmetic.l2i(0x1_0000_0001) == 1
+    assert arithmetic.l2i(0xFFFF_FFFF) == -1
+    assert arithmetic.i2b(0xFF) == -1
+    assert arithmetic.i2b(0x180) == -128
+    assert arithmetic.i2c(-1) == 0xFFFF
+    assert arithmetic.i2s(0x8000) == -0x8000
+    assert [arithmetic.lcmp(1, 2), arithmetic.lcmp(2, 2), arithmetic.lcmp(3, 2)] == [-1, 0, 1]
+
+
+def test_decode():
+    code = bytes.fromhex("0a 14 0003 37 02 16 02 61 88 74 ac")
+    assert parse_instructions(code) == (
+        Push(1),
+        Ldc(3),
+        Istore(2),
+        Iload(2),
+        Arithmetic2(arithmetic.ladd),
+        Arithmetic1(arithmetic.l2i),
+        Arithmetic1(arithmetic.ineg),
+        Ireturn(),
+    )
+
+
+def numbers_class() -> bytes:
+    """
+    A class whose main method prints the results of long and int arithmetic and of a call taking longs
+    """
+
+    writer = ClassWriter("Numbers")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println_int = constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+    println_long = constant_pool.methodref("java/io/PrintStream", "println", "(J)V")
+
+    # static long combine(long a, int b, long c) { return a * b - c; }
+    combine = constant_pool.methodref("Numbers", "combine", "(JIJ)J")
+    code = Assembler().emit("lload_0").emit("iload_2").emit("i2l").emit("lmul").emit("lload_3").emit("lsub")
+    writer.add_method("combine", "(JIJ)J", code.emit("lreturn").to_bytes(), max_stack=4, max_locals=5)
+
+    main = (
+        Assembler()
+        .emit("getstatic", out).emit("ldc", constant_pool.integer(INT_MAX)).emit("iconst_1").emit("iadd")
+        .emit("invokevirtual", println_int)
+        .emit("getstatic", out).emit("ldc2_w", constant_pool.long(LONG_MAX)).emit("lconst_1").emit("ladd")
+        .emit("invokevirtual", println_long)
+        .emit("ldc", constant_pool.integer(INT_MAX)).emit("istore_1").emit("iinc", 1, 1)
+        .emit("getstatic", out).emit("iload_1").emit("invokevirtual", println_int)
+        .emit("getstatic", out)
+        .emit("ldc2_w", constant_pool.long(1 << 40)).emit("bipush", -3).emit("lconst_1")
+        .emit("invokestatic", combine)
+        .emit("invokevirtual", println_long)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=6, max_locals=2)
+    return writer.to_bytes()
+
+
+NUMBERS_OUTPUT = [str(INT_MIN), str(LONG_MIN), str(INT_MIN), str(-3 * (1 << 40) - 1)]
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_buffer, parse_class_lazily])
+def test_constant_pool_numbers(parse):
+    cls = parse(numbers_class())
+    constants = [cls.constant_pool[i] for i in range(1, len(cls.constant_pool) + 1)]
+    assert Integer(INT_MAX) in constants
+    # The entry after a long is unusable
+    index = constants.index(Long(LONG_MAX))
+    assert constants[index + 1] is None
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "closure", "jit"])
+@pytest.mark.parametrize("jit_threshold", [1, 1000])
+def test_numbers(engine, jit_threshold):
+    output = CapturedOutput()
+    VirtualMachine(engine, jit_threshold=jit_threshold, output=output).execute_main(parse_class_file(numbers_class()))
+    assert output.lines == NUMBERS_OUTPUT
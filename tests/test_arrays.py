@@ -0,0 +1,102 @@
+from array import array
+
+import pytest
+
+from toyjava.arrays import ArrayIndexOutOfBoundsError, ArrayStoreError, NegativeArraySizeError, arraycopy, new_array
+from toyjava.classwriter import Assembler, ClassWriter
+from toyjava.arithmetic import i2c
+from toyjava.instructions import Arraylength, Arrayload, Arraystore, Dup, Generic, Newarray, Push, parse_instructions
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.output import CapturedOutput
+
+ENGINES = [("dispatch", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+
+def test_decode():
+    # newarray int, dup, arraylength, iconst_0, caload, newarray 3 (invalid), castore
+    code = bytes.fromhex("bc0a 59 be 03 34 bc03 55")
+    assert parse_instructions(code) == (
+        Newarray("i"),
+        Dup(),
+        Arraylength(),
+        Push(0),
+        Arrayload(),
+        Generic("newarray", (3,)),
+        Arraystore(i2c),
+    )
+
+
+def test_new_array():
+    ints = new_array("i", 1000)
+    assert ints.itemsize == 4 and len(ints) == 1000 and not any(ints)
+    assert new_array("q", 3).itemsize == 8
+    assert new_array("b", 3).itemsize == 1
+    with pytest.raises(NegativeArraySizeError):
+        new_array("i", -1)
+
+
+def test_arraycopy():
+    a = array("i", range(10))
+    arraycopy(a, 0, a, 2, 5)
+    assert list(a) == [0, 1, 0, 1, 2, 3, 4, 7, 8, 9]
+    b = new_array("i", 3)
+    arraycopy(a, 7, b, 0, 3)
+    assert list(b) == [7, 8, 9]
+    with pytest.raises(ArrayIndexOutOfBoundsError):
+        arraycopy(a, 8, b, 0, 3)
+    with pytest.raises(ArrayIndexOutOfBoundsError):
+        arraycopy(a, -1, b, 0, 1)
+    with pytest.raises(ArrayStoreError):
+        arraycopy(a, 0, new_array("q", 3), 0, 3)
+
+
+def arrays_class(index: int = 2) -> bytes:
+    """
+    Fill an int[5] with squares and copy it into another int[5] shifted by one with System.arraycopy,
+    then print a byte stored from 200 and the element at `index` of the copy
+    """
+
+    writer = ClassWriter("Arrays")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println = constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+    arraycopy_ref = constant_pool.methodref(
+        "java/lang/System", "arraycopy", "(Ljava/lang/Object;ILjava/lang/Object;II)V"
+    )
+    main = (
+        Assembler()
+        # int[] a = {0, 1, 4, 9, 16}
+        .emit("iconst_5").emit("newarray", 10).emit("astore_1")
+        .emit("aload_1").emit("iconst_0").emit("iconst_0").emit("iastore")
+        .emit("aload_1").emit("iconst_1").emit("iconst_1").emit("iastore")
+        .emit("aload_1").emit("iconst_2").emit("iconst_4").emit("iastore")
+        .emit("aload_1").emit("iconst_3").emit("bipush", 9).emit("iastore")
+        .emit("aload_1").emit("iconst_4").emit("bipush", 16).emit("iastore")
+        # int[] b = new int[a.length]; System.arraycopy(a, 0, b, 1, 4)
+        .emit("aload_1").emit("arraylength").emit("newarray", 10).emit("astore_2")
+        .emit("aload_1").emit("iconst_0").emit("aload_2").emit("iconst_1").emit("iconst_4")
+        .emit("invokestatic", arraycopy_ref)
+        # byte[] c = new byte[1]; c[0] = (byte) 200
+        .emit("iconst_1").emit("newarray", 8).emit("astore_3")
+        .emit("aload_3").emit("iconst_0").emit("sipush", 200).emit("bastore")
+        .emit("getstatic", out).emit("aload_3").emit("iconst_0").emit("baload").emit("invokevirtual", println)
+        .emit("getstatic", out).emit("aload_2").emit("bipush", index).emit("iaload").emit("invokevirtual", println)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=5, max_locals=4)
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_arrays(engine, jit_threshold):
+    output = CapturedOutput()
+    VirtualMachine(engine, jit_threshold=jit_threshold, output=output).execute_main(parse_class_file(arrays_class()))
+    assert output.lines == ["-56", "1"]
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+@pytest.mark.parametrize("index", [5, -1])
+def test_index_out_of_bounds(engine, jit_threshold, index):
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=CapturedOutput())
+    with pytest.raises(ArrayIndexOutOfBoundsError):
+        vm.execute_main(parse_class_file(arrays_class(index)))
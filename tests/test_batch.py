@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from toyjava.batch import read_manifest, run_many, run_many_async, run_program
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.cli import main
+
+
+@pytest.fixture
+def failing(tmp_path):
+    """
+    A class whose main prints 1 and then calls a method on null
+    """
+
+    writer = ClassWriter("Failing")
+    constant_pool = writer.constant_pool
+    main_ = (
+        Assembler()
+        .emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        .emit("iconst_1")
+        .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(I)V"))
+        .emit("aconst_null").emit("invokevirtual", constant_pool.methodref("Failing", "run", "()V"))
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main_.to_bytes(), max_stack=2, max_locals=1)
+    writer.add_method("run", "()V", Assembler().emit("return").to_bytes(), max_stack=0, max_locals=1, access_flags=0)
+    path = tmp_path / "Failing.class"
+    path.write_bytes(writer.to_bytes())
+    return str(path)
+
+
+def test_run_program():
+    result = run_program("data/Hello.class")
+    assert (result.program, result.stdout, result.status, result.error) == ("data/Hello.class", "Hello World!\n", 0, None)
+    assert result.seconds > 0
+
+
+def test_run_program_by_name():
+    assert run_program("Factorial", classpath=["data"], engine="jit").stdout == "3628800\n"
+
+
+def test_failure(failing):
+    result = run_program(failing)
+    assert (result.stdout, result.status) == ("1\n", 1)
+    assert result.error.startswith("NullPointerError: ")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run_many(failing, jobs):
+    programs = ["data/Factorial.class", failing, "data/Hello.class", "data/CountUp.class"] * 3
+    results = run_many(programs, jobs=jobs)
+    # In the order of the programs whatever order they finish in
+    assert [result.program for result in results] == programs
+    assert [result.status for result in results] == [0, 1, 0, 0] * 3
+    assert [result.stdout for result in results[:4]] == ["3628800\n", "1\n", "Hello World!\n", "0\n1\n2\n3\n4\n"]
+
+
+def test_manifest(tmp_path):
+    manifest = tmp_path / "programs.txt"
+    manifest.write_text("# The programs\nHello.class\n\nFizzBuzz\n")
+    assert read_manifest(manifest) == [str(tmp_path / "Hello.class"), "FizzBuzz"]
+
+
+def test_cli(tmp_path, capsys, failing):
+    manifest = tmp_path / "programs.txt"
+    manifest.write_text("Failing.class\n")
+    with pytest.raises(SystemExit) as exc_info:
+        main(["run-many", "--json", "-j", "2", "-cp", "data", "Bonjour", "--manifest", str(manifest)])
+    assert exc_info.value.code == 1
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(result["program"], result["stdout"], result["status"]) for result in results] == [
+        ("Bonjour", "Bonjour le monde !\n", 0),
+        (failing, "1\n", 1),
+    ]
+
+    main(["run-many", "data/Hello.class"])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("==> data/Hello.class (status 0, ") and lines[1:] == ["Hello World!"]
+
+
+def test_run_many_async(tmp_path):
+    # A program that loops forever
+    writer = ClassWriter("Spin")
+    loop = Label()
+    writer.add_method("main", "([Ljava/lang/String;)V", Assembler().place(loop).emit("goto", loop).to_bytes())
+    (tmp_path / "Spin.class").write_bytes(writer.to_bytes())
+    programs = ["data/FizzBuzz.class", str(tmp_path / "Spin.class"), "data/Hello.class"] * 100
+    results = asyncio.run(run_many_async(programs, max_instructions=10_000, concurrency=50, slice_size=100))
+    assert [result.program for result in results] == programs
+    assert [result.status for result in results] == [0, 1, 0] * 100
+    assert results[0].stdout.splitlines()[:3] == ["1", "2", "Fizz"]
+    assert results[1].error.startswith("InstructionBudgetExceeded: ")
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from toyjava.bench import WORKLOADS, compare, count_instructions, main, workloads
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.output import CapturedOutput
+
+
+@pytest.mark.parametrize("name, size, lines", [
+    ("fib", 10, ["55"]),
+    ("nested_loops", 3, [str(sum(i * j % 7 for i in range(3) for j in range(3)))]),
+    ("primes", 100, ["25"]),
+    ("sieve", 100, ["25"]),
+    ("strings", 3, ["Hello, world"] * 3),
+    ("concat", 3, ["Fizz0!", "Fizz1!", "Fizz2!"]),
+    ("hash", 1000, ["562641396"]),
+    ("lcg", 3, ["-6486624265480721906"]),
+])
+@pytest.mark.parametrize("engine", ["dispatch", "closure", "jit"])
+def test_workload(name, size, lines, engine):
+    build, _ = WORKLOADS[name]
+    output = CapturedOutput()
+    VirtualMachine(engine, jit_threshold=2, output=output).execute_main(parse_class_file(build(size)))
+    assert output.lines == lines
+
+
+def test_count_instructions():
+    # getstatic, ldc, invokevirtual, return
+    assert count_instructions(Path("data/Hello.class").read_bytes()) == 4
+    build, _ = WORKLOADS["strings"]
+    assert count_instructions(build(10)) == 2 + 10 * 8 + 4
+
+
+def test_compare():
+    baseline = {"results": {"dispatch": {"fib": {"parse": 1.0, "decode": 1.0, "execute": 1.0}}}}
+    report = {"results": {"dispatch": {
+        "fib": {"parse": 1.05, "decode": 0.5, "execute": 1.5},
+        "primes": {"parse": 1.0, "decode": 1.0, "execute": 1.0},
+    }}}
+    assert compare(report, baseline) == ["dispatch fib execute: 1.50x the baseline"]
+    assert compare(report, baseline, threshold=1.0) == []
+
+
+def test_main(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    assert main(["--scale", "0.001", "--repeat", "1", "--engine", "closure", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert set(report["results"]["closure"]) == set(workloads(Path("data"))) >= {"Hello", "fib"}
+    assert all(result["instructions"] > 0 for result in report["results"]["closure"].values())
+
+    assert main(["--scale", "0.001", "--repeat", "1", "--data", str(tmp_path), "--baseline", str(output)]) == 0
@@ -0,0 +1,99 @@
+import operator
+import pickle
+from pathlib import Path
+
+import pytest
+
+from toyjava import __version__, cache as cache_module
+from toyjava.cache import ClassCache, decoding_digest
+from toyjava.cli import main
+from toyjava.instructions import MNEMONICS, OPCODES, Arithmetic2, Opcode, Push
+from toyjava.jvm import VirtualMachine
+
+CLASS_FILES = sorted(Path("data").glob("*.class"))
+
+
+@pytest.mark.parametrize("path", CLASS_FILES, ids=lambda path: path.stem)
+def test_cache(tmp_path, capsys, path):
+    data = path.read_bytes()
+    cache = ClassCache(tmp_path)
+    VirtualMachine().execute_main(cache.load(data))
+    expected = capsys.readouterr().out
+
+    cls = ClassCache(tmp_path).load(data)
+    assert all(entry._instructions is not None for entry in cls.method_table)
+    VirtualMachine().execute_main(cls)
+    assert capsys.readouterr().out == expected
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_stale_entry(tmp_path):
+    data = Path("data/Hello.class").read_bytes()
+    cache = ClassCache(tmp_path)
+    cache.load(data)
+    [path] = tmp_path.iterdir()
+
+    header, payload = path.read_bytes().split(b"\n", 1)
+    assert header.split()[3] == decoding_digest().encode()
+    path.write_bytes(header.replace(__version__.encode(), b"0.0.0") + b"\n" + payload)
+    cache.load(data)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    path.write_bytes(b"truncated")
+    cache.load(data)
+    assert (cache.hits, cache.misses) == (0, 3)
+    cache.load(data)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+class Unsafe:
+    def __reduce__(self):
+        return exec, ("raise SystemExit('unpickled')",)
+
+
+@pytest.mark.parametrize("payload", [
+    pickle.dumps(Unsafe()),
+    # A class that has moved or been renamed since the entry was written
+    pickle.dumps(Push(1)).replace(b"Push", b"Gone"),
+    pickle.dumps(Push(1)).replace(b"toyjava.instructions", b"toyjava.instructionz"),
+])
+def test_unpickling_fails(tmp_path, payload):
+    data = Path("data/Hello.class").read_bytes()
+    cache = ClassCache(tmp_path)
+    cache.load(data)
+    [path] = tmp_path.iterdir()
+    header = path.read_bytes().split(b"\n", 1)[0]
+    path.write_bytes(header + b"\n" + payload)
+    assert cache.load(data).main_instructions()
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_decoding_changed(tmp_path, monkeypatch):
+    # An entry written while irem decoded into a plain operator.mod is stale once it decodes into arithmetic.irem
+    data = Path("data/FizzBuzz.class").read_bytes()
+    irem = MNEMONICS["irem"]
+    opcode = OPCODES[irem]
+    OPCODES[irem] = Opcode("irem", opcode.operands, lambda: Arithmetic2(operator.mod))
+    try:
+        old = decoding_digest()
+        assert old != cache_module.DECODING
+        with monkeypatch.context() as patch:
+            patch.setattr(cache_module, "DECODING", old)
+            ClassCache(tmp_path).load(data)
+    finally:
+        OPCODES[irem] = opcode
+    cache = ClassCache(tmp_path)
+    cls = cache.load(data)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert Arithmetic2(operator.mod) not in cls.main_instructions()
+
+
+def test_cli(tmp_path, capsys):
+    cache_dir = tmp_path / "cache"
+    main(["--cache-dir", str(cache_dir), "data/Hello.class"])
+    main(["--cache-dir", str(cache_dir), "data/Hello.class"])
+    assert capsys.readouterr().out == "Hello World!\nHello World!\n"
+    assert len(list(cache_dir.iterdir())) == 1
+
+    main(["--cache-dir", str(cache_dir), "--clear-cache"])
+    assert list(cache_dir.iterdir()) == []
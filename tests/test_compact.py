@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import pytest
+
+from toyjava import compact
+from toyjava.bench import WORKLOADS, compare_representations, fib_class
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.instructions import parse_instructions
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.loader import ClassLoader
+from toyjava.output import CapturedOutput
+
+OUT = ("java/lang/System", "out", "Ljava/io/PrintStream;")
+PRINTLN = ("java/io/PrintStream", "println", "(I)V")
+
+
+def run(class_file: bytes, engine: str = "compact", **kwargs) -> list[str]:
+    output = CapturedOutput()
+    VirtualMachine(engine, output=output, **kwargs).execute_main(parse_class_file(class_file))
+    return output.lines
+
+
+@pytest.mark.parametrize("path", sorted(Path("data").glob("*.class")), ids=lambda path: path.stem)
+def test_data_classes(path):
+    assert run(path.read_bytes()) == run(path.read_bytes(), "dispatch")
+
+
+@pytest.mark.parametrize("name, size", [
+    ("fib", 15), ("nested_loops", 5), ("primes", 200), ("sieve", 200), ("strings", 3), ("concat", 3), ("hash", 100),
+    ("lcg", 5),
+])
+def test_workloads(name, size):
+    build, _ = WORKLOADS[name]
+    assert run(build(size)) == run(build(size), "dispatch")
+
+
+def test_encode():
+    # static int m(int a) { int b = 0; while (b < a) b += 3; return b; }
+    start, end = Label(), Label()
+    code = (
+        Assembler()
+        .emit("iconst_0").emit("istore_1")
+        .place(start).emit("iload_1").emit("iload_0").emit("if_icmpge", end)
+        .emit("iinc", 1, 3).emit("goto", start)
+        .place(end).emit("iload_1").emit("ireturn")
+    ).to_bytes()
+    encoded = compact.encode(code)
+    assert list(encoded.opcodes) == [
+        compact.PUSH, compact.STORE, compact.LOAD, compact.LOAD, compact.IF_ICMPGE, compact.IINC, compact.GOTO,
+        compact.LOAD, compact.VALUE_RETURN,
+    ]
+    # Branch targets are indices of instructions
+    assert list(encoded.operands1) == [0, 1, 1, 0, 7, 1, 2, 1, 0]
+    assert list(encoded.operands2) == [0, 0, 0, 0, 0, 3, 0, 0, 0]
+    assert encoded.objects == ()
+    assert len(encoded) == len(parse_instructions(code))
+
+
+def switch_class() -> bytes:
+    """
+    Print what a tableswitch and a lookupswitch map each of -1 to 3 to
+    """
+
+    writer = ClassWriter("Switch")
+    constant_pool = writer.constant_pool
+    code = Assembler()
+    for mnemonic in ["tableswitch", "lookupswitch"]:
+        for value in range(-1, 4):
+            one, two, default, done = Label(), Label(), Label(), Label()
+            code.emit("getstatic", constant_pool.fieldref(*OUT)).emit("bipush", value)
+            if mnemonic == "tableswitch":
+                code.emit("tableswitch", default, 1, [one, two])
+            else:
+                code.emit("lookupswitch", default, {1: one, 2: two})
+            code.place(one).emit("iconst_1").emit("goto", done)
+            code.place(two).emit("iconst_2").emit("goto", done)
+            code.place(default).emit("iconst_0")
+            code.place(done).emit("invokevirtual", constant_pool.methodref(*PRINTLN))
+    code.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes(), max_stack=2, max_locals=1)
+    return writer.to_bytes()
+
+
+def test_switches():
+    assert run(switch_class()) == ["0", "0", "1", "2", "0"] * 2
+
+
+def test_unsupported():
+    # nop is decoded but not executed, and the verifier would reject it before it runs
+    writer = ClassWriter("Unsupported")
+    writer.add_method("main", "([Ljava/lang/String;)V", Assembler().emit("nop").emit("return").to_bytes())
+    with pytest.raises(NotImplementedError, match="nop"):
+        run(writer.to_bytes(), loader=ClassLoader(verify=False))
+
+
+def test_deep_recursion():
+    # Calls chain CompactFrames, so the depth of Java recursion is not bounded by that of Python
+    writer = ClassWriter("Deep")
+    constant_pool = writer.constant_pool
+    down = constant_pool.methodref("Deep", "down", "(I)I")
+    base = Label()
+    code = (
+        Assembler()
+        .emit("iload_0").emit("ifeq", base)
+        .emit("iload_0").emit("iconst_1").emit("isub").emit("invokestatic", down).emit("iconst_1").emit("iadd")
+        .emit("ireturn")
+        .place(base).emit("iconst_0").emit("ireturn")
+    )
+    writer.add_method("down", "(I)I", code.to_bytes(), max_stack=2, max_locals=1)
+    main = (
+        Assembler()
+        .emit("getstatic", constant_pool.fieldref(*OUT)).emit("ldc", constant_pool.integer(20_000))
+        .emit("invokestatic", down).emit("invokevirtual", constant_pool.methodref(*PRINTLN)).emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    assert run(writer.to_bytes(), memoize=False) == ["20000"]
+
+
+def test_memoized():
+    vm = VirtualMachine("compact", output=CapturedOutput())
+    vm.execute_main(parse_class_file(fib_class(30)))
+    assert vm.output.lines == ["832040"]
+    assert vm.memoization.stats()["Fib.fib(I)I"].hits == 28
+
+
+def test_size():
+    for path in Path("data").glob("*.class"):
+        for m in parse_class_file(path.read_bytes()).methods:
+            assert compact.encode(m.code).size() < compact.size_of_instructions(parse_instructions(m.code))
+
+
+def test_compare_representations():
+    build, _ = WORKLOADS["sieve"]
+    result = compare_representations(build(100), repeat=1)
+    assert result["instructions"] == 37
+    assert 0 < result["compact_bytes"] < result["objects_bytes"] / 2
+    assert result["objects_execute"] > 0 and result["compact_execute"] > 0
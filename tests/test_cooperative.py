@@ -0,0 +1,97 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from toyjava.bench import nested_loops_class
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.cooperative import InstructionBudgetExceeded, TimeBudgetExceeded
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.output import CapturedOutput
+
+
+def spin_class() -> bytes:
+    """
+    A class whose main loops forever
+    """
+
+    writer = ClassWriter("Spin")
+    loop = Label()
+    writer.add_method("main", "([Ljava/lang/String;)V", Assembler().place(loop).emit("goto", loop).to_bytes())
+    return writer.to_bytes()
+
+
+def load(name: str):
+    return parse_class_file(Path(f"data/{name}.class").read_bytes())
+
+
+@pytest.mark.parametrize("slice_size", [1, 7, 5000])
+@pytest.mark.parametrize("optimize", [False, True])
+def test_execute_main_async(slice_size, optimize):
+    output = CapturedOutput()
+    vm = VirtualMachine(output=output, optimize=optimize)
+    asyncio.run(vm.execute_main_async(load("FizzBuzz"), slice_size))
+    assert output.lines[:5] == ["1", "2", "Fizz", "4", "Buzz"] and len(output.lines) == 20
+
+
+def test_fair_scheduling():
+    # Both programs run the same instructions in turns of one, so their lines alternate
+    output = CapturedOutput()
+
+    async def main():
+        await asyncio.gather(*(
+            VirtualMachine(output=output).execute_main_async(load("CountUp"), slice_size=1) for _ in range(2)
+        ))
+
+    asyncio.run(main())
+    assert output.lines == ["0", "0", "1", "1", "2", "2", "3", "3", "4", "4"]
+
+
+def test_event_loop_not_blocked():
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        await VirtualMachine(output=CapturedOutput()).execute_main_async(
+            parse_class_file(nested_loops_class(50)), slice_size=100,
+        )
+        ticker.cancel()
+
+    asyncio.run(main())
+    assert ticks > 10
+
+
+def test_instruction_budget():
+    # getstatic, ldc, invokevirtual, return
+    asyncio.run(VirtualMachine(output=CapturedOutput()).execute_main_async(load("Hello"), max_instructions=4))
+    with pytest.raises(InstructionBudgetExceeded):
+        asyncio.run(VirtualMachine(output=CapturedOutput()).execute_main_async(load("Hello"), max_instructions=3))
+    with pytest.raises(InstructionBudgetExceeded):
+        asyncio.run(VirtualMachine().execute_main_async(parse_class_file(spin_class()), max_instructions=100_000))
+
+
+def test_time_budget():
+    with pytest.raises(TimeBudgetExceeded):
+        asyncio.run(VirtualMachine().execute_main_async(parse_class_file(spin_class()), timeout=0.05))
+
+
+def test_cancellation():
+    async def main():
+        task = asyncio.create_task(VirtualMachine().execute_main_async(parse_class_file(spin_class())))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+
+def test_engine():
+    with pytest.raises(ValueError):
+        asyncio.run(VirtualMachine("closure").execute_main_async(load("Hello")))
@@ -1,3 +1,5 @@
+from io import BytesIO
+
 from toyjava.instructions import *
 
 
@@ -45,3 +47,59 @@ def test_instruction_reader():
         Return(),
     )
     assert positions == [0, 1, 2, 3, 4, 7, 10, 11, 14, 17, 20]
+
+
+def test_parse_instructions_switches():
+    from toyjava.classwriter import Assembler, Label
+
+    one, two, default = Label(), Label(), Label()
+    code = Assembler()
+    code.emit("iload_0")
+    code.emit("tableswitch", default, 1, [one, two])
+    code.place(one).emit("iconst_1").emit("ireturn")
+    code.place(two).emit("iload_0").emit("lookupswitch", default, {-5: one, 100: two})
+    code.place(default).emit("iconst_0").emit("ireturn")
+    assert parse_instructions(code.to_bytes()) == (
+        Iload0(),
+        Tableswitch(default=6, low=1, indices=(2, 4)),
+        Push(1),
+        Ireturn(),
+        Iload0(),
+        Lookupswitch(default=6, indices={-5: 2, 100: 4}),
+        Push(0),
+        Ireturn(),
+    )
+
+
+def test_parse_instructions_wide_and_branches():
+    code = bytes.fromhex("c4 84 0100 ff00 c4 15 0100 84 03 ff 99 fff3 a1 fff6 c6 0003 1d 3b")
+    assert parse_instructions(code) == (
+        Iinc(index=256, const=-256),
+        Iload(index=256),
+        Iinc(index=3, const=-1),
+        BranchIf1(index=0, predicate=op.eq, operand=0),
+        BranchIf2(index=1, predicate=op.lt),
+        BranchIf1(index=6, predicate=op.is_, operand=None),
+        Iload(index=3),
+        Istore(index=0),
+    )
+
+
+def test_decode_every_opcode():
+    for code, opcode in enumerate(OPCODES):
+        if opcode is None or opcode.operands is None:
+            continue
+        instructions, positions = decode(bytes([code]) + bytes(opcode.operands.size) + b"\xb1")
+        assert positions == [0, 1 + opcode.operands.size]
+        assert instructions[-1] == Return()
+        if isinstance(instructions[0], Generic):
+            assert instructions[0].mnemonic == opcode.mnemonic
+
+
+def test_parse_instructions_large_method():
+    # iconst_0, istore_1, then a long chain of forward gotos to the next instruction
+    n = 20000
+    code = bytes.fromhex("03 3c") + bytes.fromhex("a7 0003") * n + bytes.fromhex("b1")
+    instructions = parse_instructions(code)
+    assert len(instructions) == n + 3
+    assert instructions[2 + n - 1] == Goto(index=2 + n)
@@ -2,7 +2,10 @@ from pathlib import Path
 
 import pytest
 
-from toyjava.jvm import ClassFileReader, parse_class_file, VirtualMachine
+from toyjava.bench import synthetic_class
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.jvm import ClassFileReader, parse_class_file, parse_class_buffer, parse_class_lazily, VirtualMachine
+from toyjava.loader import ClassLoader
 
 
 def test_class_file_reader():
@@ -11,7 +14,7 @@ def test_class_file_reader():
         assert reader.next_u4() == int("0xCAFEBABE", 0)
 
 
-@pytest.mark.parametrize("class_name,lines", [
+STDOUT_CASES = [
     ("Hello", ["Hello World!"]),
     ("Bonjour", ["Bonjour le monde !"]),
     ("HelloGoodbye", ["Hello Summer,", "Goodbye"]),
@@ -22,13 +25,197 @@ def test_class_file_reader():
                   "11", "Fizz", "13", "14", "FizzBuzz", "16", "17", "Fizz", "19", "Buzz"]),
     ("StaticMethod", ["3"]),
     ("Factorial", ["3628800"])
-])
-def test_stdout(capsys, class_name, lines):
+]
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_lazily])
+@pytest.mark.parametrize("engine", ["dispatch", "loop", "closure", "jit"])
+@pytest.mark.parametrize("class_name,lines", STDOUT_CASES)
+def test_stdout(capsys, class_name, lines, engine, parse):
     path = Path("data") / f"{class_name}.class"
     expected_output = "".join(line + "\n" for line in lines)
 
-    cls = parse_class_file(path.read_bytes())
-    vm = VirtualMachine()
+    cls = parse(path.read_bytes())
+    vm = VirtualMachine(engine)
     vm.execute_main(cls)
     captured = capsys.readouterr()
     assert captured.out == expected_output
+
+
+def test_method_table_decodes_once():
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    instructions = cls.find_instructions("factorial", "(I)I")
+    assert cls.find_instructions("factorial") is instructions
+    assert cls.method_table.lookup("factorial", "(J)J") is None
+
+    cls.method_table.invalidate()
+    assert cls.find_instructions("factorial", "(I)I") is not instructions
+    assert cls.find_instructions("factorial", "(I)I") == instructions
+
+
+@pytest.mark.parametrize("class_name,lines", STDOUT_CASES)
+def test_stdout_jit_compiled(capsys, class_name, lines):
+    cls = parse_class_file((Path("data") / f"{class_name}.class").read_bytes())
+    vm = VirtualMachine("jit", jit_threshold=1)
+    vm.execute_main(cls)
+    assert capsys.readouterr().out == "".join(line + "\n" for line in lines)
+    assert vm.jit.methods[cls.main_method()].native
+
+
+def test_jit_on_stack_replacement(capsys):
+    cls = parse_class_file(Path("data/FizzBuzz.class").read_bytes())
+    vm = VirtualMachine("jit", jit_threshold=5)
+    vm.execute_main(cls)
+    assert capsys.readouterr().out.split() == ["1", "2", "Fizz", "4", "Buzz", "Fizz", "7", "8", "Fizz", "Buzz",
+                                               "11", "Fizz", "13", "14", "FizzBuzz", "16", "17", "Fizz", "19", "Buzz"]
+    main = vm.jit.methods[cls.main_method()]
+    assert main.invocations == 1
+    assert main.backedges == 5
+    assert main.native
+
+
+def test_jit_per_vm(capsys):
+    # A VM neither inherits the counts nor the compiled code of another that ran the same class
+    cls = parse_class_file(Path("data/FizzBuzz.class").read_bytes())
+    VirtualMachine("jit", jit_threshold=5).execute_main(cls)
+    vm = VirtualMachine("jit", jit_threshold=1000)
+    vm.execute_main(cls)
+    assert capsys.readouterr().out.split().count("FizzBuzz") == 2
+    main = vm.jit.methods[cls.main_method()]
+    assert (main.invocations, main.backedges, main.native) == (1, 20, None)
+
+
+@pytest.mark.parametrize("class_file", [
+    *(path.read_bytes() for path in sorted(Path("data").glob("*.class"))),
+    synthetic_class(methods=20, code_length=100),
+])
+def test_parse_class_buffer(class_file):
+    expected = parse_class_file(class_file)
+    actual = parse_class_buffer(class_file)
+    assert actual.name == expected.name
+    assert len(actual.constant_pool) == len(expected.constant_pool)
+    for index in range(1, len(expected.constant_pool) + 1):
+        assert actual.constant_pool[index] == expected.constant_pool[index]
+    assert actual.methods == expected.methods
+    assert all(isinstance(m.code, memoryview) for m in actual.methods)
+
+
+def test_parse_class_lazily(capsys):
+    writer = ClassWriter("Lazy")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println = constant_pool.methodref("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+    hello = constant_pool.string("Hello from method42")
+    method42 = constant_pool.methodref("Lazy", "method42", "()V")
+    # invokestatic method42; return
+    writer.add_method("main", "([Ljava/lang/String;)V", bytes([0xB8, *method42.to_bytes(2, "big"), 0xB1]))
+    for i in range(100):
+        # getstatic System.out; ldc; invokevirtual println; return
+        code = bytes([0xB2, *out.to_bytes(2, "big"), 0x12, hello, 0xB6, *println.to_bytes(2, "big"), 0xB1])
+        writer.add_method(f"method{i}", "()V", code)
+        constant_pool.string(f"Unused string {i}")
+
+    cls = parse_class_lazily(writer.to_bytes())
+    assert cls.constant_pool.decoded_count() == 0
+
+    VirtualMachine().execute_main(cls)
+    assert capsys.readouterr().out == "Hello from method42\n"
+    # The names of all methods, but none of the unused strings
+    assert cls.constant_pool.decoded_count() < len(cls.constant_pool) // 2
+    # The class is verified when it is defined, which reads the code of every method
+    assert all(m._code is not None for m in cls.methods)
+
+    # Without verification only the code of the methods that run is unpacked
+    cls = parse_class_lazily(writer.to_bytes())
+    VirtualMachine(loader=ClassLoader(verify=False)).execute_main(cls)
+    assert capsys.readouterr().out == "Hello from method42\n"
+    assert sum(1 for m in cls.methods if m._code is not None) == 2
+
+
+def switch_class() -> bytes:
+    """
+    for (int i = 5; i != 0; i--) {
+        switch (i) {
+            case 1: System.out.println("one"); break;
+            case 3: System.out.println("three"); break;
+            default: System.out.println(i);
+        }
+    }
+    """
+
+    writer = ClassWriter("Switch")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println_string = constant_pool.methodref("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+    println_int = constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+
+    loop, one, three, default, step, end = (Label() for _ in range(6))
+    code = Assembler()
+    code.emit("iconst_5").emit("istore_3")
+    code.place(loop).emit("iload_3").emit("ifeq", end)
+    code.emit("iload_3").emit("tableswitch", default, 1, [one, default, three])
+    code.place(one).emit("getstatic", out).emit("ldc", constant_pool.string("one"))
+    code.emit("invokevirtual", println_string).emit("goto", step)
+    code.place(three).emit("getstatic", out).emit("ldc", constant_pool.string("three"))
+    code.emit("invokevirtual", println_string).emit("goto", step)
+    code.place(default).emit("getstatic", out).emit("iload_3").emit("invokevirtual", println_int)
+    code.place(step).emit("iinc", 3, -1).emit("goto", loop)
+    code.place(end).emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes())
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine,jit_threshold", [("dispatch", 1), ("closure", 1), ("jit", 1), ("jit", 2)])
+def test_switch(capsys, engine, jit_threshold):
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold)
+    vm.execute_main(parse_class_file(switch_class()))
+    assert capsys.readouterr().out.split() == ["5", "4", "three", "2", "one"]
+
+
+def sum_class(n: int) -> bytes:
+    """
+    static int sum(int n) { int rest; if (n == 0) return 0; rest = sum(n - 1); return n + rest; }
+    public static void main(String[] args) { System.out.println(sum(n)); }
+    """
+
+    writer = ClassWriter("Sum")
+    constant_pool = writer.constant_pool
+    sum_ = constant_pool.methodref("Sum", "sum", "(I)I")
+    recurse = Label()
+    code = (
+        Assembler()
+        .emit("iload_0").emit("ifne", recurse).emit("iconst_0").emit("ireturn")
+        .place(recurse)
+        .emit("iload_0").emit("iconst_1").emit("isub").emit("invokestatic", sum_).emit("istore_1")
+        .emit("iload_0").emit("iload_1").emit("iadd").emit("ireturn")
+    )
+    writer.add_method("sum", "(I)I", code.to_bytes(), max_stack=2, max_locals=2)
+    main = (
+        Assembler()
+        .emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        .emit("sipush", n).emit("invokestatic", sum_)
+        .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(I)V"))
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "loop", "closure", "jit"])
+def test_callee_local_variables(capsys, engine):
+    VirtualMachine(engine, jit_threshold=3).execute_main(parse_class_file(sum_class(10)))
+    assert capsys.readouterr().out == "55\n"
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_deep_recursion(capsys, optimize):
+    n = 30000
+    VirtualMachine(optimize=optimize).execute_main(parse_class_file(sum_class(n)))
+    assert capsys.readouterr().out == f"{n * (n + 1) // 2}\n"
+
+
+def test_max_locals():
+    for parse in [parse_class_file, parse_class_buffer, parse_class_lazily]:
+        cls = parse(sum_class(1))
+        assert [(m.max_stack, m.max_locals) for m in cls.methods] == [(2, 2), (2, 1)]
+        assert cls.method_table["sum", "(I)I"].max_locals == 2
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from toyjava.jvm import parse_class_file
+from toyjava.linker import link, parse_method_descriptor, ResolvedMethod, ResolvedField
+from toyjava.natives import SYSTEM_OUT
+
+
+def test_parse_method_descriptor():
+    assert parse_method_descriptor("()V") == ((), "V")
+    assert parse_method_descriptor("(II)I") == (("I", "I"), "I")
+    assert parse_method_descriptor("(J[[ILjava/lang/String;D)Ljava/lang/Object;") == (
+        ("J", "[[I", "Ljava/lang/String;", "D"),
+        "Ljava/lang/Object;",
+    )
+
+
+def test_link():
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    link(cls)
+    constant_pool = cls.constant_pool
+    resolved = [constant_pool.resolved[index] for index in range(1, len(constant_pool) + 1)]
+    resolved = [r for r in resolved if r is not None]
+
+    factorial = next(r for r in resolved if isinstance(r, ResolvedMethod) and r.name == "factorial")
+    assert factorial.arg_count == 1
+    assert factorial.return_kind == "I"
+    assert not factorial.native
+    assert factorial.target is cls.method_table["factorial", "(I)I"]
+
+    out = next(r for r in resolved if isinstance(r, ResolvedField))
+    assert (out.class_name, out.name, out.cell.value) == ("java/lang/System", "out", SYSTEM_OUT)
+
+    println = next(r for r in resolved if isinstance(r, ResolvedMethod) and r.name == "println")
+    assert println.native
+    assert println.return_kind == "V"
+
+
+def test_link_twice():
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    link(cls)
+    resolved = cls.constant_pool.resolved
+    link(cls)
+    assert cls.constant_pool.resolved is resolved
@@ -0,0 +1,96 @@
+import zipfile
+
+import pytest
+
+from toyjava.classwriter import Assembler, ClassWriter
+from toyjava.cli import main
+from toyjava.jvm import VirtualMachine, parse_class_file
+from toyjava.loader import ClassLoader, ClassNotFoundError
+
+
+def main_class() -> bytes:
+    writer = ClassWriter("com/example/Main")
+    constant_pool = writer.constant_pool
+    code = (
+        Assembler()
+        .emit("bipush", 21)
+        .emit("invokestatic", constant_pool.methodref("com/example/Util", "twice", "(I)I"))
+        .emit("istore_1")
+        .emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        .emit("iload_1")
+        .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(I)V"))
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes())
+    return writer.to_bytes()
+
+
+def util_class(name: str = "com/example/Util") -> bytes:
+    writer = ClassWriter(name)
+    code = Assembler().emit("iload_0").emit("iload_0").emit("iadd").emit("ireturn")
+    writer.add_method("twice", "(I)I", code.to_bytes())
+    return writer.to_bytes()
+
+
+def write_jar(path, compression, unused: int = 0):
+    with zipfile.ZipFile(path, "w", compression) as jar:
+        jar.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\n")
+        jar.writestr("com/example/Main.class", main_class())
+        jar.writestr("com/example/Util.class", util_class())
+        for i in range(unused):
+            jar.writestr(f"com/example/Unused{i}.class", util_class(f"com/example/Unused{i}"))
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "loop", "closure", "jit"])
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_jar(tmp_path, capsys, engine, compression):
+    write_jar(tmp_path / "app.jar", compression, unused=100)
+    loader = ClassLoader([tmp_path / "app.jar"])
+    VirtualMachine(engine, jit_threshold=1, loader=loader).execute_class("com/example/Main")
+    assert capsys.readouterr().out == "42\n"
+    assert sorted(loader.classes) == ["com/example/Main", "com/example/Util"]
+
+
+def test_directory(tmp_path, capsys):
+    (tmp_path / "com/example").mkdir(parents=True)
+    (tmp_path / "com/example/Util.class").write_bytes(util_class())
+    vm = VirtualMachine(loader=ClassLoader([tmp_path]))
+    vm.execute_main(parse_class_file(main_class()))
+    vm.execute_main(vm.loader.load("com/example/Main"))
+    assert capsys.readouterr().out == "42\n42\n"
+
+
+def test_classpath_order(tmp_path):
+    write_jar(tmp_path / "app.jar", zipfile.ZIP_STORED)
+    (tmp_path / "classes/com/example").mkdir(parents=True)
+    (tmp_path / "classes/com/example/Util.class").write_bytes(util_class())
+    loader = ClassLoader([tmp_path / "classes", tmp_path / "app.jar"])
+    assert loader.load("com/example/Util") is loader.load("com/example/Util")
+    assert loader.load("com/example/Main").method_table.lookup("main") is not None
+
+    with pytest.raises(ClassNotFoundError):
+        loader.load("com/example/Missing")
+    with pytest.raises(ValueError):
+        loader.define(parse_class_file(util_class()))
+
+
+def test_resolved_on_first_use(tmp_path, capsys):
+    # A class parsed in full still loads the classes that it refers to only when its code first uses them
+    write_jar(tmp_path / "app.jar", zipfile.ZIP_STORED)
+    loader = ClassLoader([tmp_path / "app.jar"])
+    cls = loader.define(parse_class_file(main_class()))
+    assert sorted(loader.classes) == ["com/example/Main"]
+    VirtualMachine(loader=loader).execute_main(cls)
+    assert capsys.readouterr().out == "42\n"
+    assert sorted(loader.classes) == ["com/example/Main", "com/example/Util"]
+
+
+def test_missing_class(capsys):
+    with pytest.raises(NotImplementedError):
+        VirtualMachine().execute_main(parse_class_file(main_class()))
+
+
+def test_cli(tmp_path, capsys):
+    write_jar(tmp_path / "app.jar", zipfile.ZIP_DEFLATED)
+    main(["-cp", str(tmp_path / "app.jar"), "com.example.Main"])
+    assert capsys.readouterr().out == "42\n"
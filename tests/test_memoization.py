@@ -0,0 +1,168 @@
+from pathlib import Path
+
+import pytest
+
+from toyjava.bench import fib_class
+from toyjava.classwriter import ACC_STATIC, Assembler, ClassWriter
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.linker import link
+from toyjava.memoization import MISSING, Memo, MemoStats, is_pure
+from toyjava.output import CapturedOutput
+
+ENGINES = [("dispatch", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+OUT = ("java/lang/System", "out", "Ljava/io/PrintStream;")
+
+
+def methods_class() -> bytes:
+    """
+    Static methods calling each other, the impure ones marked by their names
+    """
+
+    writer = ClassWriter("Methods")
+    constant_pool = writer.constant_pool
+
+    def method(name: str, descriptor: str, code: Assembler):
+        writer.add_method(name, descriptor, code.to_bytes(), max_stack=3, max_locals=2)
+
+    def call(name: str, descriptor: str = "(I)I"):
+        return constant_pool.methodref("Methods", name, descriptor)
+
+    # Mutually recursive and pure
+    method("even", "(I)I", Assembler().emit("iload_0").emit("iconst_1").emit("isub").emit("invokestatic", call("odd"))
+           .emit("iconst_1").emit("ixor").emit("ireturn"))
+    method("odd", "(I)I", Assembler().emit("iload_0").emit("invokestatic", call("even")).emit("ireturn"))
+    method("larger", "(JJ)J", Assembler().emit("lload_0").emit("lload_2")
+           .emit("invokestatic", constant_pool.methodref("java/lang/Math", "max", "(JJ)J")).emit("lreturn"))
+    method("constant", "()I", Assembler().emit("ldc", constant_pool.integer(100_000)).emit("ireturn"))
+    # A call to a method that prints, through another method
+    method("impureCaller", "(I)I", Assembler().emit("iload_0").emit("invokestatic", call("impurePrint")).emit("ireturn"))
+    method("impurePrint", "(I)I", Assembler()
+           .emit("getstatic", constant_pool.fieldref(*OUT)).emit("iload_0")
+           .emit("invokevirtual", constant_pool.methodref("java/io/PrintStream", "println", "(I)V"))
+           .emit("iload_0").emit("invokestatic", call("impureCaller")).emit("ireturn"))
+    writer.add_field("count", "I", ACC_STATIC)
+    method("impureStatic", "()I", Assembler().emit("getstatic", constant_pool.fieldref("Methods", "count", "I"))
+           .emit("ireturn"))
+    method("impureArray", "(I)I", Assembler().emit("iload_0").emit("newarray", 10).emit("arraylength").emit("ireturn"))
+    method("impureString", "()Ljava/lang/String;", Assembler().emit("ldc", constant_pool.string("s")).emit("areturn"))
+    method("impureVoid", "(I)V", Assembler().emit("return"))
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_fib(engine, jit_threshold):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=output)
+    vm.execute_main(parse_class_file(fib_class(30)))
+    assert output.lines == ["832040"]
+    # Each fib(n) is computed once and fib(n - 2) is then a hit, except for n < 3
+    assert vm.memoization.stats() == {"Fib.fib(I)I": MemoStats(hits=28, misses=31, size=31)}
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "closure", "jit"])
+def test_off(engine):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, output=output, memoize=False)
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    vm.execute_main(cls)
+    assert output.lines == ["3628800"]
+    assert vm.memoization is None
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "closure", "compact", "jit"])
+def test_per_vm(engine):
+    # The same class run by VMs that memoize and do not, in both orders
+    cls = parse_class_file(fib_class(20))
+    runs = [True, False, True, False]
+    stats = []
+    for memoize in runs:
+        output = CapturedOutput()
+        vm = VirtualMachine(engine, jit_threshold=1000, output=output, memoize=memoize)
+        vm.execute_main(cls)
+        assert output.lines == ["6765"]
+        stats.append(None if vm.memoization is None else vm.memoization.stats())
+    # Each memoizing VM starts with an empty Memo
+    assert stats == [{"Fib.fib(I)I": MemoStats(hits=18, misses=21, size=21)}, None] * 2
+
+
+def test_purity():
+    cls = parse_class_file(methods_class())
+    link(cls)
+    pure = {entry.name for entry in cls.method_table if is_pure(entry)}
+    assert pure == {"even", "odd", "larger", "constant"}
+
+
+def chain_class(depth: int) -> bytes:
+    """
+    Pure static methods m0 .. m<depth> where each calls the next twice, and a cycle of a and b, impure in a
+    """
+
+    writer = ClassWriter("Chain")
+    constant_pool = writer.constant_pool
+
+    def method(name: str, code: Assembler):
+        writer.add_method(name, "(I)I", code.to_bytes(), max_stack=2, max_locals=1)
+
+    for i in range(depth):
+        call = constant_pool.methodref("Chain", f"m{i + 1}", "(I)I")
+        method(f"m{i}", Assembler().emit("iload_0").emit("invokestatic", call).emit("iload_0")
+               .emit("invokestatic", call).emit("iadd").emit("ireturn"))
+    method(f"m{depth}", Assembler().emit("iload_0").emit("ireturn"))
+    writer.add_field("count", "I", ACC_STATIC)
+    method("a", Assembler().emit("iload_0").emit("invokestatic", constant_pool.methodref("Chain", "b", "(I)I"))
+           .emit("getstatic", constant_pool.fieldref("Chain", "count", "I")).emit("iadd").emit("ireturn"))
+    method("b", Assembler().emit("iload_0").emit("invokestatic", constant_pool.methodref("Chain", "a", "(I)I"))
+           .emit("ireturn"))
+    return writer.to_bytes()
+
+
+def test_purity_proven_once():
+    cls = parse_class_file(chain_class(40))
+    link(cls)
+    methods = {entry.name: entry for entry in cls.method_table}
+    proven = {}
+    # Without the finished proofs, each of the 2**40 paths would be proven again
+    assert is_pure(methods["m0"], proven)
+    assert proven == {methods[f"m{i}"]: True for i in range(41)}
+
+
+def test_purity_disproved_assumption():
+    cls = parse_class_file(chain_class(0))
+    link(cls)
+    methods = {entry.name: entry for entry in cls.method_table}
+    proven = {}
+    # b is proven on the way assuming that a is pure, which it is not
+    assert not is_pure(methods["a"], proven)
+    assert proven == {methods["a"]: False}
+    assert not is_pure(methods["b"], proven)
+    assert proven == {methods["a"]: False, methods["b"]: False}
+
+
+def test_lru():
+    memo = Memo(2)
+    memo.store((1,), 1)
+    memo.store((2,), 2)
+    assert memo.lookup((1,)) == 1
+    # (2,) is the least recently used
+    memo.store((3,), 3)
+    assert list(memo.entries) == [(1,), (3,)]
+    assert memo.lookup((2,)) is MISSING
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "closure", "jit"])
+def test_exception_not_cached(engine):
+    # static int quotient(int a) { return 100 / a; } called with 0 twice
+    writer = ClassWriter("Quotient")
+    quotient = writer.constant_pool.methodref("Quotient", "quotient", "(I)I")
+    code = Assembler().emit("bipush", 100).emit("iload_0").emit("idiv").emit("ireturn")
+    writer.add_method("quotient", "(I)I", code.to_bytes(), max_stack=2, max_locals=1)
+    main = Assembler().emit("iconst_0").emit("invokestatic", quotient).emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=1, max_locals=1)
+    cls = parse_class_file(writer.to_bytes())
+    vm = VirtualMachine(engine, output=CapturedOutput())
+    for _ in range(2):
+        with pytest.raises(ZeroDivisionError):
+            vm.execute_main(cls)
+    assert vm.memoization.stats()["Quotient.quotient(I)I"] == MemoStats(hits=0, misses=2, size=0)
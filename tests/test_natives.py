@@ -0,0 +1,126 @@
+import pytest
+
+from toyjava import natives
+from toyjava.arithmetic import INT_MIN
+from toyjava.classwriter import Assembler, ClassWriter
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.objects import NullPointerError
+from toyjava.output import CapturedOutput
+from toyjava.strings import NumberFormatError, StringIndexOutOfBoundsError, char_at, parse_int
+
+ENGINES = [("dispatch", 1000), ("loop", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+PRINTLN = "java/io/PrintStream", "println"
+
+
+def library_class() -> bytes:
+    """
+    Print the results of the natives for the JDK methods and of Host.twice(21), which is registered by the test
+    """
+
+    writer = ClassWriter("Library")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    code = Assembler()
+
+    def println(descriptor: str, *instructions):
+        code.emit("getstatic", out)
+        for instruction in instructions:
+            code.emit(*instruction)
+        code.emit("invokevirtual", constant_pool.methodref(*PRINTLN, descriptor))
+
+    def call(class_name: str, name: str, descriptor: str):
+        return "invokestatic", constant_pool.methodref(class_name, name, descriptor)
+
+    println("(I)V", ("iconst_3",), ("bipush", -7), call("java/lang/Math", "max", "(II)I"))
+    println("(I)V", ("iconst_3",), ("bipush", -7), call("java/lang/Math", "min", "(II)I"))
+    println("(I)V", ("bipush", -5), call("java/lang/Math", "abs", "(I)I"))
+    println("(I)V", ("ldc", constant_pool.integer(INT_MIN)), call("java/lang/Math", "abs", "(I)I"))
+    println("(J)V", ("ldc2_w", constant_pool.long(-3)), call("java/lang/Math", "abs", "(J)J"))
+    println(
+        "(I)V",
+        ("ldc", constant_pool.string("-123")), call("java/lang/Integer", "parseInt", "(Ljava/lang/String;)I"),
+        ("iconst_1",), ("iadd",),
+    )
+    println(
+        "(I)V",
+        ("ldc", constant_pool.string("ff")), ("bipush", 16),
+        call("java/lang/Integer", "parseInt", "(Ljava/lang/String;I)I"),
+    )
+    hello = constant_pool.string("hello")
+    println("(I)V", ("ldc", hello), ("invokevirtual", constant_pool.methodref("java/lang/String", "length", "()I")))
+    println(
+        "(C)V", ("ldc", hello), ("iconst_1",), ("invokevirtual", constant_pool.methodref("java/lang/String", "charAt", "(I)C")),
+    )
+    # The second of two readings of the clock is not earlier: lcmp(first, second) is -1 or 0
+    println("(I)V", call("java/lang/System", "nanoTime", "()J"), call("java/lang/System", "nanoTime", "()J"), ("lcmp",))
+    println("()V")
+    println("(I)V", ("bipush", 21), call("Host", "twice", "(I)I"))
+    code.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes(), max_stack=5, max_locals=1)
+    return writer.to_bytes()
+
+
+@pytest.fixture
+def host(monkeypatch):
+    # Registered in a copy of the registry, which the test leaves behind
+    monkeypatch.setattr(natives, "METHODS", dict(natives.METHODS))
+
+    @natives.register("Host", "twice", "(I)I")
+    def twice(a: int) -> int:
+        return 2 * a
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_natives(host, engine, jit_threshold):
+    output = CapturedOutput()
+    VirtualMachine(engine, jit_threshold=jit_threshold, output=output).execute_main(parse_class_file(library_class()))
+    assert output.lines[:9] == ["3", "-7", "5", str(INT_MIN), "3", "-122", "255", "5", "e"]
+    assert output.lines[9] in ("-1", "0")
+    assert output.lines[10:] == ["", "42"]
+
+
+def test_register():
+    function = natives.register("Host", "triple", "(I)I", lambda a: 3 * a)
+    try:
+        assert natives.METHODS["Host", "triple", "(I)I"] is function
+    finally:
+        del natives.METHODS["Host", "triple", "(I)I"]
+
+
+@pytest.mark.parametrize("s, radix, value", [
+    ("0", 10, 0), ("+42", 10, 42), ("-2147483648", 10, INT_MIN), ("7fffffff", 16, 0x7FFF_FFFF), ("-Zz", 36, -1295),
+])
+def test_parse_int(s, radix, value):
+    assert parse_int(s, radix) == value
+
+
+@pytest.mark.parametrize("s, radix", [
+    ("", 10), ("-", 10), ("2147483648", 10), (" 1", 10), ("1_000", 10), ("0x1f", 16), ("12", 2), ("1", 37), (None, 10),
+])
+def test_parse_int_error(s, radix):
+    with pytest.raises(NumberFormatError):
+        parse_int(s, radix)
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+@pytest.mark.parametrize("name, descriptor, args", [("length", "()I", []), ("charAt", "(I)C", [("iconst_0",)])])
+def test_string_null(engine, jit_threshold, name, descriptor, args):
+    writer = ClassWriter("NullString")
+    code = Assembler().emit("aconst_null")
+    for instruction in args:
+        code.emit(*instruction)
+    code.emit("invokevirtual", writer.constant_pool.methodref("java/lang/String", name, descriptor)).emit("pop")
+    writer.add_method("main", "([Ljava/lang/String;)V", code.emit("return").to_bytes(), max_stack=2, max_locals=1)
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=CapturedOutput())
+    with pytest.raises(NullPointerError, match=f"String.{name} on null"):
+        vm.execute_main(parse_class_file(writer.to_bytes()))
+
+
+def test_char_at():
+    assert char_at("abc", 2) == ord("c")
+    # Unlike indexing a str, a negative index is out of bounds
+    with pytest.raises(StringIndexOutOfBoundsError):
+        char_at("abc", -1)
+    with pytest.raises(StringIndexOutOfBoundsError):
+        char_at("abc", 3)
@@ -0,0 +1,239 @@
+import sys
+
+import pytest
+
+from toyjava.classwriter import ACC_ABSTRACT, ACC_PUBLIC, Assembler, ClassWriter, Label
+from toyjava.jvm import parse_class_buffer, parse_class_file, parse_class_lazily, VirtualMachine
+from toyjava.loader import ClassLoader
+from toyjava.objects import AbstractMethodError, NullPointerError, JavaObject
+from toyjava.output import CapturedOutput
+
+ENGINES = [("dispatch", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+
+def point_class() -> bytes:
+    """
+    class Point { int x; int y; Point(int x, int y) {...} int sum() { return x + y; } }
+    """
+
+    writer = ClassWriter("Point")
+    constant_pool = writer.constant_pool
+    writer.add_field("x", "I")
+    writer.add_field("y", "I")
+    object_init = constant_pool.methodref("java/lang/Object", "<init>", "()V")
+    x = constant_pool.fieldref("Point", "x", "I")
+    y = constant_pool.fieldref("Point", "y", "I")
+    init = (
+        Assembler()
+        .emit("aload_0").emit("invokespecial", object_init)
+        .emit("aload_0").emit("iload_1").emit("putfield", x)
+        .emit("aload_0").emit("iload_2").emit("putfield", y)
+        .emit("return")
+    )
+    writer.add_method("<init>", "(II)V", init.to_bytes(), max_stack=2, max_locals=3, access_flags=ACC_PUBLIC)
+    total = Assembler().emit("aload_0").emit("getfield", x).emit("aload_0").emit("getfield", y).emit("iadd").emit("ireturn")
+    writer.add_method("sum", "()I", total.to_bytes(), max_stack=2, max_locals=1, access_flags=ACC_PUBLIC)
+    return writer.to_bytes()
+
+
+def point3_class() -> bytes:
+    """
+    class Point3 extends Point { int x; Point3(int x, int y, int z) {...} int sum() { return super.sum() + x; } }
+
+    Its field x hides that of Point.
+    """
+
+    writer = ClassWriter("Point3", "Point")
+    constant_pool = writer.constant_pool
+    writer.add_field("x", "I")
+    point_init = constant_pool.methodref("Point", "<init>", "(II)V")
+    point_sum = constant_pool.methodref("Point", "sum", "()I")
+    x = constant_pool.fieldref("Point3", "x", "I")
+    init = (
+        Assembler()
+        .emit("aload_0").emit("iload_1").emit("iload_2").emit("invokespecial", point_init)
+        .emit("aload_0").emit("iload_3").emit("putfield", x)
+        .emit("return")
+    )
+    writer.add_method("<init>", "(III)V", init.to_bytes(), max_stack=3, max_locals=4, access_flags=ACC_PUBLIC)
+    total = (
+        Assembler()
+        .emit("aload_0").emit("invokespecial", point_sum)
+        .emit("aload_0").emit("getfield", x).emit("iadd").emit("ireturn")
+    )
+    writer.add_method("sum", "()I", total.to_bytes(), max_stack=2, max_locals=1, access_flags=ACC_PUBLIC)
+    return writer.to_bytes()
+
+
+def main_class() -> bytes:
+    """
+    Print new Point(3, 4).sum(), then for q = new Point3(1, 2, 10) print total(q, 5), ((Point) q).x and q.x,
+    where total(p, n) adds up p.sum() n times
+    """
+
+    writer = ClassWriter("Shapes")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println = constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+    point = constant_pool.class_info("Point")
+    point3 = constant_pool.class_info("Point3")
+    point_init = constant_pool.methodref("Point", "<init>", "(II)V")
+    point3_init = constant_pool.methodref("Point3", "<init>", "(III)V")
+    point_sum = constant_pool.methodref("Point", "sum", "()I")
+    point_x = constant_pool.fieldref("Point", "x", "I")
+    point3_x = constant_pool.fieldref("Point3", "x", "I")
+    total = constant_pool.methodref("Shapes", "total", "(LPoint;I)I")
+
+    loop, done = Label(), Label()
+    code = (
+        Assembler()
+        # int s = 0; for (int i = 0; i < n; i++) s += p.sum();
+        .emit("iconst_0").emit("istore_2").emit("iconst_0").emit("istore_3")
+        .place(loop).emit("iload_3").emit("iload_1").emit("if_icmpge", done)
+        .emit("iload_2").emit("aload_0").emit("invokevirtual", point_sum).emit("iadd").emit("istore_2")
+        .emit("iinc", 3, 1).emit("goto", loop)
+        .place(done).emit("iload_2").emit("ireturn")
+    )
+    writer.add_method("total", "(LPoint;I)I", code.to_bytes(), max_stack=2, max_locals=4)
+
+    main = (
+        Assembler()
+        .emit("getstatic", out)
+        .emit("new", point).emit("dup").emit("iconst_3").emit("iconst_4").emit("invokespecial", point_init)
+        .emit("invokevirtual", point_sum).emit("invokevirtual", println)
+        .emit("new", point3).emit("dup").emit("iconst_1").emit("iconst_2").emit("bipush", 10)
+        .emit("invokespecial", point3_init).emit("astore_1")
+        .emit("getstatic", out).emit("aload_1").emit("iconst_5").emit("invokestatic", total).emit("invokevirtual", println)
+        # The operands are pushed the other way around and swapped back
+        .emit("aload_1").emit("getstatic", out).emit("swap").emit("getfield", point_x).emit("invokevirtual", println)
+        .emit("getstatic", out).emit("aload_1").emit("getfield", point3_x).emit("invokevirtual", println)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=6, max_locals=2)
+    return writer.to_bytes()
+
+
+@pytest.fixture
+def classpath(tmp_path):
+    (tmp_path / "Point.class").write_bytes(point_class())
+    (tmp_path / "Point3.class").write_bytes(point3_class())
+    (tmp_path / "Shapes.class").write_bytes(main_class())
+    return tmp_path
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_objects(classpath, engine, jit_threshold):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=output, loader=ClassLoader([classpath]))
+    vm.execute_class("Shapes")
+    assert output.lines == ["7", "65", "1", "10"]
+    if jit_threshold == 1:
+        # Every method is compiled rather than interpreted
+        assert all(vm.jit.methods[entry].native for name in ["Shapes", "Point", "Point3"] for entry in vm.loader.load(name).method_table)
+
+
+def test_profile(classpath):
+    vm = VirtualMachine(output=CapturedOutput(), loader=ClassLoader([classpath]))
+    report = vm.profile_main(vm.loader.load("Shapes"))
+    assert report.methods["Point3.sum()I"].invocations == 5
+    assert report.methods["Point.sum()I"].invocations == 6
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_buffer, parse_class_lazily])
+def test_parse_fields(parse):
+    cls = parse(point3_class())
+    assert cls.super_name == "Point"
+    assert [(cls.constant_pool[f.name_index], cls.constant_pool[f.descriptor_index]) for f in cls.fields] == [("x", "I")]
+
+
+def test_layout(classpath):
+    loader = ClassLoader([classpath])
+    layout = loader.layout(loader.load("Point3"))
+    assert issubclass(layout, loader.layout(loader.load("Point"))) and issubclass(layout, JavaObject)
+    instance = layout()
+    assert (instance.Point_x, instance.Point_y, instance.Point3_x) == (0, 0, 0)
+    # The fields live in slots rather than in a __dict__
+    assert not hasattr(instance, "__dict__")
+    assert sys.getsizeof(instance) < sys.getsizeof([0, 0, 0])
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_null_receiver(engine, jit_threshold):
+    writer = ClassWriter("Null")
+    constant_pool = writer.constant_pool
+    point_sum = constant_pool.methodref("Null", "sum", "()I")
+    main = Assembler().emit("aconst_null").emit("invokevirtual", point_sum).emit("pop").emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=1, max_locals=1)
+    total = Assembler().emit("iconst_0").emit("ireturn")
+    writer.add_method("sum", "()I", total.to_bytes(), max_stack=1, max_locals=1, access_flags=ACC_PUBLIC)
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=CapturedOutput())
+    with pytest.raises(NullPointerError):
+        vm.execute_main(parse_class_file(writer.to_bytes()))
+
+
+@pytest.mark.parametrize("engine, jit_threshold", [*ENGINES, ("compact", 1000)])
+@pytest.mark.parametrize("mnemonic", ["getfield", "putfield"])
+def test_null_field(engine, jit_threshold, mnemonic):
+    writer = ClassWriter("Null")
+    writer.add_field("x", "I")
+    x = writer.constant_pool.fieldref("Null", "x", "I")
+    main = Assembler().emit("aconst_null")
+    if mnemonic == "getfield":
+        main.emit("getfield", x).emit("pop")
+    else:
+        main.emit("iconst_1").emit("putfield", x)
+    main.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=CapturedOutput())
+    with pytest.raises(NullPointerError, match="Null.x"):
+        vm.execute_main(parse_class_file(writer.to_bytes()))
+
+
+def shapes_classpath(tmp_path):
+    """
+    abstract class Shape { abstract int area(); int twice() throws Exception { return 2 * area(); } },
+    class Square extends Shape { int area() { return 9; } }, class Blob extends Shape {} as if compiled separately,
+    and a main class printing new Square().twice() and then new Blob().twice()
+    """
+
+    writer = ClassWriter("Shape")
+    area = writer.constant_pool.methodref("Shape", "area", "()I")
+    writer.add_method("area", "()I", None, access_flags=ACC_PUBLIC | ACC_ABSTRACT)
+    twice = Assembler().emit("iconst_2").emit("aload_0").emit("invokevirtual", area).emit("imul").emit("ireturn")
+    writer.add_method(
+        "twice", "()I", twice.to_bytes(), max_stack=2, max_locals=1, access_flags=ACC_PUBLIC,
+        exceptions=("java/lang/Exception",),
+    )
+    (tmp_path / "Shape.class").write_bytes(writer.to_bytes())
+
+    writer = ClassWriter("Square", "Shape")
+    writer.add_method("area", "()I", Assembler().emit("bipush", 9).emit("ireturn").to_bytes(), access_flags=ACC_PUBLIC)
+    (tmp_path / "Square.class").write_bytes(writer.to_bytes())
+    (tmp_path / "Blob.class").write_bytes(ClassWriter("Blob", "Shape").to_bytes())
+
+    writer = ClassWriter("Abstract")
+    constant_pool = writer.constant_pool
+    twice = constant_pool.methodref("Shape", "twice", "()I")
+    println = constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+    main = Assembler()
+    for name in ["Square", "Blob"]:
+        main.emit("getstatic", constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+        main.emit("new", constant_pool.class_info(name)).emit("invokevirtual", twice).emit("invokevirtual", println)
+    main.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=3, max_locals=1)
+    (tmp_path / "Abstract.class").write_bytes(writer.to_bytes())
+    return tmp_path
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_buffer, parse_class_lazily])
+def test_abstract_method(tmp_path, parse):
+    # Methods without a Code attribute or with other attributes load like any other
+    loader = ClassLoader([shapes_classpath(tmp_path)], parse=lambda buffer: parse(bytes(buffer)))
+    area = loader.load("Shape").method_table["area", "()I"]
+    assert (bytes(area.method.code), area.max_stack, area.max_locals) == (b"", 0, 0)
+    assert len(loader.load("Shape").method_table["twice", "()I"].instructions) == 5
+
+    output = CapturedOutput()
+    with pytest.raises(AbstractMethodError, match="Blob.area"):
+        VirtualMachine(output=output, loader=loader).execute_class("Abstract")
+    assert output.lines == ["18"]
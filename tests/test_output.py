@@ -0,0 +1,80 @@
+import gc
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from toyjava.classwriter import Assembler, ClassWriter
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava import output
+from toyjava.output import BufferedOutput, CapturedOutput, get_output
+
+
+def counting_class(count: int) -> bytes:
+    writer = ClassWriter("Counting")
+    out = writer.constant_pool.fieldref("java/lang/System", "out", "Ljava/io/PrintStream;")
+    println = writer.constant_pool.methodref("java/io/PrintStream", "println", "(I)V")
+    assembler = Assembler()
+    for i in range(count):
+        assembler.emit("getstatic", out).emit("sipush", i).emit("invokevirtual", println)
+    assembler.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", assembler.to_bytes())
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "loop", "closure", "jit"])
+def test_captured_output(capsys, engine):
+    output = CapturedOutput()
+    cls = parse_class_file(Path("data/FizzBuzz.class").read_bytes())
+    VirtualMachine(engine, output=output).execute_main(cls)
+    assert capsys.readouterr().out == ""
+    assert output.lines[:5] == ["1", "2", "Fizz", "4", "Buzz"]
+    assert output.getvalue() == "".join(line + "\n" for line in output.lines)
+
+
+def test_flush_threshold():
+    stream = StringIO()
+    output = BufferedOutput(stream, flush_threshold=10, flush_on_return=False, flush_on_exit=False)
+    for line in ["a", "bb", "ccc"]:
+        output.println(line)
+    assert stream.getvalue() == ""
+    output.println("dd")
+    assert stream.getvalue() == "a\nbb\nccc\ndd\n"
+    output.println("e")
+    output.flush()
+    assert stream.getvalue() == "a\nbb\nccc\ndd\ne\n"
+
+
+def test_flush_on_return():
+    stream = StringIO()
+    vm = VirtualMachine(output=BufferedOutput(stream, flush_on_exit=False))
+    vm.execute_main(parse_class_file(counting_class(300)))
+    assert stream.getvalue() == "".join(f"{i}\n" for i in range(300))
+
+    stream = StringIO()
+    output = BufferedOutput(stream, flush_on_return=False, flush_on_exit=False)
+    VirtualMachine(output=output).execute_main(parse_class_file(counting_class(300)))
+    assert stream.getvalue() == ""
+    output.flush()
+    assert stream.getvalue() == "".join(f"{i}\n" for i in range(300))
+
+
+def test_output_is_restored():
+    default = get_output()
+    VirtualMachine(output=CapturedOutput()).execute_main(parse_class_file(counting_class(1)))
+    assert get_output() is default
+
+
+def test_flush_on_exit_after_collection():
+    stream = StringIO()
+
+    def run():
+        sink = BufferedOutput(stream, flush_on_return=False)
+        VirtualMachine(output=sink).execute_main(parse_class_file(Path("data/Hello.class").read_bytes()))
+
+    run()
+    gc.collect()
+    assert stream.getvalue() == ""
+    # As at exit
+    output._flush_all()
+    assert stream.getvalue() == "Hello World!\n"
@@ -0,0 +1,91 @@
+import operator as op
+from pathlib import Path
+
+import pytest
+
+from toyjava.bench import WORKLOADS
+from toyjava.instructions import Arithmetic2, BranchIf2, BranchIfLocalConst, BranchIfLocals, Goto, Iinc, IincGoto, \
+    Iload, Iload1, Iload2, Ireturn, Istore1, LoadConstArithmetic, LoadLoadArithmetic, Lookupswitch, Push, Return, \
+    Tableswitch
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.output import CapturedOutput
+from toyjava.peephole import optimize
+
+PROGRAMS = {path.stem: path.read_bytes() for path in sorted(Path("data").glob("*.class"))}
+PROGRAMS.update((name, build(size)) for name, (build, size) in [
+    ("fib", (WORKLOADS["fib"][0], 12)),
+    ("nested_loops", (WORKLOADS["nested_loops"][0], 20)),
+    ("primes", (WORKLOADS["primes"][0], 500)),
+])
+
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_equivalence(name):
+    outputs = []
+    for optimize_ in [False, True]:
+        output = CapturedOutput()
+        VirtualMachine(output=output, optimize=optimize_).execute_main(parse_class_file(PROGRAMS[name]))
+        outputs.append(output.lines)
+    assert outputs[0] == outputs[1]
+    assert outputs[0]
+
+
+def test_fold_constants():
+    assert optimize((
+        Push(2), Push(3), Push(4), Arithmetic2(op.mul), Arithmetic2(op.add), Ireturn(),
+    )) == (Push(14), Ireturn())
+    # Division by zero must still raise when it runs
+    assert optimize((Push(1), Push(0), Arithmetic2(op.mod), Ireturn())) == (
+        Push(1), Push(0), Arithmetic2(op.mod), Ireturn(),
+    )
+
+
+def test_superinstructions():
+    assert optimize((
+        Iload1(), Iload2(), Arithmetic2(op.add),
+        Iload(3), Push(7), Arithmetic2(op.mod),
+        Istore1(),
+        Iload1(), Iload2(), BranchIf2(13, op.lt),
+        Iload1(), Push(10), BranchIf2(0, op.ge),
+        Iinc(1, 1), Goto(0),
+        Return(),
+    )) == (
+        LoadLoadArithmetic(1, 2, op.add),
+        LoadConstArithmetic(3, 7, op.mod),
+        Istore1(),
+        BranchIfLocals(5, 1, 2, op.lt),
+        BranchIfLocalConst(0, 1, 10, op.ge),
+        IincGoto(0, 1, 1),
+        Return(),
+    )
+
+
+def test_branch_targets_are_kept():
+    instructions = (
+        Iload1(),
+        # A branch target inside the sequence prevents fusing it
+        Push(1),
+        Arithmetic2(op.add),
+        Istore1(),
+        Iload1(), Push(5), BranchIf2(1, op.lt),
+        Return(),
+    )
+    assert optimize(instructions) == (
+        Iload1(), Push(1), Arithmetic2(op.add), Istore1(), BranchIfLocalConst(1, 1, 5, op.lt), Return(),
+    )
+
+
+def test_switch_targets():
+    assert optimize((
+        Iload1(),
+        Tableswitch(6, 0, (2, 5)),
+        Push(1), Push(2), Arithmetic2(op.add),
+        Ireturn(),
+        Lookupswitch(2, {1: 5}),
+    )) == (
+        Iload1(),
+        Tableswitch(4, 0, (2, 3)),
+        Push(3),
+        Ireturn(),
+        Lookupswitch(2, {1: 3}),
+    )
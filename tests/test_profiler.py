@@ -0,0 +1,105 @@
+from pathlib import Path
+
+from toyjava.bench import WORKLOADS
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.cli import main
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.output import CapturedOutput
+
+
+def test_profile_fib():
+    build, _ = WORKLOADS["fib"]
+    output = CapturedOutput()
+    report = VirtualMachine(output=output).profile_main(parse_class_file(build(10)))
+    assert output.lines == ["55"]
+
+    fib = report.methods["Fib.fib(I)I"]
+    # fib(n) is invoked fib(n + 1) * 2 - 1 times
+    assert fib.invocations == 177
+    main_method = report.methods["Fib.main([Ljava/lang/String;)V"]
+    assert main_method.invocations == 1
+    assert report.methods["java/io/PrintStream.println(I)V"].invocations == 1
+    assert 0 < fib.exclusive <= fib.inclusive <= main_method.inclusive
+    assert main_method.exclusive < main_method.inclusive
+
+    [(key, branch)] = report.branches.items()
+    assert key == ("Fib.fib(I)I", 2)
+    # Taken when n >= 2
+    assert (branch.taken, branch.not_taken) == (88, 89)
+    assert report.opcodes["invokestatic"] == 177
+    assert report.instructions == sum(report.opcodes.values())
+
+
+def test_branch_to_next_instruction():
+    # if (0 == 0) {} and if (1 == 0) {}: javac emits no such branches, but a taken one still counts as taken
+    writer = ClassWriter("Next")
+    code = Assembler()
+    for value in ["iconst_0", "iconst_1"]:
+        following = Label()
+        code.emit(value).emit("ifeq", following).place(following)
+    code.emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes(), max_stack=1, max_locals=1)
+    report = VirtualMachine(output=CapturedOutput()).profile_main(parse_class_file(writer.to_bytes()))
+    branches = report.branches
+    key = "Next.main([Ljava/lang/String;)V"
+    assert (branches[key, 1].taken, branches[key, 1].not_taken) == (1, 0)
+    assert (branches[key, 3].taken, branches[key, 3].not_taken) == (0, 1)
+
+
+def test_opcodes_by_mnemonic():
+    # return m(7, 3) where m(a, b) = a + b - 2 * (a % b)
+    writer = ClassWriter("Mnemonics")
+    code = (
+        Assembler()
+        .emit("iload_0").emit("iload_1").emit("iadd").emit("iconst_2").emit("iload_0").emit("iload_1").emit("irem")
+        .emit("imul").emit("isub").emit("ireturn")
+    )
+    writer.add_method("m", "(II)I", code.to_bytes(), max_stack=4, max_locals=2)
+    main = (
+        Assembler()
+        .emit("bipush", 7).emit("iconst_3").emit("invokestatic", writer.constant_pool.methodref("Mnemonics", "m", "(II)I"))
+        .emit("pop").emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    report = VirtualMachine(output=CapturedOutput()).profile_main(parse_class_file(writer.to_bytes()))
+    assert report.opcodes == {
+        "bipush": 1, "iconst_3": 1, "invokestatic": 1, "pop": 1, "return": 1,
+        "iload_0": 2, "iload_1": 2, "iadd": 1, "iconst_2": 1, "irem": 1, "imul": 1, "isub": 1, "ireturn": 1,
+    }
+
+
+def test_profile_deep_recursion():
+    # Calls chain frames as in the dispatch engine, so profiling runs what the engine runs
+    writer = ClassWriter("Deep")
+    constant_pool = writer.constant_pool
+    down = constant_pool.methodref("Deep", "down", "(I)I")
+    base = Label()
+    code = (
+        Assembler()
+        .emit("iload_0").emit("ifeq", base)
+        .emit("iload_0").emit("iconst_1").emit("isub").emit("invokestatic", down).emit("ireturn")
+        .place(base).emit("iconst_0").emit("ireturn")
+    )
+    writer.add_method("down", "(I)I", code.to_bytes(), max_stack=2, max_locals=1)
+    main = Assembler().emit("sipush", 5000).emit("invokestatic", down).emit("pop").emit("return")
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=1, max_locals=1)
+    report = VirtualMachine(output=CapturedOutput(), memoize=False).profile_main(parse_class_file(writer.to_bytes()))
+    down = report.methods["Deep.down(I)I"]
+    assert down.invocations == 5001
+    main_method = report.methods["Deep.main([Ljava/lang/String;)V"]
+    # Only the outermost call of the recursion counts towards the inclusive time
+    assert 0 < down.exclusive <= down.inclusive <= main_method.inclusive
+
+
+def test_profile_fizzbuzz(capsys):
+    report = VirtualMachine().profile_main(parse_class_file(Path("data/FizzBuzz.class").read_bytes()))
+    assert capsys.readouterr().out.split()[:5] == ["1", "2", "Fizz", "4", "Buzz"]
+    assert all(0 <= branch.taken_ratio <= 1 for branch in report.branches.values())
+    assert "FizzBuzz.main([Ljava/lang/String;)V" in report.format()
+
+
+def test_cli_profile(capsys):
+    main(["--profile", "data/StaticMethod.class"])
+    captured = capsys.readouterr()
+    assert "instructions" in captured.err
+    assert "instructions" not in captured.out
@@ -0,0 +1,172 @@
+import pytest
+
+from toyjava.classwriter import ACC_PUBLIC, ACC_STATIC, Assembler, ClassWriter, Label
+from toyjava.jvm import parse_class_buffer, parse_class_file, parse_class_lazily, VirtualMachine
+from toyjava.loader import ClassLoader
+from toyjava.output import CapturedOutput
+from toyjava.statics import PendingStaticField, StaticField
+
+ENGINES = [("dispatch", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+OUT = ("java/lang/System", "out", "Ljava/io/PrintStream;")
+PRINTLN_INT = ("java/io/PrintStream", "println", "(I)V")
+PRINTLN_STRING = ("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+
+
+def print_string(writer: ClassWriter, code: Assembler, text: str) -> Assembler:
+    constant_pool = writer.constant_pool
+    return (
+        code.emit("getstatic", constant_pool.fieldref(*OUT))
+        .emit("ldc", constant_pool.string(text))
+        .emit("invokevirtual", constant_pool.methodref(*PRINTLN_STRING))
+    )
+
+
+def initialized_class(name: str, super_name: str = "java/lang/Object") -> bytes:
+    """
+    A class whose <clinit> prints "init <name>"
+    """
+
+    writer = ClassWriter(name, super_name)
+    clinit = print_string(writer, Assembler(), f"init {name}").emit("return")
+    writer.add_method("<clinit>", "()V", clinit.to_bytes(), max_stack=2, max_locals=0, access_flags=ACC_STATIC)
+    init = Assembler().emit("aload_0").emit("invokespecial", writer.constant_pool.methodref(super_name, "<init>", "()V"))
+    writer.add_method("<init>", "()V", init.emit("return").to_bytes(), max_stack=1, max_locals=1, access_flags=ACC_PUBLIC)
+    return writer.to_bytes()
+
+
+def counter_class() -> bytes:
+    """
+    class Counter {
+        static final int BASE = 100;
+        static int count;
+        static int[] table;
+        static { System.out.println("init Counter"); table = new int[4]; count = 5; }
+        static int next() { table[0] = ++count; return table[0]; }
+    }
+    """
+
+    writer = ClassWriter("Counter")
+    constant_pool = writer.constant_pool
+    writer.add_field("BASE", "I", ACC_STATIC, constant_value=100)
+    writer.add_field("count", "I", ACC_STATIC)
+    writer.add_field("table", "[I", ACC_STATIC)
+    count = constant_pool.fieldref("Counter", "count", "I")
+    table = constant_pool.fieldref("Counter", "table", "[I")
+    clinit = (
+        print_string(writer, Assembler(), "init Counter")
+        .emit("iconst_4").emit("newarray", 10).emit("putstatic", table)
+        .emit("iconst_5").emit("putstatic", count)
+        .emit("return")
+    )
+    writer.add_method("<clinit>", "()V", clinit.to_bytes(), max_stack=2, max_locals=0, access_flags=ACC_STATIC)
+    next_ = (
+        Assembler()
+        .emit("getstatic", table).emit("iconst_0")
+        .emit("getstatic", count).emit("iconst_1").emit("iadd").emit("dup").emit("putstatic", count)
+        .emit("iastore")
+        .emit("getstatic", table).emit("iconst_0").emit("iaload").emit("ireturn")
+    )
+    writer.add_method("next", "()I", next_.to_bytes(), max_stack=4, max_locals=0)
+    return writer.to_bytes()
+
+
+def counting_class() -> bytes:
+    """
+    Print 1, then add 1 to Counter.count 1000 times, which initializes Counter, and print Counter.count,
+    Counter.BASE and Counter.next()
+    """
+
+    writer = ClassWriter("Counting")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref(*OUT)
+    println = constant_pool.methodref(*PRINTLN_INT)
+    count = constant_pool.fieldref("Counter", "count", "I")
+    loop, done = Label(), Label()
+    main = (
+        Assembler()
+        .emit("getstatic", out).emit("iconst_1").emit("invokevirtual", println)
+        .emit("iconst_0").emit("istore_1")
+        .place(loop).emit("iload_1").emit("sipush", 1000).emit("if_icmpge", done)
+        .emit("getstatic", count).emit("iconst_1").emit("iadd").emit("putstatic", count)
+        .emit("iinc", 1, 1).emit("goto", loop)
+        .place(done)
+        .emit("getstatic", out).emit("getstatic", count).emit("invokevirtual", println)
+        .emit("getstatic", out).emit("getstatic", constant_pool.fieldref("Counter", "BASE", "I"))
+        .emit("invokevirtual", println)
+        .emit("getstatic", out).emit("invokestatic", constant_pool.methodref("Counter", "next", "()I"))
+        .emit("invokevirtual", println)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=3, max_locals=2)
+    return writer.to_bytes()
+
+
+def triggers_class() -> bytes:
+    """
+    Instantiate Sub, which initializes Base and then Sub, and call Counter.next() twice
+    """
+
+    writer = ClassWriter("Triggers")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref(*OUT)
+    println = constant_pool.methodref(*PRINTLN_INT)
+    next_ = constant_pool.methodref("Counter", "next", "()I")
+    main = (
+        Assembler()
+        .emit("new", constant_pool.class_info("Sub")).emit("dup")
+        .emit("invokespecial", constant_pool.methodref("Sub", "<init>", "()V")).emit("pop")
+        .emit("getstatic", out).emit("invokestatic", next_).emit("invokevirtual", println)
+        .emit("getstatic", out).emit("invokestatic", next_).emit("invokevirtual", println)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=3, max_locals=1)
+    return writer.to_bytes()
+
+
+@pytest.fixture
+def classpath(tmp_path):
+    (tmp_path / "Counter.class").write_bytes(counter_class())
+    (tmp_path / "Counting.class").write_bytes(counting_class())
+    (tmp_path / "Base.class").write_bytes(initialized_class("Base"))
+    (tmp_path / "Sub.class").write_bytes(initialized_class("Sub", "Base"))
+    (tmp_path / "Triggers.class").write_bytes(triggers_class())
+    return tmp_path
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_static_fields(classpath, engine, jit_threshold):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=output, loader=ClassLoader([classpath]))
+    vm.execute_class("Counting")
+    assert output.lines == ["1", "init Counter", "1005", "100", "1006"]
+    if jit_threshold == 1:
+        assert all(vm.jit.methods[entry].native for name in ["Counting", "Counter"] for entry in vm.loader.load(name).method_table)
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_initialization_triggers(classpath, engine, jit_threshold):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=output, loader=ClassLoader([classpath]))
+    vm.execute_class("Triggers")
+    assert output.lines == ["init Base", "init Sub", "init Counter", "6", "7"]
+
+
+def test_profile(classpath):
+    output = CapturedOutput()
+    vm = VirtualMachine(output=output, loader=ClassLoader([classpath]))
+    report = vm.profile_main(vm.loader.load("Counting"))
+    assert output.lines == ["1", "init Counter", "1005", "100", "1006"]
+    assert report.methods["Counter.<clinit>()V"].invocations == 1
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_buffer, parse_class_lazily])
+def test_constant_value(parse):
+    cls = parse(counter_class())
+    base = cls.statics.field("BASE", "I")
+    count = cls.statics.field("count", "I")
+    assert type(base) is PendingStaticField
+    # Reading `value` would initialize the class, so the initial values are read from the slot itself
+    assert StaticField.value.__get__(base) == 100
+    assert StaticField.value.__get__(count) == 0
+    assert cls.statics.field("missing", "I") is None
@@ -0,0 +1,130 @@
+import sys
+
+import pytest
+
+from toyjava.classwriter import Assembler, ClassWriter, Label
+from toyjava.jvm import parse_class_buffer, parse_class_file, parse_class_lazily, VirtualMachine
+from toyjava.linker import link
+from toyjava.loader import ClassLoader
+from toyjava.output import CapturedOutput
+from toyjava.strings import StringBuilder, make_concat, make_concat_with_constants
+
+ENGINES = [("dispatch", 1000), ("closure", 1000), ("jit", 1000), ("jit", 1)]
+
+OUT = ("java/lang/System", "out", "Ljava/io/PrintStream;")
+PRINTLN_INT = ("java/io/PrintStream", "println", "(I)V")
+PRINTLN_STRING = ("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+BUILDER = "java/lang/StringBuilder"
+APPEND_INT = (BUILDER, "append", "(I)Ljava/lang/StringBuilder;")
+APPEND_CHAR = (BUILDER, "append", "(C)Ljava/lang/StringBuilder;")
+
+
+def greeter_class() -> bytes:
+    """
+    class Greeter { static String greeting() { return "hello"; } }
+    """
+
+    writer = ClassWriter("Greeter")
+    code = Assembler().emit("ldc", writer.constant_pool.string("hello")).emit("areturn")
+    writer.add_method("greeting", "()Ljava/lang/String;", code.to_bytes(), max_stack=1, max_locals=0)
+    return writer.to_bytes()
+
+
+def main_class() -> bytes:
+    """
+    Print "i=" + 42 + " c=" + 'x' + " z=" + true + " s=" + null,
+    a StringBuilder("a") with 0, 1 and 2 appended each followed by a comma and its length,
+    and 1 if the "hello" constants of this class and Greeter are the same object
+    """
+
+    writer = ClassWriter("Texts")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref(*OUT)
+    println_string = constant_pool.methodref(*PRINTLN_STRING)
+    println_int = constant_pool.methodref(*PRINTLN_INT)
+    concat = writer.make_concat_with_constants(
+        "i=\1 c=\1 z=\1 s=\1", "(ICZLjava/lang/String;)Ljava/lang/String;",
+    )
+
+    loop, done, different, compared = Label(), Label(), Label(), Label()
+    main = (
+        Assembler()
+        .emit("getstatic", out)
+        .emit("bipush", 42).emit("bipush", ord("x")).emit("iconst_1").emit("aconst_null")
+        .emit("invokedynamic", concat, 0, 0)
+        .emit("invokevirtual", println_string)
+        # StringBuilder b = new StringBuilder("a"); for (int i = 0; i < 3; i++) b.append(i).append(',');
+        .emit("new", constant_pool.class_info(BUILDER)).emit("dup").emit("ldc", constant_pool.string("a"))
+        .emit("invokespecial", constant_pool.methodref(BUILDER, "<init>", "(Ljava/lang/String;)V")).emit("astore_1")
+        .emit("iconst_0").emit("istore_2")
+        .place(loop).emit("iload_2").emit("iconst_3").emit("if_icmpge", done)
+        .emit("aload_1").emit("iload_2").emit("invokevirtual", constant_pool.methodref(*APPEND_INT))
+        .emit("bipush", ord(",")).emit("invokevirtual", constant_pool.methodref(*APPEND_CHAR)).emit("pop")
+        .emit("iinc", 2, 1).emit("goto", loop)
+        .place(done)
+        .emit("getstatic", out).emit("aload_1")
+        .emit("invokevirtual", constant_pool.methodref(BUILDER, "toString", "()Ljava/lang/String;"))
+        .emit("invokevirtual", println_string)
+        .emit("getstatic", out).emit("aload_1")
+        .emit("invokevirtual", constant_pool.methodref(BUILDER, "length", "()I"))
+        .emit("invokevirtual", println_int)
+        # System.out.println("hello" == Greeter.greeting() ? 1 : 0);
+        .emit("getstatic", out)
+        .emit("ldc", constant_pool.string("hello"))
+        .emit("invokestatic", constant_pool.methodref("Greeter", "greeting", "()Ljava/lang/String;"))
+        .emit("if_acmpne", different).emit("iconst_1").emit("goto", compared)
+        .place(different).emit("iconst_0")
+        .place(compared).emit("invokevirtual", println_int)
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=6, max_locals=3)
+    return writer.to_bytes()
+
+
+@pytest.fixture
+def classpath(tmp_path):
+    (tmp_path / "Greeter.class").write_bytes(greeter_class())
+    (tmp_path / "Texts.class").write_bytes(main_class())
+    return tmp_path
+
+
+@pytest.mark.parametrize("engine, jit_threshold", ENGINES)
+def test_strings(classpath, engine, jit_threshold):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, jit_threshold=jit_threshold, output=output, loader=ClassLoader([classpath]))
+    vm.execute_class("Texts")
+    assert output.lines == ["i=42 c=x z=true s=null", "a0,1,2,", "7", "1"]
+    if jit_threshold == 1:
+        assert all(vm.jit.methods[entry].native for name in ["Texts", "Greeter"] for entry in vm.loader.load(name).method_table)
+
+
+@pytest.mark.parametrize("parse", [parse_class_file, parse_class_buffer, parse_class_lazily])
+def test_interned_constants(parse):
+    writer = ClassWriter("Constants")
+    index = writer.constant_pool.string("constant")
+    first, second = parse(writer.to_bytes()), parse(writer.to_bytes())
+    link(first)
+    link(second)
+    value = first.constant_pool.resolved[index]
+    assert value == "constant"
+    # The constants of both classes are the interned string rather than equal copies
+    assert second.constant_pool.resolved[index] is value is sys.intern("".join(["con", "stant"]))
+
+
+def test_concat_with_constants():
+    concat = make_concat_with_constants(("I", "Ljava/lang/Object;"), ["x=\1, \2 {'\"}\1", 7])
+    assert concat(5, None) == "x=5, 7 {'\"}null"
+    assert concat(-1, StringBuilder()) == "x=-1, 7 {'\"}"
+
+
+def test_concat():
+    assert make_concat(("J", "C", "Z"), [])(3, ord("A"), 0) == "3Afalse"
+
+
+def test_string_builder():
+    builder = StringBuilder()
+    builder.append("ab").append(None).append_char(ord("c")).append_boolean(1).append(-7)
+    assert builder.to_string() == "abnullctrue-7"
+    # The parts are joined once
+    assert builder.parts == ["abnullctrue-7"]
+    assert builder.length() == 13
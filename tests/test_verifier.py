@@ -0,0 +1,297 @@
+from pathlib import Path
+
+import pytest
+
+from toyjava.arithmetic import INT_MAX, INT_MIN
+from toyjava.bench import fib_class
+from toyjava.classwriter import ACC_PUBLIC, Assembler, ClassWriter, Label
+from toyjava.instructions import IaddLocalConst, IaddLocals, Iload1, Imul, Ireturn, Isub, IsubLocals, Ldc, Push
+from toyjava.jvm import parse_class_file, VirtualMachine
+from toyjava.loader import ClassLoader
+from toyjava.output import CapturedOutput
+from toyjava.verifier import StackMapFrame, UnsupportedInstruction, VerifyError, infer_frames, verify
+
+OUT = ("java/lang/System", "out", "Ljava/io/PrintStream;")
+PRINTLN = ("java/io/PrintStream", "println", "(I)V")
+
+
+def method_class(descriptor: str, code, max_stack: int = 4, max_locals: int = 4, **kwargs) -> bytes:
+    """
+    A class with the single method m, whose code is an Assembler or bytes
+    """
+
+    writer = ClassWriter("Verified")
+    if isinstance(code, Assembler):
+        code = code.to_bytes()
+    writer.add_method("m", descriptor, code, max_stack=max_stack, max_locals=max_locals, **kwargs)
+    return writer.to_bytes()
+
+
+def frames_of(class_file: bytes, name: str = "m") -> list:
+    cls = parse_class_file(class_file)
+    return infer_frames(cls.method_table.lookup(name))
+
+
+def test_frames():
+    # static long m(int a, Object b) { long c = a; return c; } with an instance method's receiver in local 0
+    code = Assembler().emit("iload_1").emit("i2l").emit("lstore_3").emit("lload_3").emit("lreturn")
+    frames = frames_of(method_class("(ILjava/lang/Object;)J", code, max_locals=5, access_flags=ACC_PUBLIC))
+    assert frames == [
+        StackMapFrame((), ("L", "I", "L", "T", "T")),
+        StackMapFrame(("I",), ("L", "I", "L", "T", "T")),
+        StackMapFrame(("J",), ("L", "I", "L", "T", "T")),
+        StackMapFrame((), ("L", "I", "L", "J", "T")),
+        StackMapFrame(("J",), ("L", "I", "L", "J", "T")),
+    ]
+
+
+def test_merge():
+    # A local variable holding an int on one path and a reference on the other cannot be loaded after they join
+    other, join = Label(), Label()
+    code = (
+        Assembler()
+        .emit("iload_0").emit("ifeq", other)
+        .emit("iconst_1").emit("istore_1").emit("goto", join)
+        .place(other).emit("aconst_null").emit("astore_1")
+        .place(join).emit("return")
+    )
+    frames = frames_of(method_class("(I)V", code, max_locals=2))
+    assert frames[-1] == StackMapFrame((), ("I", "T"))
+
+
+def test_unreachable():
+    code = Assembler().emit("return").emit("iconst_0").emit("pop").emit("return")
+    assert frames_of(method_class("()V", code))[1:] == [None, None, None]
+
+
+def test_int_only():
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    verify(cls)
+    assert {entry.name: entry.int_only for entry in cls.method_table} == {
+        "<init>": False, "main": False, "factorial": True,
+    }
+
+
+def test_data_classes():
+    for path in Path("data").glob("*.class"):
+        verify(parse_class_file(path.read_bytes()))
+
+
+INVALID = {
+    "underflow": ("()I", Assembler().emit("iadd").emit("ireturn")),
+    "wrong type": ("()I", Assembler().emit("aconst_null").emit("iconst_1").emit("iadd").emit("ireturn")),
+    "wrong return": ("()I", Assembler().emit("aconst_null").emit("areturn")),
+    "return a value": ("()V", Assembler().emit("iconst_0").emit("ireturn")),
+    "long local": ("(J)I", Assembler().emit("iload_0").emit("ireturn")),
+    "second half": ("(J)J", Assembler().emit("lload_1").emit("lreturn")),
+    "unset local": ("()I", Assembler().emit("iload_1").emit("ireturn")),
+    "max_locals": ("()V", Assembler().emit("iconst_0").emit("istore", 9).emit("return")),
+    "max_stack": ("()V", Assembler().emit("lconst_0").emit("lconst_0").emit("lconst_0").emit("return")),
+    "pop long": ("()V", Assembler().emit("lconst_0").emit("pop").emit("return")),
+    "past the end": ("()V", Assembler().emit("iconst_0").emit("pop")),
+    "ldc": ("()V", Assembler().emit("ldc", 1).emit("pop").emit("return")),
+    # goto into the middle of sipush
+    "branch target": ("()V", bytes([0x11, 0, 0, 0xA7, 0xFF, 0xFE, 0xB1])),
+    "truncated": ("()V", bytes([0x11, 0])),
+    "unknown opcode": ("()V", bytes([0xCB, 0xB1])),
+    "no code": ("()V", b""),
+}
+
+
+def _inconsistent() -> Assembler:
+    # Pushes an int on one path only
+    skip = Label()
+    return Assembler().emit("iload_0").emit("ifeq", skip).emit("iconst_1").place(skip).emit("return")
+
+
+INVALID["inconsistent stack"] = ("(I)V", _inconsistent())
+
+
+@pytest.mark.parametrize("name", INVALID)
+def test_invalid(name):
+    descriptor, code = INVALID[name]
+    with pytest.raises(VerifyError):
+        verify(parse_class_file(method_class(descriptor, code, max_stack=4, max_locals=2)))
+
+
+@pytest.mark.parametrize("code", [
+    Assembler().emit("nop").emit("return"),
+    Assembler().emit("fconst_0").emit("pop").emit("return"),
+], ids=["nop", "float"])
+def test_unsupported(code, caplog):
+    # Unverified with a warning, but not rejected unless asked to
+    cls = parse_class_file(method_class("()V", code))
+    verify(cls)
+    entry = cls.method_table.lookup("m")
+    assert not entry.verified and not entry.int_only
+    assert "Run a method unverified: Verified.m()V at 0" in caplog.text
+    with pytest.raises(UnsupportedInstruction, match="is not supported"):
+        verify(cls, reject_unsupported=True)
+
+
+def partial_class() -> bytes:
+    """
+    main prints 1 and skips its call to a method with a cast, which no engine runs
+    """
+
+    writer = ClassWriter("Partial")
+    constant_pool = writer.constant_pool
+    unsupported = Assembler().emit("aload_0").emit("checkcast", constant_pool.class_info("java/lang/String")).emit("pop")
+    writer.add_method("unsupported", "(Ljava/lang/Object;)V", unsupported.emit("return").to_bytes(), max_locals=1)
+    skip = Label()
+    main = (
+        Assembler()
+        .emit("iconst_0").emit("ifeq", skip)
+        .emit("aload_0").emit("invokestatic", constant_pool.methodref("Partial", "unsupported", "(Ljava/lang/Object;)V"))
+        .place(skip).emit("getstatic", constant_pool.fieldref(*OUT)).emit("iconst_1")
+        .emit("invokevirtual", constant_pool.methodref(*PRINTLN)).emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("reject_unsupported", [False, True])
+def test_unsupported_at_load(reject_unsupported):
+    cls = parse_class_file(partial_class())
+    output = CapturedOutput()
+    vm = VirtualMachine(output=output, loader=ClassLoader(reject_unsupported=reject_unsupported))
+    if reject_unsupported:
+        with pytest.raises(UnsupportedInstruction, match=r"Partial.unsupported.* at 1: checkcast"):
+            vm.execute_main(cls)
+        assert output.lines == []
+    else:
+        vm.execute_main(cls)
+        assert output.lines == ["1"]
+        assert cls.main_method().verified and not cls.method_table.lookup("unsupported").verified
+
+
+def rejected_class() -> bytes:
+    # Prints 1 and then adds an int to null
+    writer = ClassWriter("Rejected")
+    constant_pool = writer.constant_pool
+    code = (
+        Assembler()
+        .emit("getstatic", constant_pool.fieldref(*OUT)).emit("iconst_1")
+        .emit("invokevirtual", constant_pool.methodref(*PRINTLN))
+        .emit("aconst_null").emit("iconst_1").emit("iadd").emit("pop")
+        .emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", code.to_bytes(), max_stack=2, max_locals=1)
+    return writer.to_bytes()
+
+
+@pytest.mark.parametrize("engine", ["dispatch", "loop", "closure", "compact", "jit"])
+def test_rejected_before_running(engine):
+    output = CapturedOutput()
+    vm = VirtualMachine(engine, output=output)
+    with pytest.raises(VerifyError, match=r"Rejected.main.* at 5 \(iadd\)"):
+        vm.execute_main(parse_class_file(rejected_class()))
+    assert output.lines == []
+    # A rejected class is not defined
+    assert "Rejected" not in vm.loader.classes
+
+
+def test_rejected_at_load():
+    # main prints 7 and then calls a method that pops from an empty stack
+    writer = ClassWriter("T")
+    constant_pool = writer.constant_pool
+    writer.add_method("bad", "()I", Assembler().emit("iadd").emit("ireturn").to_bytes())
+    main = (
+        Assembler()
+        .emit("getstatic", constant_pool.fieldref(*OUT)).emit("bipush", 7)
+        .emit("invokevirtual", constant_pool.methodref(*PRINTLN))
+        .emit("invokestatic", constant_pool.methodref("T", "bad", "()I")).emit("pop").emit("return")
+    )
+    writer.add_method("main", "([Ljava/lang/String;)V", main.to_bytes(), max_stack=2, max_locals=1)
+    output = CapturedOutput()
+    with pytest.raises(VerifyError, match=r"T.bad\(\)I at 0 \(iadd\): Pop from an empty stack"):
+        VirtualMachine(output=output).execute_main(parse_class_file(writer.to_bytes()))
+    assert output.lines == []
+
+
+def test_verified_at_load():
+    cls = parse_class_file(Path("data/Factorial.class").read_bytes())
+    ClassLoader().define(cls)
+    # Decoded once by the verifier and kept for the engines
+    assert all(entry.verified and entry._instructions is not None for entry in cls.method_table)
+
+
+def test_not_verified():
+    # Without verification the same class runs until it fails halfway
+    output = CapturedOutput()
+    vm = VirtualMachine(output=output, loader=ClassLoader(verify=False), optimize=False)
+    with pytest.raises(TypeError):
+        vm.execute_main(parse_class_file(rejected_class()))
+    assert output.lines == ["1"]
+
+
+def arithmetic_class() -> bytes:
+    """
+    Print int-only methods of two arguments that overflow for INT_MAX and INT_MIN
+    """
+
+    writer = ClassWriter("Overflow")
+    constant_pool = writer.constant_pool
+    out = constant_pool.fieldref(*OUT)
+    println = constant_pool.methodref(*PRINTLN)
+    methods = {
+        "add": Assembler().emit("iload_0").emit("iload_1").emit("iadd"),
+        "subtract": Assembler().emit("iload_0").emit("iload_1").emit("isub"),
+        "multiply": Assembler().emit("iload_0").emit("iload_1").emit("imul"),
+        "increment": Assembler().emit("iload_0").emit("ldc", constant_pool.integer(100_000)).emit("iadd"),
+        "decrement": Assembler().emit("iload_0").emit("iconst_1").emit("isub"),
+        # (a + 1) * 3 - b on the stack
+        "stack": Assembler().emit("iload_0").emit("iconst_1").emit("iadd").emit("iconst_3").emit("imul")
+        .emit("iload_1").emit("isub"),
+    }
+    main = Assembler()
+    for name, code in methods.items():
+        writer.add_method(name, "(II)I", code.emit("ireturn").to_bytes(), max_stack=2, max_locals=2)
+        for a, b in [(INT_MAX, 2), (INT_MIN, INT_MAX)]:
+            main.emit("getstatic", out)
+            main.emit("ldc", constant_pool.integer(a)).emit("ldc", constant_pool.integer(b))
+            main.emit("invokestatic", constant_pool.methodref("Overflow", name, "(II)I"))
+            main.emit("invokevirtual", println)
+    writer.add_method("main", "([Ljava/lang/String;)V", main.emit("return").to_bytes(), max_stack=3, max_locals=1)
+    return writer.to_bytes()
+
+
+def test_specialized():
+    cls = parse_class_file(arithmetic_class())
+    verify(cls)
+    optimized = {entry.name: entry.optimized for entry in cls.method_table}
+    assert optimized["add"] == (IaddLocals(0, 1), Ireturn())
+    assert optimized["subtract"] == (IsubLocals(0, 1), Ireturn())
+    # The int constant is pushed rather than loaded, so it is fused
+    assert optimized["increment"] == (IaddLocalConst(0, 100_000), Ireturn())
+    assert optimized["decrement"] == (IaddLocalConst(0, -1), Ireturn())
+    assert optimized["stack"] == (IaddLocalConst(0, 1), Push(3), Imul(), Iload1(), Isub(), Ireturn())
+    # main pushes a PrintStream, so it keeps the generic instructions
+    main = cls.main_method()
+    assert not main.int_only and any(isinstance(instruction, Ldc) for instruction in main.optimized)
+
+
+def _wrap(value: int) -> int:
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_specialized_output(optimize):
+    output = CapturedOutput()
+    VirtualMachine(output=output, optimize=optimize, memoize=False).execute_main(parse_class_file(arithmetic_class()))
+    functions = [
+        lambda a, b: a + b, lambda a, b: a - b, lambda a, b: a * b, lambda a, b: a + 100_000, lambda a, b: a - 1,
+        lambda a, b: (a + 1) * 3 - b,
+    ]
+    assert output.lines == [
+        str(_wrap(function(a, b))) for function in functions for a, b in [(INT_MAX, 2), (INT_MIN, INT_MAX)]
+    ]
+
+
+def test_fib():
+    output = CapturedOutput()
+    vm = VirtualMachine(output=output, memoize=False)
+    cls = parse_class_file(fib_class(15))
+    vm.execute_main(cls)
+    assert output.lines == ["610"]
+    assert cls.method_table["fib", "(I)I"].int_only